@@ -0,0 +1,280 @@
+"""
+Compile-latency benchmark for the PDF pipeline (server/services/pdf_service.py).
+
+Compiles a fixed corpus of representative documents and reports, per document:
+cold and warm p50/p95 latency, pdflatex pass counts, peak RSS of pdflatex and PDF size.
+Results are written as JSON so runs can be compared with --compare.
+
+Run from the project root:
+    python experiments/02_pdf_compile_benchmark/benchmark.py --runs 5
+    python experiments/02_pdf_compile_benchmark/benchmark.py --compare experiments/02_pdf_compile_benchmark/results/<old>.json
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(PROJECT_ROOT))
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("pdf_benchmark")
+
+
+# --- Corpus ---
+
+PROBLEM_TEXTS = [
+    r"Neka su $a, b, c$ pozitivni realni brojevi takvi da je $abc = 1$. Dokazati da je $\frac{a}{b+c} + \frac{b}{c+a} + \frac{c}{a+b} \geq \frac{3}{2}$.",
+    r"Odrediti sve funkcije $f : \mathbb{R} \to \mathbb{R}$ takve da je $f(x + f(y)) = f(x) + y$ za sve $x, y \in \mathbb{R}$.",
+    r"Koliko ima prirodnih brojeva $n \leq 1000$ za koje je $n^2 + 1$ djeljivo sa $5$?",
+    r"Dokazati da za svaki prirodan broj $n$ vrijedi \[ \sum_{k=1}^{n} \binom{n}{k} k = n 2^{n-1}. \]",
+]
+
+TIKZ_FIGURE = r"""\begin{tikzpicture}[scale=1.2]
+  \coordinate (A) at (0,0); \coordinate (B) at (4,0); \coordinate (C) at (1.3,%(height)s);
+  \draw[thick] (A) -- (B) -- (C) -- cycle;
+  \draw (A) node[below left] {$A$} (B) node[below right] {$B$} (C) node[above] {$C$};
+  \draw[dashed] (C) -- ($(A)!(C)!(B)$) node[below] {$D$};
+  \draw (2,1) circle (%(radius)s);
+  \foreach \i in {1,...,12} { \fill ({2+0.9*cos(30*\i)},{1+0.9*sin(30*\i)}) circle (0.03); }
+\end{tikzpicture}"""
+
+
+def _fake_problemset(title: str, problem_count: int):
+    """Builds the attribute structure _generate_problemset_latex expects, without a database."""
+    problems = [
+        SimpleNamespace(
+            position=index + 1,
+            problem=SimpleNamespace(latex_text=PROBLEM_TEXTS[index % len(PROBLEM_TEXTS)], category="ANCG"[index % 4]),
+        )
+        for index in range(problem_count)
+    ]
+    return SimpleNamespace(id=0, title=title, type="predavanje", part_of="ljetni kamp", group_name="napredna", problems=problems)
+
+
+def _tikz_document(figure_count: int) -> str:
+    figures = "\n\n".join(
+        f"\\begin{{problem}}\nU trouglu $ABC$ vrijedi \\dots\n\n"
+        + TIKZ_FIGURE % {"height": 2 + (index % 5) * 0.3, "radius": 0.5 + (index % 3) * 0.2}
+        + "\n\\end{problem}"
+        for index in range(figure_count)
+    )
+    return (
+        "\\documentclass[11pt,a4paper]{article}\n"
+        "\\usepackage{amsmath, amssymb, amsthm}\n"
+        "\\usepackage{tikz}\n"
+        "\\usetikzlibrary{calc}\n"
+        "\\theoremstyle{definition}\n\\newtheorem{problem}{Zadatak}\n"
+        "\\begin{document}\n"
+        f"{figures}\n"
+        "\\end{document}\n"
+    )
+
+
+def build_corpus() -> dict:
+    from server.services.pdf_service import _generate_problemset_latex
+
+    template_path = PROJECT_ROOT / "frontend" / "public" / "latex_template.tex"
+    return {
+        "generated_problemset": _generate_problemset_latex(_fake_problemset("Algebra 1", 12)),
+        "editor_template": template_path.read_text(encoding="utf-8"),
+        "tikz_heavy": _tikz_document(24),
+        "long_booklet": _generate_problemset_latex(_fake_problemset("Ljetni kamp - zbirka", 400)),
+    }
+
+
+# --- Measurement ---
+
+def percentile(values, fraction):
+    """Nearest-rank percentile; good enough for the handful of runs a benchmark does."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _summary(samples):
+    return {
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+        "min_ms": round(min(samples) * 1000, 2),
+        "runs": len(samples),
+    }
+
+
+def _benchmark_document(name: str, latex: str, runs: int, work_root: str, queue) -> None:
+    """
+    Runs in its own process so RUSAGE_CHILDREN only covers this document's pdflatex runs.
+    cold: fresh directory and empty figure cache every run (first compile after a deploy).
+    warm: same directory with .aux reuse and a warm figure cache (live editor session).
+    cached: served from the content-addressed PDF cache.
+    """
+    from server.config import settings
+    from server.services import figure_cache, pdf_cache, pdf_service
+
+    settings.LATEX_WORK_DIR = work_root
+    pdflatex_runs = []
+    real_run_sandboxed = pdf_service.run_sandboxed
+    def counting_run_sandboxed(cmd, *args, **kwargs):
+        pdflatex_runs.append(cmd[-1])
+        return real_run_sandboxed(cmd, *args, **kwargs)
+    pdf_service.run_sandboxed = counting_run_sandboxed
+
+    def compile_in(directory: Path, **kwargs):
+        start_passes = len(pdflatex_runs)
+        started = time.perf_counter()
+        pdf_path = pdf_service.run_pdflatex_passes(latex, directory, **kwargs)
+        return time.perf_counter() - started, len(pdflatex_runs) - start_passes, pdf_path
+
+    result = {"name": name, "source_bytes": len(latex.encode("utf-8"))}
+    try:
+        cold, cold_passes = [], []
+        for run in range(runs):
+            figure_cache._cached_figure_externalizer = None
+            shutil.rmtree(Path(work_root) / "figure_cache", ignore_errors=True)
+            with tempfile.TemporaryDirectory(dir=work_root) as directory:
+                elapsed, passes, pdf_path = compile_in(Path(directory))
+                result["pdf_bytes"] = pdf_path.stat().st_size
+            cold.append(elapsed)
+            cold_passes.append(passes)
+
+        warm, warm_passes = [], []
+        session_dir = Path(tempfile.mkdtemp(dir=work_root))
+        compile_in(session_dir, reuse_aux=True) # Prime .aux and figure cache
+        for run in range(runs):
+            elapsed, passes, _ = compile_in(session_dir, reuse_aux=True)
+            warm.append(elapsed)
+            warm_passes.append(passes)
+
+        pdf_cache._cached_pdf_cache = None
+        pdf_service.compile_latex_to_cached_pdf(latex)
+        cached = []
+        for run in range(runs):
+            started = time.perf_counter()
+            pdf_service.compile_latex_to_cached_pdf(latex)
+            cached.append(time.perf_counter() - started)
+
+        result.update({
+            "cold": {**_summary(cold), "pdflatex_runs": max(cold_passes)},
+            "warm": {**_summary(warm), "pdflatex_runs": max(warm_passes)},
+            "cached": _summary(cached),
+            # ru_maxrss is in KiB on Linux and bytes on macOS
+            "peak_rss_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    queue.put(result)
+
+
+def _tool_version(command):
+    try:
+        output = subprocess.run([command, "--version"], capture_output=True, text=True, timeout=10).stdout
+        return output.splitlines()[0] if output else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmark(runs: int, only=None) -> dict:
+    from server.config import settings
+
+    corpus = build_corpus()
+    documents = []
+    context = multiprocessing.get_context("fork")
+    with tempfile.TemporaryDirectory(prefix="pdf_benchmark_") as work_root:
+        for name, latex in corpus.items():
+            if only and name not in only:
+                continue
+            print(f"Benchmarking {name} ({runs} runs)...", flush=True)
+            queue = context.Queue()
+            worker = context.Process(target=_benchmark_document, args=(name, latex, runs, work_root, queue))
+            worker.start()
+            documents.append(queue.get())
+            worker.join()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pdflatex": _tool_version("pdflatex"),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "externalize_figures": settings.LATEX_EXTERNALIZE_FIGURES,
+            "cpu_limit_seconds": settings.LATEX_CPU_LIMIT_SECONDS,
+            "memory_limit_mb": settings.LATEX_MEMORY_LIMIT_MB,
+        },
+        "runs": runs,
+        "documents": documents,
+    }
+
+
+def print_report(results: dict, baseline: dict = None) -> None:
+    baseline_docs = {d["name"]: d for d in (baseline or {}).get("documents", [])}
+    header = f"{'document':<22}{'cold p50':>10}{'cold p95':>10}{'warm p50':>10}{'warm p95':>10}{'runs c/w':>10}{'rss MiB':>9}{'pdf KiB':>9}"
+    print(header)
+    print("-" * len(header))
+    for doc in results["documents"]:
+        if "error" in doc:
+            print(f"{doc['name']:<22}ERROR {doc['error']}")
+            continue
+        print(
+            f"{doc['name']:<22}{doc['cold']['p50_ms']:>10.0f}{doc['cold']['p95_ms']:>10.0f}"
+            f"{doc['warm']['p50_ms']:>10.0f}{doc['warm']['p95_ms']:>10.0f}"
+            f"{doc['cold']['pdflatex_runs']:>6}/{doc['warm']['pdflatex_runs']:<3}"
+            f"{doc['peak_rss_kib'] / 1024:>9.1f}{doc['pdf_bytes'] / 1024:>9.1f}"
+        )
+        old = baseline_docs.get(doc["name"])
+        if old and "error" not in old:
+            deltas = [
+                f"{label} {100 * (doc[phase]['p50_ms'] - old[phase]['p50_ms']) / old[phase]['p50_ms']:+.1f}%"
+                for label, phase in (("cold p50", "cold"), ("warm p50", "warm"))
+                if old[phase]["p50_ms"]
+            ]
+            print(f"{'':<22}vs baseline: {', '.join(deltas)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LaTeX->PDF compile latency.")
+    parser.add_argument("--runs", type=int, default=5, help="Measured runs per phase and document.")
+    parser.add_argument("--documents", nargs="*", help="Only benchmark these corpus documents.")
+    parser.add_argument("--output", type=Path, help="Where to write the JSON results (default: results/<timestamp>.json).")
+    parser.add_argument("--compare", type=Path, help="Earlier results JSON to compare against.")
+    args = parser.parse_args()
+
+    if not shutil.which("pdflatex"):
+        sys.exit("pdflatex not found in PATH.")
+
+    results = run_benchmark(args.runs, only=args.documents)
+    output = args.output or RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    baseline = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+    print_report(results, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -191,6 +191,8 @@ function usePdfCompiler(editorRef) {
   const [pdfUrl, setPdfUrl] = useState(null);
   const [isLoading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  // Stable per-editor id so the server reuses aux files and drops stale compiles
+  const sessionIdRef = useRef(crypto.randomUUID());
 
   const compile = useCallback(async () => {
     const editor = editorRef.current;
@@ -208,14 +210,16 @@ function usePdfCompiler(editorRef) {
         {
           method: 'POST',
           headers: { 'Content-Type': 'application/json', Accept: 'application/pdf' },
-          body: JSON.stringify({ latex_code: code }),
+          body: JSON.stringify({ latex_code: code, session_id: sessionIdRef.current }),
         }
       );
+      // A newer compile from this editor replaced this one; its result will arrive instead
+      if (res.status === 409) return;
       if (!res.ok) {
         let errorMsg = `HTTP ${res.status}`;
         try {
           const errorData = await res.json();
-          if (errorData && errorData.detail) errorMsg = errorData.detail;
+          if (errorData && errorData.detail) errorMsg = errorData.detail.message || errorData.detail;
           else if (typeof errorData === 'string') errorMsg = errorData;
         } catch (e) { /* Ignore if parsing error body fails */ }
         throw new Error(errorMsg);
@@ -403,7 +407,7 @@ function EditorPanel({ code, onChange, editorRef, monacoRef, onImageProcessing,
 
       if (!finalizeResponse.ok) {
         const errorData = await finalizeResponse.json();
-        throw new Error(errorData.detail || 'Greška pri finaliziranju problemset-a');
+        throw new Error(errorData.detail?.message || errorData.detail || 'Greška pri finaliziranju problemset-a');
       }
 
       setSaveStatus({ success: true, message: 'Problemset uspješno finaliziran' });
@@ -45,6 +45,7 @@ export default function Pocetna() {
   const [activeTagId, setActiveTagId] = useState(null);
   const [drawerOpen, setDrawerOpen] = useState(false);
   const isMobile = useMediaQuery('(max-width:900px)');
+  const [thumbnailVersions, setThumbnailVersions] = useState({});
 
   const handleDrawerOpen = () => setDrawerOpen(true);
   const handleDrawerClose = () => setDrawerOpen(false);
@@ -141,6 +142,29 @@ useEffect(() => {
     });
 }, []);
 
+// Thumbnails exist only for already compiled PDFs; missing ones are built in the
+// background, so ask once more a little later
+useEffect(() => {
+  if (projects.length === 0) return;
+  const ids = projects.map((project) => project.id);
+  let retry;
+  const fetchVersions = (retryMissing) =>
+    axios
+      .get("http://localhost:8000/problemsets/thumbnails/versions", {
+        params: { ids },
+        paramsSerializer: { indexes: null },
+      })
+      .then((res) => {
+        setThumbnailVersions(res.data);
+        if (retryMissing && Object.values(res.data).some((version) => version === null)) {
+          retry = setTimeout(() => fetchVersions(false), 15000);
+        }
+      })
+      .catch((err) => console.error("Greška prilikom dohvatanja sličica:", err));
+  fetchVersions(true);
+  return () => clearTimeout(retry);
+}, [projects]);
+
   const filtriraniProjekti = projects.filter((project) =>
   project.title.toLowerCase().includes(searchTerm.toLowerCase())
 );
@@ -406,7 +430,19 @@ const copyToClipboard = (text, id) => {
               <tbody>
                 {filtriraniProjekti.map((project, index) => (
                   <tr key={index}>
-                    <td>{project.title}</td>
+                    <td>
+                      {thumbnailVersions[project.id] && (
+                      <img
+                        src={`http://localhost:8000/problemsets/${project.id}/thumbnail?v=${encodeURIComponent(thumbnailVersions[project.id])}`}
+                        alt=""
+                        loading="lazy"
+                        width={48}
+                        style={{ verticalAlign: 'middle', marginRight: '8px', border: '1px solid #ddd' }}
+                        onError={(e) => { e.currentTarget.style.display = 'none'; }}
+                      />
+                      )}
+                      {project.title}
+                    </td>
                     <td>{project.group_name || "Nepoznato"}</td>
                     <td className="action-buttons">
                       <FileText
@@ -1,5 +1,6 @@
 # server/config.py
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Construct the path to the .env file in the parent directory (SKOLA-MATEMATIKE)
@@ -14,6 +15,101 @@ class Settings:
     GEMINI_FLASH_2_5="gemini-2.5-flash-preview-05-20"
     GEMINI_PRO_2_5="gemini-2.5-pro-preview-05-06"
 
+    # LLM backend: "gemini" (the real API) or "stub" (deterministic, offline; for load tests)
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "gemini").lower()
+    LLM_STUB_TTFT_SECONDS: float = float(os.getenv("LLM_STUB_TTFT_SECONDS", "0.3"))
+    LLM_STUB_TOKENS_PER_SECOND: float = float(os.getenv("LLM_STUB_TOKENS_PER_SECOND", "80"))
+    LLM_STUB_FAILURE_RATE: float = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+    LLM_STUB_SEED: int = int(os.getenv("LLM_STUB_SEED", "0"))
+
+    # Timeout for a single Gemini HTTP request (the whole stream for streaming calls)
+    GEMINI_HTTP_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_HTTP_TIMEOUT_SECONDS", "120"))
+
+    # Identical concurrent Gemini requests share one upstream stream
+    LLM_COALESCE_REQUESTS: bool = os.getenv("LLM_COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+
+    # Max concurrent model calls while fixing one whole document
+    LLM_BATCH_CONCURRENCY: int = int(os.getenv("LLM_BATCH_CONCURRENCY", "6"))
+
+    # Streamed LLM responses end after this long (0 = no deadline); the client is checked for a disconnect this often
+    LLM_REQUEST_DEADLINE_SECONDS: float = float(os.getenv("LLM_REQUEST_DEADLINE_SECONDS", "300"))
+    LLM_DISCONNECT_POLL_SECONDS: float = float(os.getenv("LLM_DISCONNECT_POLL_SECONDS", "0.5"))
+
+    # Latency percentiles in /llm/metrics are computed over this many recent calls per action and model
+    LLM_TELEMETRY_SAMPLES: int = int(os.getenv("LLM_TELEMETRY_SAMPLES", "1000"))
+
+    # System prompts and few-shot examples are sent as Gemini cached content once they reach the
+    # provider's minimum size; caches live this long and are extended when used near their expiry
+    LLM_PROMPT_CACHE_ENABLED: bool = os.getenv("LLM_PROMPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    LLM_PROMPT_CACHE_TTL_SECONDS: float = float(os.getenv("LLM_PROMPT_CACHE_TTL_SECONDS", "3600"))
+    LLM_PROMPT_CACHE_REFRESH_SECONDS: float = float(os.getenv("LLM_PROMPT_CACHE_REFRESH_SECONDS", "300"))
+    LLM_PROMPT_CACHE_MIN_TOKENS: int = int(os.getenv("LLM_PROMPT_CACHE_MIN_TOKENS", "1024"))
+
+    # Model routing: inputs above this many tokens get the action's large-input model / thinking budget.
+    # Interactive calls with no first chunk by the action's recent ttfc percentile (clamped to the
+    # min / max delay, once there are enough samples) send a hedged duplicate request.
+    # A model is skipped for the cooldown after this many consecutive failures.
+    LLM_ROUTE_LARGE_INPUT_TOKENS: int = int(os.getenv("LLM_ROUTE_LARGE_INPUT_TOKENS", "1500"))
+    LLM_HEDGE_PERCENTILE: float = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "0.5"))
+    LLM_HEDGE_MAX_DELAY_SECONDS: float = float(os.getenv("LLM_HEDGE_MAX_DELAY_SECONDS", "8"))
+    LLM_BREAKER_FAILURES: int = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    LLM_BREAKER_COOLDOWN_SECONDS: float = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+    # Per-model Gemini quotas (requests / input tokens per minute) and retry policy
+    LLM_FLASH_RPM: int = int(os.getenv("LLM_FLASH_RPM", "1000"))
+    LLM_FLASH_TPM: int = int(os.getenv("LLM_FLASH_TPM", "1000000"))
+    LLM_PRO_RPM: int = int(os.getenv("LLM_PRO_RPM", "150"))
+    LLM_PRO_TPM: int = int(os.getenv("LLM_PRO_TPM", "2000000"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    LLM_BACKOFF_BASE_SECONDS: float = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+    LLM_BACKOFF_MAX_SECONDS: float = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "20"))
+
+    # --- AI Response Cache ---
+    AI_CACHE_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+    AI_CACHE_TTL_SECONDS: float = float(os.getenv("AI_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+    # --- Image-to-LaTeX ---
+    # Uploaded images are shrunk before they are sent to the model
+    IMAGE_MAX_SIDE: int = int(os.getenv("IMAGE_MAX_SIDE", "1536"))
+    IMAGE_JPEG_QUALITY: int = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+    # Results for identical images, matched by a digest of the preprocessed bytes
+    IMAGE_CACHE_MAX_ENTRIES: int = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "500"))
+
+    # --- Lecture PDF import ---
+    # PDFs with at least PDF_SPLIT_MIN_PAGES pages are extracted in page ranges concurrently (needs qpdf)
+    PDF_SPLIT_PAGES_PER_CHUNK: int = int(os.getenv("PDF_SPLIT_PAGES_PER_CHUNK", "8"))
+    PDF_SPLIT_MIN_PAGES: int = int(os.getenv("PDF_SPLIT_MIN_PAGES", "12"))
+
+    # --- LaTeX Compilation ---
+    # Root directory for persistent compile workspaces (editor sessions, caches)
+    LATEX_WORK_DIR: str = os.getenv("LATEX_WORK_DIR", os.path.join(tempfile.gettempdir(), "skola_matematike_latex"))
+    LATEX_SESSION_IDLE_TTL_SECONDS: int = int(os.getenv("LATEX_SESSION_IDLE_TTL_SECONDS", "900"))
+    LATEX_SESSION_DEBOUNCE_SECONDS: float = float(os.getenv("LATEX_SESSION_DEBOUNCE_SECONDS", "0.3"))
+    # Idle sessions are also swept this often while any exist, not only when a request arrives
+    LATEX_SESSION_SWEEP_SECONDS: float = float(os.getenv("LATEX_SESSION_SWEEP_SECONDS", "60"))
+    PDF_CACHE_MAX_BYTES: int = int(os.getenv("PDF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    # Opt-in: compile problemset PDFs in the background after edits
+    PDF_PREBUILD_ENABLED: bool = os.getenv("PDF_PREBUILD_ENABLED", "false").lower() in ("1", "true", "yes")
+    PDF_PREBUILD_DEBOUNCE_SECONDS: float = float(os.getenv("PDF_PREBUILD_DEBOUNCE_SECONDS", "5"))
+    # Static LaTeX checks before pdflatex and finalize; only errors block, set to false to skip them
+    LATEX_LINT_ENABLED: bool = os.getenv("LATEX_LINT_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Compile TikZ figures once into a shared cache and inline them as PDFs
+    LATEX_EXTERNALIZE_FIGURES: bool = os.getenv("LATEX_EXTERNALIZE_FIGURES", "true").lower() in ("1", "true", "yes")
+    FIGURE_CACHE_MAX_BYTES: int = int(os.getenv("FIGURE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    # First-page previews for problemset cards
+    THUMBNAIL_WIDTH: int = int(os.getenv("THUMBNAIL_WIDTH", "320"))
+    THUMBNAIL_CACHE_MAX_BYTES: int = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Per-pass limits for the pdflatex sandbox
+    LATEX_CPU_LIMIT_SECONDS: int = int(os.getenv("LATEX_CPU_LIMIT_SECONDS", "20"))
+    LATEX_MEMORY_LIMIT_MB: int = int(os.getenv("LATEX_MEMORY_LIMIT_MB", "1024"))
+    LATEX_OUTPUT_LIMIT_MB: int = int(os.getenv("LATEX_OUTPUT_LIMIT_MB", "64"))
+    LATEX_WALL_TIMEOUT_SECONDS: float = float(os.getenv("LATEX_WALL_TIMEOUT_SECONDS", "30"))
+    # Reusable one-off compile directories, RAM-backed when the directory exists
+    LATEX_SANDBOX_TMPFS_DIR: str = os.getenv("LATEX_SANDBOX_TMPFS_DIR", "/dev/shm")
+    LATEX_SANDBOX_WORKSPACES: int = int(os.getenv("LATEX_SANDBOX_WORKSPACES", str(os.cpu_count() or 2)))
+
     # --- Database Connection ---
     POSTGRES_USER: str = os.getenv("POSTGRES_USER")
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD")
@@ -41,7 +137,7 @@ class Settings:
 settings = Settings()
 
 # --- Optional Checks (can be placed after instantiation) ---
-if not settings.GEMINI_API_KEY:
+if not settings.GEMINI_API_KEY and settings.LLM_PROVIDER != "stub":
     print("Warning: GEMINI_API_KEY not found in environment variables. Check your .env file.")
 
 if not settings.SQLALCHEMY_DATABASE_URL:
@@ -2,6 +2,7 @@
 
 import logging
 from google import genai
+from google.genai import types
 from fastapi import HTTPException, status, Depends
 from sqlalchemy.orm import Session # Import Session type
 
@@ -16,13 +17,21 @@ except ImportError as e:
 try:
     from .services.gemini_service import GeminiService
     from .services.problemset_service import ProblemsetService # Import the new service
+    from .services.compile_session_service import CompileSessionManager
+    from .services.pdf_prebuild_service import PDFPrebuildScheduler
+    from .services.thumbnail_service import ThumbnailService
+    from .services.document_fix_service import DocumentFixService
+    from .services.translation_service import BatchTranslator
+    from .services.llm_scheduler import get_llm_scheduler
+    from .services.llm_providers import GeminiProvider, LLMProvider, StubProvider
+    from .services.prompt_cache import PromptPrefixManager
 except ImportError as e:
     logging.error(f"Failed to import service classes: {e}")
     raise # Critical error
 
 # Import database dependency provider (assuming server/database.py)
 try:
-    from .database import get_db # Import the database session dependency
+    from .database import get_db, SessionLocal # Import the database session dependency
 except ImportError as e:
     logging.error(f"Failed to import get_db from database.py: {e}")
     raise # Critical error
@@ -33,7 +42,13 @@ logger = logging.getLogger(__name__)
 # Module-level variables for caching service instances
 _cached_gemini_client = None
 _cached_gemini_service = None
+_cached_llm_provider = None
 _cached_lecture_service = None
+_cached_compile_session_manager = None
+_cached_pdf_prebuild_scheduler = None
+_cached_thumbnail_service = None
+_cached_document_fix_service = None
+_cached_batch_translator = None
 
 # Dependency provider for the Gemini Client (API Key version)
 def get_gemini_client():
@@ -52,7 +67,12 @@ def get_gemini_client():
                  detail="AI service is not configured correctly (API Key missing)."
              )
         try:
-            _cached_gemini_client = genai.Client(api_key=api_key)
+            # One client for the whole process: its HTTP connection pool (keep-alive)
+            # is shared by every request, sync or async (client.aio)
+            _cached_gemini_client = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(timeout=int(settings.GEMINI_HTTP_TIMEOUT_SECONDS * 1000)),
+            )
             logger.debug("Gemini Client (API Key) instantiated.")
             # Optional: Connectivity check
             # try:
@@ -73,9 +93,38 @@ def get_gemini_client():
     return _cached_gemini_client
 
 
+# Dependency provider for the LLM backend behind GeminiService
+def get_llm_provider() -> LLMProvider:
+    """
+    FastAPI dependency function to get the cached LLM provider selected by settings.LLM_PROVIDER.
+    The stub provider needs no API key or network access.
+    """
+    global _cached_llm_provider
+
+    if _cached_llm_provider is None:
+        if settings.LLM_PROVIDER == "stub":
+            logger.info("Instantiating StubProvider (LLM_PROVIDER=stub).")
+            _cached_llm_provider = StubProvider(
+                ttft_seconds=settings.LLM_STUB_TTFT_SECONDS,
+                tokens_per_second=settings.LLM_STUB_TOKENS_PER_SECOND,
+                failure_rate=settings.LLM_STUB_FAILURE_RATE,
+                seed=settings.LLM_STUB_SEED,
+            )
+        elif settings.LLM_PROVIDER == "gemini":
+            _cached_llm_provider = GeminiProvider(get_gemini_client())
+        else:
+            logger.error(f"Unknown LLM_PROVIDER '{settings.LLM_PROVIDER}'.")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"AI service is not configured correctly (unknown provider '{settings.LLM_PROVIDER}').",
+            )
+
+    return _cached_llm_provider
+
+
 # Dependency provider for the GeminiService
 def get_gemini_service(
-    client: genai.Client = Depends(get_gemini_client) # Depends on the client dependency
+    provider: LLMProvider = Depends(get_llm_provider) # Depends on the provider dependency
 ) -> GeminiService:
     """
     FastAPI dependency function to get a cached GeminiService instance.
@@ -84,7 +133,18 @@ def get_gemini_service(
 
     if _cached_gemini_service is None:
         logger.info("Instantiating new GeminiService (first request).")
-        _cached_gemini_service = GeminiService(client=client) # Instantiate the service
+        _cached_gemini_service = GeminiService( # Instantiate the service
+            provider=provider,
+            coalesce=settings.LLM_COALESCE_REQUESTS,
+            scheduler=get_llm_scheduler(),
+            prompt_cache=PromptPrefixManager(
+                provider,
+                enabled=settings.LLM_PROMPT_CACHE_ENABLED,
+                ttl_seconds=settings.LLM_PROMPT_CACHE_TTL_SECONDS,
+                refresh_margin_seconds=settings.LLM_PROMPT_CACHE_REFRESH_SECONDS,
+                min_tokens=settings.LLM_PROMPT_CACHE_MIN_TOKENS,
+            ),
+        )
     else:
         logger.debug("Using cached GeminiService.")
 
@@ -107,5 +167,89 @@ def get_lecture_service() -> ProblemsetService:
 
     return _cached_lecture_service
 
+
+# Dependency provider for the live-editor CompileSessionManager
+def get_compile_session_manager() -> CompileSessionManager:
+    """
+    FastAPI dependency function to get the process-wide CompileSessionManager.
+    Sessions must outlive single requests, so the manager is always cached.
+    """
+    global _cached_compile_session_manager
+
+    if _cached_compile_session_manager is None:
+        logger.info("Instantiating new CompileSessionManager (first request).")
+        _cached_compile_session_manager = CompileSessionManager(
+            root_dir=settings.LATEX_WORK_DIR,
+            idle_ttl_seconds=settings.LATEX_SESSION_IDLE_TTL_SECONDS,
+            debounce_seconds=settings.LATEX_SESSION_DEBOUNCE_SECONDS,
+            sweep_interval_seconds=settings.LATEX_SESSION_SWEEP_SECONDS,
+        )
+
+    return _cached_compile_session_manager
+
+
+# Dependency provider for the PDFPrebuildScheduler
+def get_pdf_prebuild_scheduler() -> PDFPrebuildScheduler:
+    """
+    FastAPI dependency function to get the cached PDFPrebuildScheduler.
+    Speculative prebuilds after edits only run when PDF_PREBUILD_ENABLED is set.
+    """
+    global _cached_pdf_prebuild_scheduler
+
+    if _cached_pdf_prebuild_scheduler is None:
+        logger.info("Instantiating new PDFPrebuildScheduler (first request).")
+        _cached_pdf_prebuild_scheduler = PDFPrebuildScheduler(
+            session_factory=SessionLocal,
+            enabled=settings.PDF_PREBUILD_ENABLED,
+            debounce_seconds=settings.PDF_PREBUILD_DEBOUNCE_SECONDS,
+        )
+
+    return _cached_pdf_prebuild_scheduler
+
+
+# Dependency provider for the ThumbnailService
+def get_thumbnail_service() -> ThumbnailService:
+    """
+    FastAPI dependency function to get the cached ThumbnailService.
+    """
+    global _cached_thumbnail_service
+
+    if _cached_thumbnail_service is None:
+        logger.info("Instantiating new ThumbnailService (first request).")
+        _cached_thumbnail_service = ThumbnailService(
+            root_dir=settings.LATEX_WORK_DIR,
+            width=settings.THUMBNAIL_WIDTH,
+            max_bytes=settings.THUMBNAIL_CACHE_MAX_BYTES,
+        )
+
+    return _cached_thumbnail_service
+
+# Dependency provider for the DocumentFixService
+def get_document_fix_service() -> DocumentFixService:
+    """
+    FastAPI dependency function to get the cached DocumentFixService.
+    Cached so the hashes of already fixed chunks survive between requests.
+    """
+    global _cached_document_fix_service
+
+    if _cached_document_fix_service is None:
+        logger.info("Instantiating new DocumentFixService (first request).")
+        _cached_document_fix_service = DocumentFixService(max_concurrency=settings.LLM_BATCH_CONCURRENCY)
+
+    return _cached_document_fix_service
+
+# Dependency provider for the BatchTranslator
+def get_batch_translator() -> BatchTranslator:
+    """
+    FastAPI dependency function to get the cached BatchTranslator.
+    """
+    global _cached_batch_translator
+
+    if _cached_batch_translator is None:
+        logger.info("Instantiating new BatchTranslator (first request).")
+        _cached_batch_translator = BatchTranslator(max_concurrency=settings.LLM_BATCH_CONCURRENCY)
+
+    return _cached_batch_translator
+
 # The get_db dependency is imported from database.py
 # Its signature is def get_db(): yield SessionLocal() ...
\ No newline at end of file
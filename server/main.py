@@ -1,21 +1,17 @@
 import os
 import logging
-# --- Use EXACT imports from your working sample ---
-from google import genai
-from google.genai import types
-# --- End of sample-specific imports ---
 
-from fastapi import FastAPI, HTTPException, status, File, UploadFile # Added File, UploadFile
+from fastapi import FastAPI, HTTPException, status, File, UploadFile, Depends # Added File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from fastapi.staticfiles import StaticFiles
-import mimetypes # Import mimetypes for guessing content type if needed (though UploadFile provides it)
+from fastapi.concurrency import run_in_threadpool
 
 from .routers import problems
 from .routers import problemsets
 from .routers import user
 from .routers import llm
+from .routers import translation
 from .routers.tag_router import router as tag_router
 
 from .routers.lecture_tag_router import router as lecture_tag_router
@@ -23,6 +19,11 @@ from .routers.lecture_tag_router import router as lecture_tag_router
 
 # Import the settings from your config file (assuming config.py loads .env)
 from .config import settings
+from .dependencies import get_gemini_service
+from .services.gemini_service import GeminiService
+from .services.ai_service import AIService
+from .services.ai_response_cache import AIResponseCache, get_ai_response_cache
+from .services.image_preprocessing import ImageResultCache, ImageTooLarge, get_image_result_cache, prepare_image
 
 # --- Basic Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -57,6 +58,7 @@ app.add_middleware(
     allow_credentials=True, # Allows cookies (if needed)
     allow_methods=["*"],    # Allows all methods (GET, POST, etc.)
     allow_headers=["*"],    # Allows all headers
+    expose_headers=["X-LaTeX-Diagnostics"], # Warnings and box stats of a successful compile
 )
 # --- End CORS Configuration ---
 
@@ -64,6 +66,7 @@ app.include_router(problems.router)
 app.include_router(problemsets.router)
 app.include_router(user.router)
 app.include_router(llm.router)
+app.include_router(translation.router)
 app.include_router(lecture_tag_router)
 app.include_router(tag_router)
 
@@ -83,26 +86,6 @@ class LatexOutput(BaseModel):
     latex_text: str
 
 
-# --- Helper Function (Optional but good practice) ---
-def get_gemini_client():
-    """Instantiates and returns the Gemini client."""
-    if not settings.GEMINI_API_KEY:
-        logger.error("Attempted to get Gemini client, but API key is missing.")
-        raise HTTPException(
-             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-             detail="API service is not configured correctly (API Key missing)."
-        )
-    try:
-        client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        logger.debug("Gemini Client instantiated.")
-        return client
-    except Exception as e:
-        logger.error(f"Failed to instantiate Gemini client: {e}", exc_info=True)
-        raise HTTPException(
-             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-             detail="Failed to initialize connection to API service."
-        )
-
 @app.get("/")
 async def root():
     """ Basic API root endpoint. """
@@ -112,84 +95,57 @@ async def root():
 @app.post(
     "/translate/latex-to-bosnian",
     response_model=TranslationOutput,
-    summary="Translate LaTeX Math Problem to Bosnian (Specific Client)",
+    summary="Translate LaTeX Math Problem to Bosnian",
     tags=["Translation"]
 )
-async def translate_latex(payload: LatexInput):
+async def translate_latex(
+    payload: LatexInput,
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    cache: AIResponseCache = Depends(get_ai_response_cache),
+):
     """
     Receives mathematical text (potentially including LaTeX) and translates
-    it to Bosnian using the specific Gemini Client structure provided,
-    attempting to preserve LaTeX formatting. Uses few-shot prompting.
+    it to Bosnian, attempting to preserve LaTeX formatting. Uses few-shot prompting
+    through the shared async Gemini client; repeated inputs come from the response cache.
 
     - **latex_text**: The text containing the math problem (required).
     """
     logger.info(f"Received translation request for text: '{payload.latex_text[:50]}...'")
-    client = get_gemini_client() # Use helper to get client
+    ai_service = AIService(gemini=gemini_service, cache=cache)
 
     try:
-        # Define Model and Configuration (EXACTLY as per your sample)
-        model_name = "gemini-2.5-flash-preview-04-17"
-        generation_config = types.GenerateContentConfig(
-            thinking_config = types.ThinkingConfig(thinking_budget=0),
-            response_mime_type="text/plain",
-        )
-        logger.debug(f"Using model: {model_name} and GenerateContentConfig for translation.")
-
-        # Construct Few-Shot Contents
-        contents = [
-            types.Content(role="user", parts=[types.Part.from_text(text="""Translate the following math problem to Bosnian. Keep Latex formatting: "Find the derivative of $f(x) = x^3 - 6x^2 + 5$. Calculate $f'(2)$." """),]),
-            types.Content(role="model", parts=[types.Part.from_text(text="""Nađite derivaciju funkcije $f(x) = x^3 - 6x^2 + 5$. Izračunajte $f'(2)$."""),]),
-            types.Content(role="user", parts=[types.Part.from_text(text=f"""Translate the following math problem to Bosnian. Keep Latex formatting: "{payload.latex_text}" """),]),
-        ]
-        logger.debug(f"Constructed contents for translation. Final user part starts with: '{payload.latex_text[:30]}...'")
-
-        # Call Gemini API (Attempting Non-Streaming Equivalent)
-        logger.info(f"Calling Gemini model '{model_name}' via Client API (attempting non-streaming)...")
-        try:
-            api_call_func = client.models.generate_content
-        except AttributeError:
-            logger.error("Failed to find 'client.models.generate_content'. Streaming collection needed but not implemented.")
-            raise HTTPException(status_code=501, detail="Server API method mismatch: Non-streaming call failed.")
-
-        response = await run_in_threadpool(
-            api_call_func, model=model_name, contents=contents, config=generation_config,
-        )
-        logger.info("Received translation response from Gemini.")
-
-        # Process Response
-        if hasattr(response, 'text') and response.text:
-            translated_text = response.text
-        elif hasattr(response, 'candidates') and response.candidates and response.candidates[0].content.parts:
-             translated_text = "".join(part.text for part in response.candidates[0].content.parts)
-             logger.debug("Accessed translation text via response.candidates[0].content.parts")
-        else:
-            logger.warning(f"Could not extract text from Gemini translation response. Response object: {response}")
-            raise HTTPException(status_code=500, detail="Translation failed: Could not parse response from translation service.")
-
-        logger.info(f"Successfully translated text to: '{translated_text[:50]}...'")
-        return TranslationOutput(original_text=payload.latex_text, translated_text=translated_text.strip())
-
+        stream = await ai_service.translate(user_input=payload.latex_text)
+        translated_text = "".join([chunk async for chunk in stream])
     except Exception as e:
         logger.error(f"An unexpected error occurred during translation: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred during the translation process.")
 
+    if not translated_text.strip():
+        logger.warning("Gemini returned an empty translation.")
+        raise HTTPException(status_code=500, detail="Translation failed: Could not parse response from translation service.")
+
+    logger.info(f"Successfully translated text to: '{translated_text[:50]}...'")
+    return TranslationOutput(original_text=payload.latex_text, translated_text=translated_text.strip())
+
 
 @app.post(
     "/image-to-latex",
     response_model=LatexOutput,
-    summary="Convert Math Problem Image to LaTeX (Specific Client)",
+    summary="Convert Math Problem Image to LaTeX",
     tags=["Conversion"] # New tag for organization
 )
-async def image_to_latex(file: UploadFile = File(..., description="Image file of the math problem")):
+async def image_to_latex(
+    file: UploadFile = File(..., description="Image file of the math problem"),
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    image_cache: ImageResultCache = Depends(get_image_result_cache),
+):
     """
-    Receives an image of a math problem, uploads it to the Gemini API,
-    and requests the LaTeX representation of the problem. Uses the
-    specific client structure provided in the sample.
+    Receives an image of a math problem and requests the LaTeX representation
+    of the problem from Gemini through the shared async client.
 
     - **file**: The image file (e.g., PNG, JPEG).
     """
     logger.info(f"Received image file upload request: {file.filename} (type: {file.content_type})")
-    client = get_gemini_client() # Use helper to get client
 
     # Basic MIME type validation
     if not file.content_type or not file.content_type.startswith("image/"):
@@ -215,190 +171,32 @@ async def image_to_latex(file: UploadFile = File(..., description="Image file of
         # Ensure the file is closed (important for temp files)
         await file.close()
 
-
+    ai_service = AIService(gemini=gemini_service, image_cache=image_cache)
     try:
-        # Define Model and Configuration (EXACTLY as per your image sample)
-        model_name = "gemini-2.5-flash-preview-04-17"
-        generation_config = types.GenerateContentConfig( # Class from your sample
-            # Note: thinking_config was NOT in the image sample, removing it here
-            response_mime_type="text/plain",
-        )
-        logger.debug(f"Using model: {model_name} and GenerateContentConfig for image-to-latex.")
-
-
-        # --- Construct Contents with Image Data and Text Prompt ---
-        # Adaption: Use inline_data instead of client.files.upload + from_uri
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    # Part 1: The image data
-                    types.Part(inline_data=types.Blob(
-                        mime_type=file.content_type,
-                        data=image_bytes
-                    )),
-                    # Part 2: The text prompt (from your sample)
-                    types.Part.from_text(text="""Give me the latex for the following math problem."""),
-                ]
-            )
-        ]
-        logger.debug("Constructed multi-part contents (image + text) for Gemini API.")
-
-
-        # --- Call Gemini API (Attempting Non-Streaming Equivalent) ---
-        logger.info(f"Calling Gemini model '{model_name}' via Client API (attempting non-streaming)...")
-        try:
-            api_call_func = client.models.generate_content
-        except AttributeError:
-            logger.error("Failed to find 'client.models.generate_content'. Streaming collection needed but not implemented.")
-            raise HTTPException(status_code=501, detail="Server API method mismatch: Non-streaming call failed.")
-
-        response = await run_in_threadpool(
-            api_call_func, model=model_name, contents=contents, config=generation_config,
+        # Decoding a large photo takes a while, keep it off the event loop
+        image = await run_in_threadpool(prepare_image, image_bytes, file.content_type)
+        stream = await ai_service.image_to_latex(
+            user_input_image=image.data,
+            user_input_image_mime_type=image.mime_type,
+            image_hash=image.hash,
         )
-        logger.info("Received image-to-latex response from Gemini.")
-
-
-        # --- Process Response ---
-        # (Same logic as translation endpoint, assuming similar response structure)
-        if hasattr(response, 'text') and response.text:
-            latex_text = response.text
-        elif hasattr(response, 'candidates') and response.candidates and response.candidates[0].content.parts:
-             latex_text = "".join(part.text for part in response.candidates[0].content.parts)
-             logger.debug("Accessed latex text via response.candidates[0].content.parts")
-        else:
-            logger.warning(f"Could not extract text from Gemini image-to-latex response. Response object: {response}")
-            raise HTTPException(status_code=500, detail="Image-to-LaTeX failed: Could not parse response from service.")
-
-        logger.info(f"Successfully generated LaTeX: '{latex_text[:50]}...'")
-        return LatexOutput(
-            filename=file.filename,
-            mime_type=file.content_type,
-            latex_text=latex_text.strip()
-            )
-
+        latex_text = "".join([chunk async for chunk in stream])
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Image is too large: {e}")
     except Exception as e:
         logger.error(f"An unexpected error occurred during image-to-latex conversion: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred during the image conversion process.")
 
-    """
-    Receives mathematical text (potentially including LaTeX) and translates
-    it to Bosnian using the specific Gemini Client structure provided,
-    attempting to preserve LaTeX formatting. Uses few-shot prompting.
+    if not latex_text.strip():
+        logger.warning("Gemini returned no LaTeX for the uploaded image.")
+        raise HTTPException(status_code=500, detail="Image-to-LaTeX failed: Could not parse response from service.")
 
-    - **latex_text**: The text containing the math problem (required).
-    """
-    logger.info(f"Received translation request for text: '{payload.latex_text[:50]}...'")
-
-    if not settings.GEMINI_API_KEY:
-         logger.error("Translation attempt failed: Gemini API key not configured.")
-         raise HTTPException(
-             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-             detail="Translation service is not configured correctly (API Key missing)."
-         )
-
-    try:
-        # --- Instantiate Client (as per your sample) ---
-        client = genai.Client(api_key=settings.GEMINI_API_KEY)
-        logger.debug("Gemini Client instantiated.")
-
-        # --- Define Model and Configuration (EXACTLY as per your sample) ---
-        model_name = "gemini-2.5-flash-preview-04-17" # Model from your sample
-        generation_config = types.GenerateContentConfig( # Class from your sample
-            thinking_config = types.ThinkingConfig( # Class from your sample
-                thinking_budget=0,
-            ),
-            response_mime_type="text/plain",
-        )
-        logger.debug(f"Using model: {model_name} and GenerateContentConfig.")
-
-        # --- Construct Few-Shot Contents (using sample's types) ---
-        # Using the same few-shot structure as before
-        contents = [
-            types.Content(
-                role="user",
-                parts=[
-                    types.Part.from_text(text="""Translate the following math problem to Bosnian. Keep Latex formatting: "Find the derivative of $f(x) = x^3 - 6x^2 + 5$. Calculate $f'(2)$." """),
-                ],
-            ),
-            types.Content(
-                role="model",
-                parts=[
-                    types.Part.from_text(text="""Nađite derivaciju funkcije $f(x) = x^3 - 6x^2 + 5$. Izračunajte $f'(2)$."""),
-                ],
-            ),
-            # Add more examples here if needed
-            types.Content(
-                role="user",
-                parts=[
-                    # Insert the actual user input
-                    types.Part.from_text(text=f"""Translate the following math problem to Bosnian. Keep Latex formatting: "{payload.latex_text}" """),
-                ],
-            ),
-        ]
-        logger.debug(f"Constructed contents for Gemini API. Final user part starts with: '{payload.latex_text[:30]}...'")
-
-        # --- Call Gemini API (Attempting Non-Streaming Equivalent) ---
-        # Based on your sample's client.models.generate_content_stream,
-        # we ASSUME client.models.generate_content exists for non-streaming.
-        # If this fails with AttributeError, we'll need to adjust.
-        logger.info(f"Calling Gemini model '{model_name}' via Client API (attempting non-streaming)...")
-        try:
-            # Assume the non-streaming method exists here
-            api_call_func = client.models.generate_content
-        except AttributeError:
-            logger.error("Failed to find 'client.models.generate_content'. Streaming collection needed but not implemented.")
-            raise HTTPException(status_code=501, detail="Server API method mismatch: Non-streaming call failed.")
-
-        response = await run_in_threadpool(
-            api_call_func,                  # The function to run
-            model=model_name,               # Arguments for the function
-            contents=contents,
-            # IMPORTANT: Use 'config=' parameter name, as seen in your sample's stream call
-            config=generation_config,
-        )
-        logger.info("Received response from Gemini.")
-        # Note: Response structure might differ between stream/non-stream and Client/GenerativeModel APIs
-        logger.debug(f"Gemini raw response object type: {type(response)}")
-        # Attempt to log common feedback attributes if they exist
-        if hasattr(response, 'prompt_feedback'):
-             logger.debug(f"Gemini response prompt feedback: {response.prompt_feedback}")
-
-        # --- Process Response ---
-        # Accessing response text might need adjustment depending on the actual object returned
-        if hasattr(response, 'text') and response.text:
-            translated_text = response.text
-        elif hasattr(response, 'candidates') and response.candidates and response.candidates[0].content.parts:
-             # Fallback attempt similar to GenerativeModel API response structure
-             translated_text = "".join(part.text for part in response.candidates[0].content.parts)
-             logger.debug("Accessed text via response.candidates[0].content.parts")
-        else:
-            # If text cannot be extracted
-            logger.warning(f"Could not extract text from Gemini response. Response object: {response}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Translation failed: Could not parse response from translation service."
-            )
-
-        logger.info(f"Successfully translated text to: '{translated_text[:50]}...'")
-        return TranslationOutput(
-            original_text=payload.latex_text,
-            translated_text=translated_text.strip()
-        )
-
-    # --- Error Handling ---
-    # Catch specific errors from the 'genai' library if known
-    # except genai.APIError as api_error: # Example - replace with actual error types if known
-    #     logger.error(f"Gemini API error: {api_error}", exc_info=True)
-    #     raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Translation service API error.")
-    except Exception as e:
-        # Log the full error details for debugging
-        logger.error(f"An unexpected error occurred during translation: {e}", exc_info=True)
-        # Return a generic error to the client
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An internal error occurred during the translation process."
-        )
+    logger.info(f"Successfully generated LaTeX: '{latex_text[:50]}...'")
+    return LatexOutput(
+        filename=file.filename,
+        mime_type=file.content_type,
+        latex_text=latex_text.strip()
+    )
 
 
 app.mount("/uploaded_images", StaticFiles(directory="uploaded_images"), name="uploaded_images")
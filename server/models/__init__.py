@@ -3,3 +3,4 @@ from .problem import Problem, CategoryEnum
 from .problemset import Problemset, ProgramTypeEnum
 from .problemset_problems import ProblemsetProblems
 from .password_reset import PasswordReset
+from .translation_memory import TranslationMemoryEntry
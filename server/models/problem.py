@@ -27,7 +27,8 @@ class Problem(Base):
 
     problemsets = relationship(
         "ProblemsetProblems",
-        back_populates="problem"
+        back_populates="problem",
+        cascade="all, delete-orphan" # Same as ON DELETE CASCADE on problemset_problems
     )
 
     def __repr__(self):
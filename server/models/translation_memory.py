@@ -0,0 +1,26 @@
+# server/models/translation_memory.py
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, Text, UniqueConstraint
+from ..database import Base
+
+class TranslationMemoryEntry(Base):
+    __tablename__ = "translation_memory"
+    __table_args__ = (
+        UniqueConstraint("source_hash", "target_language", name="translation_memory_source_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Segments are stored with their formulas replaced by numbered placeholders, see translation_service
+    source_hash = Column(String(64), nullable=False, index=True) # exact: whitespace-normalized segment
+    fuzzy_hash = Column(String(64), nullable=False, index=True) # near-exact: also case and punctuation folded
+    source_text = Column(Text, nullable=False)
+    target_text = Column(Text, nullable=False)
+    target_language = Column(String(30), nullable=False, default="bs")
+    uses = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<TranslationMemoryEntry(id={self.id}, source='{self.source_text[:30]}...')>"
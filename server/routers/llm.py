@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, Body, File, UploadFile, HTTPException, status
+from fastapi import APIRouter, Depends, Body, File, Form, UploadFile, HTTPException, Request, status
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional
+import json
 
-from ..dependencies import get_gemini_service
+from ..dependencies import get_gemini_service, get_document_fix_service
 from ..services.gemini_service import GeminiService
 from ..services.ai_service import AIService
+from ..services.ai_response_cache import AIResponseCache, get_ai_response_cache
+from ..services.llm_scheduler import BATCH, LLMScheduler, get_llm_scheduler
+from ..services.image_preprocessing import ImageResultCache, ImageTooLarge, get_image_result_cache, prepare_image
+from ..services.stream_guard import StreamGuard, get_stream_guard
+from ..services.llm_telemetry import LLMTelemetry, get_llm_telemetry
+from ..services.llm_router import ModelRouter, get_model_router
 
-from ..schemas.llm import LatexRequest, MathImageRequest
+from ..services.document_fix_service import DocumentFixService
+from ..schemas.llm import LatexRequest, MathImageRequest, DocumentFixRequest
 
 import logging
 
@@ -20,41 +29,107 @@ class HelloRequest(BaseModel):
 
 @router.post("/hello", summary="Stream a hello response from Gemini")
 async def hello_stream(
+    http_request: Request,
     request: HelloRequest = Body(...),
     gemini_service: GeminiService = Depends(get_gemini_service),
+    stream_guard: StreamGuard = Depends(get_stream_guard),
 ):
     ai_service = AIService(gemini=gemini_service)
     stream = await ai_service.hello(message=request.message)
-    return StreamingResponse(stream, media_type="application/json")
+    return StreamingResponse(stream_guard.guard(http_request, stream, "hello"), media_type="application/json")
 
 
 @router.post("/fix-latex", summary="Fix LaTeX code.")
 async def fix_latex(
+    http_request: Request,
     request: LatexRequest = Body(...),
     gemini_service: GeminiService = Depends(get_gemini_service),
+    cache: AIResponseCache = Depends(get_ai_response_cache),
+    stream_guard: StreamGuard = Depends(get_stream_guard),
 ):
-    ai_service = AIService(gemini=gemini_service)
+    ai_service = AIService(gemini=gemini_service, cache=cache)
     stream = await ai_service.fix_latex(user_input=request.code)
-    return StreamingResponse(stream)
+    return StreamingResponse(stream_guard.guard(http_request, stream, "fix-latex"))
 
 @router.post("/fix-grammar", summary="Fix grammar and improve text.")
 async def fix_grammar(
+    http_request: Request,
     request: LatexRequest = Body(...),
     gemini_service: GeminiService = Depends(get_gemini_service),
+    cache: AIResponseCache = Depends(get_ai_response_cache),
+    stream_guard: StreamGuard = Depends(get_stream_guard),
 ):
-    ai_service = AIService(gemini=gemini_service)
+    ai_service = AIService(gemini=gemini_service, cache=cache)
     stream = await ai_service.fix_grammar(user_input=request.code)
-    return StreamingResponse(stream)
+    return StreamingResponse(stream_guard.guard(http_request, stream, "fix-grammar"))
+
+
+@router.post("/fix-document", summary="Fix a whole document item by item, concurrently.")
+async def fix_document(
+    http_request: Request,
+    request: DocumentFixRequest = Body(...),
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    cache: AIResponseCache = Depends(get_ai_response_cache),
+    document_fix: DocumentFixService = Depends(get_document_fix_service),
+    stream_guard: StreamGuard = Depends(get_stream_guard),
+):
+    '''
+        Streams newline-delimited JSON, one line per chunk in document order
+        (index, hash, original, fixed, status), then a summary line; if the request
+        deadline passes first, the last line is {"done": false, "error": ...} instead.
+    '''
+    ai_service = AIService(gemini=gemini_service, cache=cache, priority=BATCH)
+    stream = document_fix.fix_document_ndjson(
+        ai_service, request.latex, action=request.action, skip_hashes=request.skip_hashes,
+    )
+    deadline_line = json.dumps({"done": False, "error": "Request deadline exceeded."}) + "\n"
+    return StreamingResponse(
+        stream_guard.guard(http_request, stream, "fix-document", deadline_chunk=deadline_line),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/usage", summary="Current Gemini quota usage per model.")
+async def llm_usage(
+    scheduler: LLMScheduler = Depends(get_llm_scheduler),
+    stream_guard: StreamGuard = Depends(get_stream_guard),
+):
+    '''
+        Requests in the last minute, available bucket tokens, in-flight and waiting
+        calls per lane, and retry / rate-limit counters for every model used so far;
+        plus how streamed responses ended (completed, disconnected, deadline, failed).
+    '''
+    return {"models": scheduler.usage(), "streams": stream_guard.stats()}
+
+
+@router.get("/metrics", summary="Latency and token usage per AI action and model.")
+async def llm_metrics(
+    telemetry: LLMTelemetry = Depends(get_llm_telemetry),
+    model_router: ModelRouter = Depends(get_model_router),
+):
+    '''
+        For every action and model: request counts by outcome and by source (model call,
+        coalesced, cache, hedge), input / output / thinking tokens from the usage metadata,
+        and time-to-first-chunk and duration percentiles of recent model calls.
+        routing has the hedged requests, fallbacks and circuit state per model.
+    '''
+    return {"actions": telemetry.snapshot(), "routing": model_router.stats()}
 
 
 @router.post("/extract-latex-from-image", summary="Extracts LaTeX code from image.")
 async def extract_latex_from_image(
+    http_request: Request,
     file: UploadFile = File(..., description="Image file of the math problem"),
+    temperature: float = Form(0.0, ge=0.0, le=2.0, description="Above 0 the result is sampled and never cached"),
+    top_p: float = Form(1.0, gt=0.0, le=1.0),
+    thinking_budget: Optional[int] = Form(None, ge=0),
     gemini_service: GeminiService = Depends(get_gemini_service),
+    image_cache: ImageResultCache = Depends(get_image_result_cache),
+    stream_guard: StreamGuard = Depends(get_stream_guard),
 ):
     logger.info(f"Received image file upload request: {file.filename} (type: {file.content_type})")
     
-    ai_service = AIService(gemini=gemini_service)
+    ai_service = AIService(gemini=gemini_service, image_cache=image_cache)
 
     # Basic MIME type validation
     if not file.content_type or not file.content_type.startswith("image/"):
@@ -81,11 +156,19 @@ async def extract_latex_from_image(
         await file.close()
 
     try:
+        # Decoding a large photo takes a while, keep it off the event loop
+        image = await run_in_threadpool(prepare_image, image_bytes, file.content_type)
         stream = await ai_service.extract_latex_from_image(
-            user_input_image_mime_type=file.content_type,
-            user_input_image=image_bytes
+            user_input_image_mime_type=image.mime_type,
+            user_input_image=image.data,
+            temperature=temperature,
+            top_p=top_p,
+            thinking_budget=thinking_budget,
+            image_hash=image.hash,
         )
-        return StreamingResponse(stream)
+        return StreamingResponse(stream_guard.guard(http_request, stream, "extract-latex-from-image"))
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"Image is too large: {e}")
     except Exception as e:
         logger.error(f"An unexpected error occurred during image-to-latex conversion: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred during the image conversion process.")
@@ -7,6 +7,8 @@ from sqlalchemy.exc import SQLAlchemyError
 from typing import List
 
 from ..database import get_db
+from ..dependencies import get_pdf_prebuild_scheduler
+from ..services.pdf_prebuild_service import PDFPrebuildScheduler
 # Import the new schemas
 from ..schemas.problem import ProblemSchema, ProblemCreate, ProblemUpdate, ProblemPartialUpdate
 from ..services import problem_service
@@ -63,7 +65,11 @@ def create_new_problem(problem: ProblemCreate, db: Session = Depends(get_db)): #
 
 # --- PUT /{id} uses ProblemUpdate for input ---
 @router.put("/{problem_id}", response_model=ProblemSchema, summary="Update Existing Problem")
-def update_existing_problem(problem_id: int, problem_update: ProblemUpdate, db: Session = Depends(get_db)): # <-- Use ProblemUpdate
+def update_existing_problem(
+    problem_id: int,
+    problem_update: ProblemUpdate, # <-- Use ProblemUpdate
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
+    db: Session = Depends(get_db)):
     """Update an existing problem identified by its ID."""
     logger.info(f"Router: Request received for PUT /problems/{problem_id}")
     try:
@@ -73,6 +79,7 @@ def update_existing_problem(problem_id: int, problem_update: ProblemUpdate, db:
             logger.warning(f"Router: Problem with id {problem_id} not found for update.")
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Problem not found")
         logger.info(f"Router: Problem {problem_id} updated successfully.")
+        prebuild.schedule_for_problem(db, problem_id)
         return updated_problem
     except SQLAlchemyError as e:
          logger.error(f"Router: Database error during problem update (id: {problem_id}): {e}", exc_info=True)
@@ -89,6 +96,7 @@ def update_existing_problem(problem_id: int, problem_update: ProblemUpdate, db:
 def patch_existing_problem(
     problem_id: int, 
     problem_update: ProblemPartialUpdate, 
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
     db: Session = Depends(get_db)):
     '''Partially update an existing problem identified by its ID.'''
     logger.info(f"Router: Request received for PATCH /problems/{problem_id}")
@@ -102,6 +110,7 @@ def patch_existing_problem(
             logger.warning(f"Router: Problem with id {problem_id} not found for PATCH update.")
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Problem not found")
         logger.info(f"Router: Problem {problem_id} updated seccessfully (PATCH).")
+        prebuild.schedule_for_problem(db, problem_id)
         return updated_problem
     except SQLAlchemyError as e:
         logger.error(f"Router: Database error during problem update (PATCH) (id: {problem_id}): {e}", exc_info=True)
@@ -115,16 +124,22 @@ def patch_existing_problem(
 
 # --- DELETE /{id} - Fix exception handling ---
 @router.delete("/{problem_id}", status_code=status.HTTP_204_NO_CONTENT, summary="Delete Problem")
-def delete_existing_problem(problem_id: int, db: Session = Depends(get_db)):
+def delete_existing_problem(
+    problem_id: int,
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
+    db: Session = Depends(get_db)):
     """Delete a problem identified by its ID."""
     logger.info(f"Router: Request received for DELETE /problems/{problem_id}")
     try:
+        affected_problemsets = prebuild.problemsets_containing(db, problem_id)
         success = problem_service.delete(db=db, problem_id=problem_id)
         if not success:
             logger.warning(f"Router: Problem with id {problem_id} not found for deletion.")
             # Raising 404 here is correct
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Problem not found")
         logger.info(f"Router: Problem {problem_id} deleted successfully.")
+        for problemset_id in affected_problemsets:
+            prebuild.schedule(problemset_id)
         return None
     except SQLAlchemyError as e:
         logger.error(f"Router: Database error during problem deletion (id: {problem_id}): {e}", exc_info=True)
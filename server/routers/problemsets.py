@@ -2,14 +2,16 @@
 
 import logging
 import io
+import json
 import re
 
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Query 
-from fastapi.responses import StreamingResponse, Response
+from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile, Query, Request
+from fastapi.responses import StreamingResponse, Response, FileResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import SQLAlchemyError 
 
-from typing import List, Optional 
+from typing import Dict, List, Optional 
 
 # Import Request Body model for reordering
 from pydantic import BaseModel, Field
@@ -21,14 +23,26 @@ try:
     from ..services import problemset_service 
     from ..services import problem_service 
     from ..services.pdf_service import get_problemset_pdf, PDFGenerationError, ProblemsetNotFound
+    from ..services.pdf_cache import get_pdf_cache
+    from ..services.pdf_prebuild_service import PDFPrebuildScheduler
+    from ..services.latex_lint import lint_errors
+    from ..services.latex_log_parser import LatexLogSummary
     from ..services import pdf_service # todo mozda ukloniti
+    from ..services.compile_session_service import CompileSessionManager, CompileSessionError, CompileSuperseded
+    from ..services.compile_sandbox import WorkspaceUnavailable
+    from ..services import booklet_service
+    from ..services.thumbnail_service import ThumbnailService, ThumbnailError
+    from ..services.ai_service import AIService
+    from ..services.lecture_import_service import import_lecture_pdf, import_lecture_pdf_ndjson
+    from ..services.llm_scheduler import BATCH
+    from ..services.pdf_splitter import PDFSplitter, get_pdf_splitter
 except ImportError as e:
      logging.error(f"Failed to import service classes/functions: {e}")
      raise
 
 # Import dependency providers
 try:
-    from ..dependencies import get_gemini_service, get_lecture_service
+    from ..dependencies import get_gemini_service, get_lecture_service, get_compile_session_manager, get_pdf_prebuild_scheduler, get_thumbnail_service
     from ..database import get_db
 except ImportError as e:
     logging.error(f"Failed to import dependencies: {e}")
@@ -58,6 +72,11 @@ logger = logging.getLogger(__name__)
 class ReorderProblemsPayload(BaseModel):
     problem_ids_ordered: List[int] = Field(..., examples=[[3, 1, 2]])
 
+# --- Request Body Model for Booklets ---
+class BookletPayload(BaseModel):
+    problemset_ids: List[int] = Field(..., min_length=1, examples=[[4, 7, 9]])
+    title: str = Field("Zbirka zadataka", examples=["Ljetni kamp 2024"])
+
 router = APIRouter(
     prefix="/problemsets",
     tags=["Problemsets"], 
@@ -150,6 +169,7 @@ def read_problemset(problemset_id: int, db: Session = Depends(get_db)):
 def update_existing_problemset(
     problemset_id: int,
     problemset_update: ProblemsetUpdate,
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
     db: Session = Depends(get_db)
 ):
     logger.info(f"Router: Request received for PUT /problemsets/{problemset_id}")
@@ -159,6 +179,7 @@ def update_existing_problemset(
             logger.warning(f"Router: Problemset with id {problemset_id} not found for update.")
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Problemset not found")
         logger.info(f"Router: Problemset {problemset_id} updated successfully.")
+        prebuild.schedule(problemset_id)
         # Eager load relationships for the response model
         db.refresh(updated_problemset)
         if hasattr(Problemset, 'problems'):
@@ -212,6 +233,7 @@ def add_problem_to_problemset_endpoint(
     problemset_id: int,
     problem_id: int,
     position: Optional[int] = Query(None, ge=1, description="Optional position for the problem in the set. If None, appends to the end."),
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
     db: Session = Depends(get_db)
 ):
     logger.info(f"Router: Attempting to add problem {problem_id} to problemset {problemset_id} at position {position}.")
@@ -253,6 +275,7 @@ def add_problem_to_problemset_endpoint(
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Failed to add problem to problemset. Ensure position is valid if provided.")
 
         logger.info(f"Router: Successfully added problem {problem_id} to problemset {problemset_id}.")
+        prebuild.schedule(problemset_id)
         return link
     except ProblemsetServiceError as e:
         logger.error(f"Router: Service error adding problem to problemset: {e}", exc_info=True)
@@ -273,6 +296,7 @@ def add_problem_to_problemset_endpoint(
 def remove_problem_from_problemset_endpoint(
     problemset_id: int,
     problem_id: int,
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
     db: Session = Depends(get_db)
 ):
     logger.info(f"Router: Attempting to remove problem {problem_id} from problemset {problemset_id}.")
@@ -285,6 +309,7 @@ def remove_problem_from_problemset_endpoint(
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Problem association not found.")
         
         logger.info(f"Router: Successfully removed problem {problem_id} from problemset {problemset_id}.")
+        prebuild.schedule(problemset_id)
         return None 
     except ProblemsetServiceError as e:
         logger.error(f"Router: Service error removing problem from problemset: {e}", exc_info=True)
@@ -305,6 +330,7 @@ def remove_problem_from_problemset_endpoint(
 def reorder_problems_in_problemset_endpoint(
     problemset_id: int,
     payload: ReorderProblemsPayload, # Use the Pydantic model for the body
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
     db: Session = Depends(get_db)
 ):
     """
@@ -323,6 +349,7 @@ def reorder_problems_in_problemset_endpoint(
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Problemset {problemset_id} not found.")
 
         logger.info(f"Router: Successfully reordered problems for problemset {problemset_id}.")
+        prebuild.schedule(problemset_id)
         
         # Fetch the updated problemset to return it
         # get_one already eager loads, but we call it again after commit
@@ -368,19 +395,7 @@ def get_lecture_data_by_id(
     return read_problemset(problemset_id=problemset_id, db=db)
 
 
-@router.post(
-    "/process-pdf",
-    response_model=ProblemsetSchema,
-    summary="Process PDF Lecture, Extract Data, and Save to Database",
-    tags=["Lectures", "AI Processing"], 
-    status_code=status.HTTP_201_CREATED
-)
-async def process_lecture_pdf_upload(
-    file: UploadFile = File(..., description="PDF file containing the lecture and math problem"),
-    gemini_service: GeminiService = Depends(get_gemini_service), 
-    lecture_service: ProblemsetService = Depends(get_lecture_service), 
-    db: Session = Depends(get_db)
-) -> ProblemsetSchema:
+async def _read_pdf_upload(file: UploadFile) -> bytes:
     logger.info(f"Router: Received PDF file upload request: {file.filename} (type: {file.content_type})")
     if file.content_type != "application/pdf":
         logger.warning(f"Router: Invalid file type uploaded: {file.content_type}.")
@@ -394,71 +409,121 @@ async def process_lecture_pdf_upload(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not read uploaded file: {e}")
     finally:
         await file.close()
+    return pdf_bytes
 
-    extracted_data: LectureProblemsOutput
-    try:
-        logger.info("Router: Calling GeminiService.process_lecture_pdf for extraction...")
-        extracted_data = await gemini_service.process_lecture_pdf(pdf_bytes) 
-        logger.info("Router: Received extracted data from GeminiService.")
-    except (GeminiJSONError, GeminiResponseValidationError, GeminiServiceError) as e:
-        logger.error(f"Router: AI Service error during extraction: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error processing AI response: {e}")
-    except Exception as e:
-        logger.error(f"Router: Unexpected error during extraction: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error during data extraction.")
 
-    created_lecture_orm: Problemset
-    try:
-        logger.info("Router: Calling ProblemsetService CLASS method create_problemset_from_ai_output...")
-        created_lecture_orm = lecture_service.create_problemset_from_ai_output(db=db, ai_data=extracted_data)
-        logger.info(f"Router: Successfully saved lecture (ID: {created_lecture_orm.id}) and problems.")
-    except ProblemsetServiceError as e:
-         logger.error(f"Router: Problemset Service error saving data: {e}", exc_info=True)
-         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to save extracted data: {e}")
-    except Exception as e:
-         logger.error(f"Router: Unexpected error while saving data: {e}", exc_info=True)
-         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error while saving data.")
+@router.post(
+    "/process-pdf",
+    response_model=ProblemsetSchema,
+    summary="Process PDF Lecture, Extract Data, and Save to Database",
+    tags=["Lectures", "AI Processing"], 
+    status_code=status.HTTP_201_CREATED
+)
+async def process_lecture_pdf_upload(
+    file: UploadFile = File(..., description="PDF file containing the lecture and math problem"),
+    gemini_service: GeminiService = Depends(get_gemini_service), 
+    db: Session = Depends(get_db),
+    splitter: PDFSplitter = Depends(get_pdf_splitter),
+) -> ProblemsetSchema:
+    pdf_bytes = await _read_pdf_upload(file)
+    ai_service = AIService(gemini=gemini_service, priority=BATCH)
+
+    # Same pipeline as /process-pdf/stream, only the progress events are not sent
+    result = None
+    async for event in import_lecture_pdf(ai_service, db, pdf_bytes, splitter):
+        if event["event"] in ("done", "error"):
+            result = event
+    if result is None or result["event"] == "error":
+        detail = result["detail"] if result else "Extraction did not finish."
+        logger.error(f"Router: Lecture extraction failed: {detail}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error processing AI response: {detail}")
+
+    logger.info(f"Router: Successfully saved lecture (ID: {result['problemset_id']}) and {result['problems']} problems.")
+    return read_problemset(problemset_id=result["problemset_id"], db=db)
+
+
+@router.post(
+    "/process-pdf/stream",
+    summary="Process PDF Lecture, saving problems as they are extracted",
+    tags=["Lectures", "AI Processing"],
+)
+async def process_lecture_pdf_stream(
+    file: UploadFile = File(..., description="PDF file containing the lecture and math problem"),
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    db: Session = Depends(get_db),
+    splitter: PDFSplitter = Depends(get_pdf_splitter),
+):
+    '''
+        Streams newline-delimited JSON progress events (started, problemset, problem,
+        skipped, done or error). Every problem event means the problem is already saved.
+    '''
+    pdf_bytes = await _read_pdf_upload(file)
+    ai_service = AIService(gemini=gemini_service, priority=BATCH)
+    return StreamingResponse(import_lecture_pdf_ndjson(ai_service, db, pdf_bytes, splitter), media_type="application/x-ndjson")
 
-    return created_lecture_orm
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _pdf_file_response(request: Request, latex_content: str, filename: str, disposition: str) -> Response:
+    """
+    Serves the cached PDF for latex_content straight from disk.
+    FileResponse streams the file and handles Range requests and Content-Length;
+    If-None-Match is answered with 304 before anything is compiled.
+    """
+    etag = f'"{get_pdf_cache().key_for(latex_content)}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    pdf_path = pdf_service.compile_latex_to_cached_pdf(latex_content)
+    headers["Content-Disposition"] = f"{disposition}; filename={filename}"
+    return FileResponse(pdf_path, media_type="application/pdf", headers=headers)
 
 
 @router.get(
     "/{problemset_id}/pdf",
     summary="Generate and Download PDF for a Problemset",
     tags=["PDF Generation"], 
-    response_class=StreamingResponse,
+    response_class=FileResponse,
     responses={
         200: {"content": {"application/pdf": {}}, "description": "Successful PDF download."},
+        206: {"description": "Partial content for Range requests."},
+        304: {"description": "PDF unchanged since the client's cached copy."},
         404: {"description": "Problemset not found."},
         500: {"description": "Internal server error during PDF generation."},
         503: {"description": "PDF generation service unavailable."},
     }
 )
-async def download_problemset_pdf(
+def download_problemset_pdf(
     problemset_id: int,
+    request: Request,
     db: Session = Depends(get_db)
 ):
     logger.info(f"PDF download request received for Problemset ID: {problemset_id}")
     try:
-        pdf_bytes = get_problemset_pdf(db, problemset_id)
-        pdf_stream = io.BytesIO(pdf_bytes)
+        latex_content = pdf_service.get_problemset_latex(db, problemset_id)
         problemset_db = db.query(Problemset).filter(Problemset.id == problemset_id).first() 
         safe_title = "problemset"
         if problemset_db and problemset_db.title:
             safe_title = "".join(c if c.isalnum() or c in ['-', '_'] else '_' for c in problemset_db.title.replace(' ', '_'))
         filename = f"{safe_title}_{problemset_id}.pdf"
-        logger.info(f"Streaming PDF response for {filename}")
-        return StreamingResponse(
-            pdf_stream,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        logger.info(f"Serving PDF file response for {filename}")
+        return _pdf_file_response(request, latex_content, filename, "attachment")
     except ProblemsetNotFound as e:
         logger.warning(f"PDF Gen: Problemset not found (ID: {problemset_id}): {e}")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
     except FileNotFoundError as e:
         logger.error(f"PDF Gen: Prerequisite missing: {e}")
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"PDF generation tool missing: {e}")
+    except WorkspaceUnavailable as e:
+        logger.warning(f"PDF Gen: compile sandbox busy (ID: {problemset_id}): {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except PDFGenerationError as e:
         logger.error(f"PDF Gen Error (ID: {problemset_id}): {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"PDF generation failed: {e}")
@@ -468,7 +533,7 @@ async def download_problemset_pdf(
     
 
 @router.get("/{problemset_id}/pdf",
-            response_class=Response, # Use Response for direct bytes
+            response_class=FileResponse, # Served from the on-disk PDF cache
             responses={
                 200: {
                     "content": {"application/pdf": {}},
@@ -477,20 +542,14 @@ async def download_problemset_pdf(
                 404: {"description": "Problemset not found"},
                 500: {"description": "PDF Generation Error"}
             })
-async def get_problemset_pdf_endpoint(problemset_id: int, db: Session = Depends(get_db)):
+def get_problemset_pdf_endpoint(problemset_id: int, request: Request, db: Session = Depends(get_db)):
     try:
-        pdf_bytes = pdf_service.get_problemset_pdf(db, problemset_id)
-        
-        # Use Response for direct bytes with correct media type
-        return Response(
-            content=pdf_bytes,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"inline; filename=problemset_{problemset_id}.pdf"
-            }
-        )
+        latex_content = pdf_service.get_problemset_latex(db, problemset_id)
+        return _pdf_file_response(request, latex_content, f"problemset_{problemset_id}.pdf", "inline")
     except pdf_service.ProblemsetNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except WorkspaceUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except pdf_service.PDFGenerationError as e:
         # Log the detailed error on the server
         pdf_service.logger.error(f"PDF Generation Error for problemset {problemset_id}: {e.log if e.log else str(e)}")
@@ -499,32 +558,226 @@ async def get_problemset_pdf_endpoint(problemset_id: int, db: Session = Depends(
         pdf_service.logger.exception(f"Unexpected error serving PDF for problemset {problemset_id}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred while generating the PDF.")
 
+# Thumbnails requested with the current version (?v=<etag>) never change
+_THUMBNAIL_IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+_THUMBNAIL_REVALIDATE_CACHE = "public, max-age=300"
+
+
+def _thumbnail_source(db: Session, problemset_id: int, thumbnails: ThumbnailService):
+    """(PDF cache key, thumbnail version, cached PDF path or None) of a problemset's current LaTeX."""
+    pdf_cache = get_pdf_cache()
+    pdf_key = pdf_cache.key_for(pdf_service.get_problemset_latex(db, problemset_id))
+    return pdf_key, thumbnails.key_for(pdf_key), pdf_cache.get(pdf_key)
+
+
+@router.get(
+    "/thumbnails/versions",
+    summary="Current Thumbnail Versions of Several Problemsets",
+    tags=["PDF Generation"],
+    response_model=Dict[int, Optional[str]],
+)
+def get_thumbnail_versions(
+    ids: List[int] = Query(..., description="Problemset IDs"),
+    thumbnails: ThumbnailService = Depends(get_thumbnail_service),
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
+    db: Session = Depends(get_db)
+):
+    '''
+        The version to pass as ?v= to /{id}/thumbnail for every problemset whose PDF is
+        already compiled, null for the rest (unknown IDs included). With prebuilds
+        enabled, missing PDFs are queued for a low-priority background build (unless
+        their LaTeX failed recently), so a later call returns them.
+    '''
+    versions: Dict[int, Optional[str]] = {}
+    for problemset_id in ids:
+        try:
+            pdf_key, version, pdf_path = _thumbnail_source(db, problemset_id, thumbnails)
+        except ProblemsetNotFound:
+            versions[problemset_id] = None
+            continue
+        if pdf_path is None:
+            prebuild.build_soon(problemset_id, pdf_key)
+        versions[problemset_id] = version if pdf_path is not None else None
+    return versions
+
+
+@router.get(
+    "/{problemset_id}/thumbnail",
+    summary="First-page Thumbnail of a Problemset PDF",
+    tags=["PDF Generation"],
+    response_class=FileResponse,
+    responses={
+        200: {"content": {"image/webp": {}, "image/png": {}}, "description": "Small image of page 1."},
+        304: {"description": "Thumbnail unchanged since the client's cached copy."},
+        404: {"description": "Problemset not found, its PDF is not compiled yet, or its LaTeX does not compile."},
+        500: {"description": "Thumbnail rendering failed."},
+        503: {"description": "Image tools unavailable."},
+    }
+)
+def get_problemset_thumbnail(
+    problemset_id: int,
+    request: Request,
+    v: Optional[str] = Query(None, description="Thumbnail version (its ETag); enables long-lived caching."),
+    thumbnails: ThumbnailService = Depends(get_thumbnail_service),
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
+    db: Session = Depends(get_db)
+):
+    '''
+        Renders only from already compiled PDFs: a card grid must not fill the compile
+        workspaces that the live editor waits for.
+    '''
+    try:
+        pdf_key, version, pdf_path = _thumbnail_source(db, problemset_id, thumbnails)
+        etag = f'"{version}"'
+        cache_control = _THUMBNAIL_IMMUTABLE_CACHE if v == version else _THUMBNAIL_REVALIDATE_CACHE
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if _etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        if pdf_path is None:
+            missing_headers = {"Cache-Control": "no-store"}
+            failure = prebuild.known_failure(pdf_key)
+            if failure is not None:
+                detail = f"PDF could not be compiled: {failure}"
+            elif prebuild.build_soon(problemset_id, pdf_key):
+                detail = "PDF not compiled yet; a background build was queued."
+                missing_headers["Retry-After"] = "10"
+            else:
+                detail = "PDF not compiled yet."
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail, headers=missing_headers)
+        thumbnail_path = thumbnails.thumbnail_for(pdf_path)
+        return FileResponse(thumbnail_path, media_type=thumbnails.media_type, headers=headers)
+    except ProblemsetNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except HTTPException:
+        raise
+    except (FileNotFoundError, WorkspaceUnavailable) as e:
+        logger.error(f"Thumbnail: generation unavailable (ID: {problemset_id}): {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except ThumbnailError as e:
+        logger.error(f"Thumbnail generation failed (ID: {problemset_id}): {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Thumbnail generation failed: {e}")
+    except Exception as e:
+        logger.exception(f"Unexpected thumbnail error (ID: {problemset_id}): {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error generating thumbnail.")
+
+
+@router.post(
+    "/booklet",
+    summary="Build a Booklet PDF from Several Problemsets",
+    tags=["PDF Generation"],
+    response_class=FileResponse,
+    responses={
+        200: {"content": {"application/pdf": {}}, "description": "The merged booklet with a table of contents."},
+        304: {"description": "Booklet unchanged since the client's cached copy."},
+        404: {"description": "One of the problemsets was not found."},
+        500: {"description": "Internal server error during PDF generation."},
+        503: {"description": "PDF generation service unavailable."},
+    }
+)
+def build_booklet_pdf(
+    payload: BookletPayload,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    logger.info(f"Booklet request received for problemsets {payload.problemset_ids}")
+    try:
+        booklet = booklet_service.get_booklet(db, payload.problemset_ids, payload.title)
+        etag = f'"{get_pdf_cache().key_for(booklet.latex)}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        pdf_path = booklet_service.compile_booklet(booklet)
+        headers["Content-Disposition"] = "attachment; filename=booklet.pdf"
+        return FileResponse(pdf_path, media_type="application/pdf", headers=headers)
+    except ProblemsetNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except (FileNotFoundError, WorkspaceUnavailable) as e:
+        logger.error(f"Booklet: PDF generation unavailable: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except PDFGenerationError as e:
+        logger.error(f"Booklet generation failed: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Booklet generation failed: {e}")
+    except Exception as e:
+        logger.exception(f"Unexpected booklet generation error: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected error generating booklet.")
+
+def _compile_error_detail(error: PDFGenerationError) -> dict:
+    """JSON error body for failed compiles: first error as message plus all diagnostics."""
+    first = error.diagnostics.errors[0]
+    location = f" (line {first.line})" if first.line else ""
+    detail = {"message": f"{first.message}{location}", **error.diagnostics.to_dict()}
+    if error.log is not None:
+        detail["log"] = error.log
+    return detail
+
+# Proxies commonly reject responses with more than 8 KB of headers
+DIAGNOSTICS_HEADER_MAX_BYTES = 6000
+
+def _diagnostics_header(diagnostics: LatexLogSummary) -> str:
+    """Compact JSON of a successful compile's diagnostics; trailing warnings are dropped to fit a header."""
+    body = diagnostics.to_dict()
+    while True:
+        encoded = json.dumps(body, separators=(",", ":"))
+        if len(encoded) <= DIAGNOSTICS_HEADER_MAX_BYTES or not body["warnings"]:
+            return encoded
+        body["warnings"] = body["warnings"][:len(body["warnings"]) // 2]
+        body["truncated"] = True
+
 # --- NEW Endpoint for compiling arbitrary LaTeX ---
 @router.post("/compile-latex",
              response_class=Response,
              responses={
                  200: {
                      "content": {"application/pdf": {}},
-                     "description": "Returns the compiled PDF."
+                     "description": "Returns the compiled PDF; the X-LaTeX-Diagnostics header has its warnings and box stats as JSON."
                  },
-                 500: {"description": "PDF Compilation Error"}
+                 409: {"description": "Superseded by a newer compile request in the same session"},
+                 422: {"description": "LaTeX errors, with structured diagnostics"},
+                 500: {"description": "PDF Compilation Error"},
+                 503: {"description": "All compile workspaces are busy"}
              })
-async def compile_latex_from_text_endpoint(payload: dict): # Expecting {"latex_code": "..."}
+async def compile_latex_from_text_endpoint(
+    payload: dict, # Expecting {"latex_code": "...", "session_id": "..." (optional), "include_log": bool (optional)}
+    session_manager: CompileSessionManager = Depends(get_compile_session_manager)
+):
     latex_code = payload.get("latex_code")
     if not latex_code:
         raise HTTPException(status_code=400, detail="latex_code field is required.")
+    session_id = payload.get("session_id")
+    include_log = bool(payload.get("include_log"))
+    diagnostics: List[LatexLogSummary] = []
     
     try:
-        pdf_bytes = pdf_service.compile_latex_to_pdf(latex_code)
+        if session_id:
+            # Live editor preview: reuse the session's aux files and drop stale requests
+            pdf_bytes = await session_manager.compile(
+                session_id, latex_code, keep_raw_log=include_log, on_diagnostics=diagnostics.append,
+            )
+        else:
+            # Off the event loop: waiting for a sandbox workspace or pdflatex must not block other requests
+            pdf_bytes = await run_in_threadpool(
+                pdf_service.compile_latex_to_pdf, latex_code, keep_raw_log=include_log, on_diagnostics=diagnostics.append,
+            )
+        headers = {"Content-Disposition": "inline; filename=compiled_document.pdf"}
+        if diagnostics:
+            headers["X-LaTeX-Diagnostics"] = _diagnostics_header(diagnostics[-1])
         return Response(
             content=pdf_bytes,
             media_type="application/pdf",
-            headers={
-                "Content-Disposition": "inline; filename=compiled_document.pdf"
-            }
+            headers=headers
         )
+    except CompileSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CompileSuperseded as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except WorkspaceUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except pdf_service.PDFGenerationError as e:
-        pdf_service.logger.error(f"Direct LaTeX Compilation Error: {e.log if e.log else str(e)}")
+        pdf_service.logger.error(f"Direct LaTeX Compilation Error: {e}")
+        if e.diagnostics is not None and e.diagnostics.errors:
+            raise HTTPException(status_code=422, detail=_compile_error_detail(e))
         raise HTTPException(status_code=500, detail=f"Failed to compile LaTeX. {str(e)}")
     except FileNotFoundError as e: # Specifically for pdflatex not found
         pdf_service.logger.error(f"pdflatex not found during direct compilation: {e}")
@@ -533,6 +786,19 @@ async def compile_latex_from_text_endpoint(payload: dict): # Expecting {"latex_c
         pdf_service.logger.exception(f"Unexpected error during direct LaTeX compilation.")
         raise HTTPException(status_code=500, detail="An unexpected error occurred during LaTeX compilation.")
 
+@router.delete(
+    "/compile-latex/sessions/{session_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Close a Live Editor Compile Session"
+)
+def close_compile_session(
+    session_id: str,
+    session_manager: CompileSessionManager = Depends(get_compile_session_manager)
+):
+    if not session_manager.close_session(session_id):
+        raise HTTPException(status_code=404, detail="Compile session not found.")
+    return None
+
 @router.put(
     "/{problemset_id}/draft",
     response_model=ProblemsetSchema,
@@ -542,6 +808,7 @@ async def compile_latex_from_text_endpoint(payload: dict): # Expecting {"latex_c
 def save_draft(
     problemset_id: int,
     draft_data: dict,  # Expecting {"raw_latex": "..."}
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
     db: Session = Depends(get_db)
 ):
     logger.info(f"Router: Request received for PUT /problemsets/{problemset_id}/draft")
@@ -570,6 +837,7 @@ def save_draft(
             )
             
         logger.info(f"Router: Draft saved successfully for problemset {problemset_id}")
+        prebuild.schedule(problemset_id)
         return updated_problemset
         
     except SQLAlchemyError as e:
@@ -594,6 +862,7 @@ def save_draft(
 @router.put("/{problemset_id}/finalize")
 def finalize_problemset(
     problemset_id: int,
+    prebuild: PDFPrebuildScheduler = Depends(get_pdf_prebuild_scheduler),
     db: Session = Depends(get_db)
 ):
     """Finalize a problemset by parsing its LaTeX content and extracting problems."""
@@ -606,6 +875,15 @@ def finalize_problemset(
         if not problemset.raw_latex:
             raise HTTPException(status_code=400, detail="No LaTeX content to finalize")
 
+        # Refuse to split a draft into problems if it could never compile
+        errors = lint_errors(problemset.raw_latex)
+        if errors:
+            first = errors[0]
+            raise HTTPException(status_code=422, detail={
+                "message": f"{first.message} (line {first.line})",
+                "errors": [d.to_dict() for d in errors],
+            })
+
         # Extract title from LaTeX
         title_match = re.search(r'\\title\{([^}]+)\}', problemset.raw_latex)
         if title_match:
@@ -664,8 +942,12 @@ def finalize_problemset(
             db.add(link)
 
         db.commit()
+        prebuild.schedule(problemset_id)
         return {"message": "Problemset finalized successfully"}
 
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,78 @@
+# server/routers/translation.py
+
+import logging
+from fastapi import APIRouter, Body, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..dependencies import get_gemini_service, get_batch_translator
+from ..models.problem import Problem
+from ..schemas.translation import BatchTranslationRequest, BatchTranslationResponse, TranslationItem
+from ..services.ai_service import AIService
+from ..services.ai_response_cache import AIResponseCache, get_ai_response_cache
+from ..services.gemini_service import GeminiService
+from ..services.llm_scheduler import BATCH
+from ..services.translation_service import BatchTranslator
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/translate",
+    tags=["Translation"],
+)
+
+
+@router.post("/batch", response_model=BatchTranslationResponse, summary="Translate many problems to Bosnian through the translation memory")
+async def translate_batch(
+    request: BatchTranslationRequest = Body(...),
+    gemini_service: GeminiService = Depends(get_gemini_service),
+    cache: AIResponseCache = Depends(get_ai_response_cache),
+    translator: BatchTranslator = Depends(get_batch_translator),
+    db: Session = Depends(get_db),
+):
+    '''
+        Translates stored problems (problem_ids) and free texts in one call. Sentences
+        already in the translation memory are reused; only new ones go to the model,
+        concurrently. With save, each translated problem gets the translation appended
+        to its latex_versions.
+    '''
+    if not request.problem_ids and not request.texts:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Provide problem_ids or texts.")
+
+    problems = {problem.id: problem for problem in db.query(Problem).filter(Problem.id.in_(request.problem_ids))}
+    missing = [problem_id for problem_id in request.problem_ids if problem_id not in problems]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Problems not found: {missing}")
+
+    sources = [(problem_id, problems[problem_id].latex_text) for problem_id in request.problem_ids] + [(None, text) for text in request.texts]
+    ai_service = AIService(gemini=gemini_service, cache=cache, priority=BATCH)
+    results = await translator.translate(ai_service, db, [text for _, text in sources])
+
+    items = []
+    for (problem_id, _), result in zip(sources, results):
+        if request.save and problem_id is not None and result.status != "error":
+            problem = problems[problem_id]
+            versions = list(problem.latex_versions or [])
+            if result.translated_text not in versions:
+                # Assign a new list: in-place changes to a JSON column are not tracked
+                problem.latex_versions = versions + [result.translated_text]
+        items.append(TranslationItem(
+            problem_id=problem_id,
+            original_text=result.original_text,
+            translated_text=result.translated_text,
+            segments=result.segments,
+            reused=result.reused,
+            translated=result.translated,
+            status=result.status,
+            error=result.error,
+        ))
+    if request.save and request.problem_ids:
+        db.commit()
+
+    logger.info(f"Router: Batch translation of {len(items)} texts done.")
+    return BatchTranslationResponse(
+        items=items,
+        segments=sum(item.segments for item in items),
+        reused=sum(item.reused for item in items),
+        translated=sum(item.translated for item in items),
+    )
@@ -1,3 +1,5 @@
+from typing import List, Literal
+
 from pydantic import BaseModel
 
 class LatexRequest(BaseModel):
@@ -6,3 +8,8 @@ class LatexRequest(BaseModel):
 class MathImageRequest(BaseModel):
     image_bytes: bytes
     mime_type: str
+
+class DocumentFixRequest(BaseModel):
+    latex: str
+    action: Literal["fix_latex", "fix_grammar"] = "fix_latex"
+    skip_hashes: List[str] = [] # Chunk hashes the client already accepted, not sent to the model
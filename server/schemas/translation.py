@@ -0,0 +1,24 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+class BatchTranslationRequest(BaseModel):
+    problem_ids: List[int] = Field(default=[], max_length=200)
+    texts: List[str] = Field(default=[], max_length=200) # Free text, translated but not stored
+    save: bool = True # Append each problem's translation to its latex_versions
+
+class TranslationItem(BaseModel):
+    problem_id: Optional[int] = None
+    original_text: str
+    translated_text: str
+    segments: int # Sentences that needed translating
+    reused: int # Served from the translation memory
+    translated: int # Sent to the model
+    status: Literal["translated", "fallback", "error"]
+    error: Optional[str] = None
+
+class BatchTranslationResponse(BaseModel):
+    items: List[TranslationItem]
+    segments: int
+    reused: int
+    translated: int
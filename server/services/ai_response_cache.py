@@ -0,0 +1,124 @@
+# server/services/ai_response_cache.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_version(system_prompt: str, shots: Optional[Sequence[Tuple[str, str]]] = None) -> str:
+    """Short hash of a system prompt and its few-shot examples; changes whenever a prompt is edited."""
+    digest = hashlib.sha256()
+    digest.update(system_prompt.encode("utf-8"))
+    for user_example, model_example in shots or ():
+        digest.update(b"\0u")
+        digest.update(user_example.encode("utf-8"))
+        digest.update(b"\0m")
+        digest.update(model_example.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class AIResponseCache:
+    '''
+        In-memory LRU cache of complete LLM outputs with a TTL.
+        Entries are stored as the list of streamed chunks so a hit can be
+        replayed as the same stream the client would have received.
+    '''
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"AIResponseCache initialized (max_entries: {max_entries}, ttl: {ttl_seconds}s).")
+
+    @staticmethod
+    def key_for(
+        action: str,
+        model: str,
+        prompt_version: str,
+        params: Dict[str, Any],
+        user_input: Union[str, bytes],
+    ) -> str:
+        raw_input = user_input.encode("utf-8") if isinstance(user_input, str) else user_input
+        material = json.dumps({
+            "action": action,
+            "model": model,
+            "prompt_version": prompt_version,
+            "params": params,
+            "input": hashlib.sha256(raw_input).hexdigest(),
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, chunks = entry
+            if time.monotonic() - stored_at >= self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return chunks
+
+    def put(self, key: str, chunks: List[str]) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), list(chunks))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    async def replay(chunks: List[str]) -> AsyncIterator[str]:
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(0) # Let the response flush chunk by chunk, like a live stream
+
+    async def cached_stream(self, key: str, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        Passes stream through while recording it; only a stream that finished
+        normally is stored, so errors and client disconnects are never cached.
+        """
+        chunks: List[str] = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        self.put(key, chunks)
+
+    def stream(self, key: str, produce) -> AsyncIterator[str]:
+        """Replays the cached output for key, or calls produce() and caches what it streams."""
+        chunks = self.get(key)
+        if chunks is not None:
+            logger.info(f"AI response cache hit: {key[:12]}")
+            return self.replay(chunks)
+        return self.cached_stream(key, produce())
+
+
+_cached_ai_response_cache: Optional[AIResponseCache] = None
+
+def get_ai_response_cache() -> AIResponseCache:
+    """Returns the process-wide AIResponseCache instance."""
+    global _cached_ai_response_cache
+
+    if _cached_ai_response_cache is None:
+        _cached_ai_response_cache = AIResponseCache(
+            max_entries=settings.AI_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.AI_CACHE_TTL_SECONDS,
+        )
+
+    return _cached_ai_response_cache
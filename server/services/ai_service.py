@@ -3,26 +3,190 @@ from typing import AsyncIterator, Optional
 from google.genai import types
 
 from .gemini_service import GeminiService
+from .ai_response_cache import AIResponseCache, prompt_version
+from .image_preprocessing import ImageResultCache
+from .llm_router import ModelRouter, Route, get_model_router
+from .llm_scheduler import INTERACTIVE, estimate_tokens
+from .pdf_splitter import PageRange
+from .llm_telemetry import LLMCallRecord, LLMTelemetry, get_llm_telemetry
 from .prompts import (
     SYSTEM_PROMPTS,
     HELLO_EXAMPLES,
     FIX_GRAMMAR_EXAMPLES,
     FIX_LATEX_EXAMPLES,
+    TRANSLATE_EXAMPLES,
+    TRANSLATE_SEGMENT_EXAMPLES,
+    TRANSLATE_INSTRUCTION,
+    IMAGE_TO_LATEX_USER,
+    PROCESS_LECTURE_PDF_USER,
+    PROCESS_LECTURE_PDF_PART_USER,
 )
 
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
-DEFAULT_MODEL = settings.GEMINI_FLASH_2_5
+DEFAULT_MODEL = settings.GEMINI_FLASH_2_5 # Routine calls; the model of each action is picked in llm_router
+
+# Structured output for lecture PDFs (same as experiments/process_ljetni_kamp_pdfs.py).
+# property_ordering puts the lecture metadata first and each problem's LaTeX before its
+# category, so the streamed JSON can be consumed problem by problem.
+LECTURE_PDF_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    required=["lecture_name", "group_name", "problems_latex"],
+    properties={
+        "lecture_name": types.Schema(
+            type=types.Type.STRING,
+            description="The main title or name/topic of the lecture found in the document.",
+        ),
+        "group_name": types.Schema(
+            type=types.Type.STRING,
+            description="The target group for the lecture, mapped precisely to one of the five allowed values.",
+            enum=["napredna", "olimpijska", "pocetna", "predolimpijska", "srednja"],
+        ),
+        "problems_latex": types.Schema(
+            type=types.Type.ARRAY,
+            description="A list of objects, each containing the LaTeX source and category for a distinct problem.",
+            items=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "latex_text": types.Schema(
+                        type=types.Type.STRING,
+                        description="The full LaTeX representation of a single math problem.",
+                    ),
+                    "category": types.Schema(
+                        type=types.Type.STRING,
+                        description="The category of the problem (A, N, G, or C).",
+                        enum=["A", "N", "G", "C"],
+                    ),
+                },
+                required=["latex_text", "category"],
+                property_ordering=["latex_text", "category"],
+            ),
+        ),
+    },
+    property_ordering=["lecture_name", "group_name", "problems_latex"],
+)
 
 class AIService:
     '''
         Higher-level service that defines actions (hello, translate, fix_latex)
         and uses GeminiService to perform them.
+        Deterministic (temperature 0) text actions are served from the response cache when one is given,
+        image actions from the image cache when the image's hash is known.
+        priority is the scheduler lane every call of this instance waits in.
+        Every action is timed into telemetry (the process-wide LLMTelemetry by default).
+        Unless the caller passes one, the model and thinking budget come from the
+        router, which also hedges slow interactive calls and routes around failing
+        models (see ModelRouter).
     '''
-    def __init__(self, gemini: GeminiService):
+    def __init__(
+        self,
+        gemini: GeminiService,
+        cache: Optional[AIResponseCache] = None,
+        priority: int = INTERACTIVE,
+        image_cache: Optional[ImageResultCache] = None,
+        telemetry: Optional[LLMTelemetry] = None,
+        router: Optional[ModelRouter] = None,
+    ):
         self.gemini = gemini
+        self.cache = cache
+        self.priority = priority
+        self.image_cache = image_cache
+        self.telemetry = telemetry or get_llm_telemetry()
+        self.router = router or get_model_router()
+
+    def _measured(self, record: LLMCallRecord, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        return self.telemetry.measure(record, stream)
+
+    def _routed(self, route: Route, record: LLMCallRecord, **request) -> AsyncIterator[str]:
+        def call(model: str, thinking_budget: int, call_record: LLMCallRecord, shared: bool) -> AsyncIterator[str]:
+            return self.gemini.stream(
+                model=model,
+                thinking_budget=thinking_budget,
+                priority=self.priority,
+                record=call_record,
+                coalesce=shared,
+                **request,
+            )
+        # Batch work is not latency-sensitive, a duplicate request would only cost quota
+        return self.router.stream(route, call, record, self.telemetry, hedge=self.priority == INTERACTIVE)
+
+    def _cached_text_stream(
+        self,
+        action: str,
+        system_prompt: str,
+        shots,
+        user_input: str,
+        model: Optional[str],
+        temperature: float,
+        top_p: float,
+        thinking_budget: Optional[int],
+    ) -> AsyncIterator[str]:
+        route = self.router.route(action, estimate_tokens(user_input), model, thinking_budget)
+        record = self.telemetry.start(action, route.model)
+
+        def produce() -> AsyncIterator[str]:
+            record.source = "model" # Only called on a cache miss
+            return self._routed(
+                route,
+                record,
+                system_prompt=system_prompt,
+                shots=shots,
+                user_input_text=user_input,
+                temperature=temperature,
+                top_p=top_p,
+            )
+
+        # A sampled call (temperature > 0) asks for a fresh answer, so it is never replayed
+        if self.cache is None or temperature > 0:
+            return self._measured(record, produce())
+        key = self.cache.key_for(
+            action=action,
+            model=route.model,
+            prompt_version=prompt_version(system_prompt, shots),
+            params={"temperature": temperature, "top_p": top_p, "thinking_budget": route.thinking_budget},
+            user_input=user_input,
+        )
+        record.source = "cache"
+        return self._measured(record, self.cache.stream(key, produce))
+
+    def _cached_image_stream(
+        self,
+        action: str,
+        system_prompt: str,
+        user_text: Optional[str],
+        image: bytes,
+        mime_type: str,
+        model: Optional[str],
+        image_hash: Optional[str],
+        temperature: float,
+        top_p: float,
+        thinking_budget: Optional[int],
+    ) -> AsyncIterator[str]:
+        route = self.router.route(action, estimate_tokens(user_text, images=1), model, thinking_budget)
+        record = self.telemetry.start(action, route.model)
+
+        def produce() -> AsyncIterator[str]:
+            record.source = "model" # Only called on a cache miss
+            return self._routed(
+                route,
+                record,
+                system_prompt=system_prompt,
+                user_input_text=user_text,
+                user_input_bytes=image,
+                user_input_bytes_mime_type=mime_type,
+                temperature=temperature,
+                top_p=top_p,
+            )
+
+        # Like text calls, a sampled call asks for a fresh answer
+        if self.image_cache is None or image_hash is None or temperature > 0:
+            return self._measured(record, produce())
+        params = f"{top_p}:{route.thinking_budget}"
+        namespace = f"{action}:{route.model}:{params}:{prompt_version(system_prompt, [(user_text or '', '')])}"
+        record.source = "cache"
+        return self._measured(record, self.image_cache.stream(namespace, image_hash, produce))
 
     async def hello(
         self,
@@ -40,18 +204,19 @@ class AIService:
             required=["message"],
             properties={"message": types.Schema(type=types.Type.STRING)},
         )
-        chosen_model = model or DEFAULT_MODEL
-        return self.gemini.stream(
-            model=chosen_model,
+        route = self.router.route("hello", estimate_tokens(user_input), model, thinking_budget)
+        record = self.telemetry.start("hello", route.model)
+        return self._measured(record, self._routed(
+            route,
+            record,
             system_prompt=system_prompt,
             shots=shots,
             user_input_text=user_input,
             temperature=temperature,
             top_p=top_p,
-            thinking_budget=thinking_budget,
             response_mime_type="application/json",
             response_schema=response_schema,
-        )
+        ))
     
     async def fix_latex(
         self,
@@ -61,14 +226,12 @@ class AIService:
         top_p: float = 1.0,
         thinking_budget: Optional[int] = None,
     ) -> AsyncIterator[str]:
-        system_prompt = SYSTEM_PROMPTS["fix_latex"]
-        shots = FIX_LATEX_EXAMPLES
-        chosen_model = model or DEFAULT_MODEL
-        return self.gemini.stream(
-            model=chosen_model,
-            system_prompt=system_prompt,
-            shots=shots,
-            user_input_text=user_input,
+        return self._cached_text_stream(
+            action="fix_latex",
+            system_prompt=SYSTEM_PROMPTS["fix_latex"],
+            shots=FIX_LATEX_EXAMPLES,
+            user_input=user_input,
+            model=model,
             temperature=temperature,
             top_p=top_p,
             thinking_budget=thinking_budget,
@@ -82,20 +245,59 @@ class AIService:
         top_p: float = 1.0,
         thinking_budget: Optional[int] = None,
     ) -> AsyncIterator[str]:
-        system_prompt = SYSTEM_PROMPTS["fix_grammar"]
-        shots = FIX_GRAMMAR_EXAMPLES
-        chosen_model = model or DEFAULT_MODEL
-        return self.gemini.stream(
-            model=chosen_model,
-            system_prompt=system_prompt,
-            shots=shots,
-            user_input_text=user_input,
+        return self._cached_text_stream(
+            action="fix_grammar",
+            system_prompt=SYSTEM_PROMPTS["fix_grammar"],
+            shots=FIX_GRAMMAR_EXAMPLES,
+            user_input=user_input,
+            model=model,
             temperature=temperature,
             top_p=top_p,
             thinking_budget=thinking_budget,
         )
     
-    async def extract_latex_from_image(
+    async def translate(
+        self,
+        user_input: str,
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        top_p: float = 1.0,
+        thinking_budget: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        return self._cached_text_stream(
+            action="translate",
+            system_prompt=SYSTEM_PROMPTS["translate"],
+            shots=TRANSLATE_EXAMPLES,
+            user_input=TRANSLATE_INSTRUCTION.format(text=user_input),
+            model=model,
+            temperature=temperature,
+            top_p=top_p,
+            thinking_budget=thinking_budget,
+        )
+
+    async def translate_segment(
+        self,
+        user_input: str,
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        top_p: float = 1.0,
+        thinking_budget: Optional[int] = None,
+    ) -> AsyncIterator[str]:
+        '''
+            One sentence with its formulas replaced by ⟦n⟧ markers, used by the batch translation.
+        '''
+        return self._cached_text_stream(
+            action="translate_segment",
+            system_prompt=SYSTEM_PROMPTS["translate_segment"],
+            shots=TRANSLATE_SEGMENT_EXAMPLES,
+            user_input=user_input,
+            model=model,
+            temperature=temperature,
+            top_p=top_p,
+            thinking_budget=thinking_budget,
+        )
+
+    async def image_to_latex(
         self,
         user_input_image: bytes,
         user_input_image_mime_type: str,
@@ -103,14 +305,69 @@ class AIService:
         temperature: float = 0.0,
         top_p: float = 1.0,
         thinking_budget: Optional[int] = None,
+        image_hash: Optional[str] = None,
     ) -> AsyncIterator[str]:
-        system_prompt = SYSTEM_PROMPTS["extract_latex_from_image"]
-        chosen_model = model or DEFAULT_MODEL
+        '''
+            Plain LaTeX transcription of an image (no translation), used by /image-to-latex.
+        '''
+        return self._cached_image_stream(
+            action="image_to_latex",
+            system_prompt=SYSTEM_PROMPTS["image_to_latex"],
+            user_text=IMAGE_TO_LATEX_USER,
+            image=user_input_image,
+            mime_type=user_input_image_mime_type,
+            model=model,
+            image_hash=image_hash,
+            temperature=temperature,
+            top_p=top_p,
+            thinking_budget=thinking_budget,
+        )
 
-        return self.gemini.stream(
-            model=chosen_model,
-            system_prompt=system_prompt,
-            user_input_bytes=user_input_image,
-            user_input_bytes_mime_type=user_input_image_mime_type,
+    async def process_lecture_pdf(
+        self,
+        pdf_bytes: bytes,
+        model: Optional[str] = None,
+        part: Optional[PageRange] = None,
+    ) -> AsyncIterator[str]:
+        '''
+            Streams the lecture as JSON following LECTURE_PDF_SCHEMA (see lecture_import_service).
+            part tells the model that pdf_bytes is only a page range of the lecture.
+        '''
+        user_text = PROCESS_LECTURE_PDF_USER
+        if part is not None:
+            user_text += PROCESS_LECTURE_PDF_PART_USER.format(first=part.first, last=part.last, total=part.total)
+        route = self.router.route("process_lecture_pdf", estimate_tokens(user_text, images=1), model)
+        record = self.telemetry.start("process_lecture_pdf", route.model)
+        return self._measured(record, self._routed(
+            route,
+            record,
+            system_prompt=SYSTEM_PROMPTS["process_lecture_pdf"],
+            user_input_text=user_text,
+            user_input_bytes=pdf_bytes,
+            user_input_bytes_mime_type="application/pdf",
+            response_mime_type="application/json",
+            response_schema=LECTURE_PDF_SCHEMA,
+        ))
+
+    async def extract_latex_from_image(
+        self,
+        user_input_image: bytes,
+        user_input_image_mime_type: str,
+        model: Optional[str] = None,
+        temperature: float = 0.0,
+        top_p: float = 1.0,
+        thinking_budget: Optional[int] = None,
+        image_hash: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        return self._cached_image_stream(
+            action="extract_latex_from_image",
+            system_prompt=SYSTEM_PROMPTS["extract_latex_from_image"],
+            user_text=None,
+            image=user_input_image,
+            mime_type=user_input_image_mime_type,
+            model=model,
+            image_hash=image_hash,
+            temperature=temperature,
+            top_p=top_p,
+            thinking_budget=thinking_budget,
         )
-        
@@ -0,0 +1,99 @@
+# server/services/booklet_service.py
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.problemset import Problemset
+from . import pdf_service
+from .pdf_cache import get_pdf_cache
+from .pdf_service import ProblemsetNotFound, _escape_latex
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BookletChapter:
+    problemset_id: int
+    title: str
+    latex: str
+    cache_key: str
+
+
+@dataclass
+class Booklet:
+    title: str
+    chapters: List[BookletChapter]
+    latex: str # Merge document that pulls the chapter PDFs together
+
+
+def _merge_document(title: str, chapters: List[BookletChapter]) -> str:
+    """
+    LaTeX that stitches the cached chapter PDFs together with pdfpages.
+    Chapter files are referenced by their cache key, so the merge document (and its
+    own cache entry) changes exactly when one of the chapters does.
+    """
+    cache = get_pdf_cache()
+    includes = []
+    for index, chapter in enumerate(chapters, start=1):
+        chapter_path = cache.path_for(chapter.cache_key).as_posix()
+        includes.append(
+            f"\\includepdf[pages=-, pagecommand={{\\thispagestyle{{booklet}}}}, "
+            f"addtotoc={{1,section,1,{{{_escape_latex(chapter.title)}}},chapter{index}}}]"
+            f"{{{chapter_path}}}"
+        )
+    includes_str = "\n".join(includes)
+    return f"""\\documentclass[11pt,a4paper]{{article}}
+\\usepackage[T1]{{fontenc}}
+\\usepackage{{pdfpages}}
+\\usepackage{{hyperref}}
+\\hypersetup{{pdftitle={{{_escape_latex(title)}}}, pdfauthor={{Skola Matematike}}}}
+% Booklet page numbers go in the header so they never collide with the chapters' own footers
+\\makeatletter
+\\def\\ps@booklet{{\\def\\@oddhead{{\\hfill\\small\\thepage}}\\def\\@evenhead{{\\small\\thepage\\hfill}}\\let\\@oddfoot\\@empty\\let\\@evenfoot\\@empty}}
+\\makeatother
+\\title{{\\bfseries\\LARGE {_escape_latex(title)}}}
+\\author{{Skola Matematike}}
+\\date{{\\today}}
+
+\\begin{{document}}
+\\maketitle
+\\thispagestyle{{empty}}
+\\tableofcontents
+\\clearpage
+{includes_str}
+\\end{{document}}
+"""
+
+
+def get_booklet(db: Session, problemset_ids: List[int], title: str) -> Booklet:
+    """
+    Resolves every problemset's LaTeX and builds the merge document, without compiling anything.
+    Raises ProblemsetNotFound if any id is unknown.
+    """
+    titles = dict(db.query(Problemset.id, Problemset.title).filter(Problemset.id.in_(problemset_ids)).all())
+    cache = get_pdf_cache()
+    chapters = []
+    for problemset_id in problemset_ids:
+        if problemset_id not in titles:
+            raise ProblemsetNotFound(f"Problemset with ID {problemset_id} not found.")
+        latex = pdf_service.get_problemset_latex(db, problemset_id)
+        chapters.append(BookletChapter(problemset_id, titles[problemset_id], latex, cache.key_for(latex)))
+    return Booklet(title=title, chapters=chapters, latex=_merge_document(title, chapters))
+
+
+def compile_booklet(booklet: Booklet) -> Path:
+    """
+    Compiles the booklet: chapters go through the PDF cache (only changed ones are
+    recompiled, in parallel), then the merge document is compiled and cached itself.
+    """
+    workers = max(1, min(len(booklet.chapters), settings.LATEX_SANDBOX_WORKSPACES))
+    logger.info(f"Building booklet '{booklet.title}' from {len(booklet.chapters)} chapters.")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(pdf_service.compile_latex_to_cached_pdf, [c.latex for c in booklet.chapters]))
+    return pdf_service.compile_latex_to_cached_pdf(booklet.latex)
@@ -0,0 +1,202 @@
+# server/services/compile_sandbox.py
+
+import atexit
+import logging
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+try:
+    import resource # POSIX only
+except ImportError: # pragma: no cover - Windows
+    resource = None
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxTimeout(Exception):
+    """Raised when a sandboxed process is killed for running past its wall-clock deadline."""
+    pass
+
+class WorkspaceUnavailable(Exception):
+    """Raised when no compile workspace frees up in time."""
+    pass
+
+
+@dataclass
+class CompileLimits:
+    cpu_seconds: int = 20 # RLIMIT_CPU, the kernel sends SIGXCPU then SIGKILL
+    memory_bytes: int = 1024 * 1024 * 1024 # RLIMIT_AS
+    output_bytes: int = 64 * 1024 * 1024 # RLIMIT_FSIZE, per written file
+    wall_seconds: float = 30.0 # Deadline after which the whole process group is killed
+    niceness: int = 0
+
+    @classmethod
+    def from_settings(cls, niceness: int = 0) -> "CompileLimits":
+        return cls(
+            cpu_seconds=settings.LATEX_CPU_LIMIT_SECONDS,
+            memory_bytes=settings.LATEX_MEMORY_LIMIT_MB * 1024 * 1024,
+            output_bytes=settings.LATEX_OUTPUT_LIMIT_MB * 1024 * 1024,
+            wall_seconds=settings.LATEX_WALL_TIMEOUT_SECONDS,
+            niceness=niceness,
+        )
+
+
+def _limit_setter(limits: CompileLimits) -> Optional[Callable[[], None]]:
+    """Builds the preexec_fn that applies limits inside the child before exec."""
+    if os.name != "posix" or resource is None:
+        return None
+
+    def apply_limits() -> None:
+        if limits.niceness:
+            os.nice(limits.niceness)
+        if limits.cpu_seconds:
+            # Soft limit raises SIGXCPU, the hard limit one second later is a SIGKILL
+            resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1))
+        if limits.memory_bytes:
+            resource.setrlimit(resource.RLIMIT_AS, (limits.memory_bytes, limits.memory_bytes))
+        if limits.output_bytes:
+            resource.setrlimit(resource.RLIMIT_FSIZE, (limits.output_bytes, limits.output_bytes))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+    return apply_limits
+
+
+def kill_process_group(process: subprocess.Popen) -> None:
+    """Kills a sandboxed process together with anything it spawned (e.g. shell-escape children)."""
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+def describe_exit(returncode: int) -> Optional[str]:
+    """Explains exits caused by sandbox limits; returns None for ordinary exit codes."""
+    if returncode >= 0 or os.name != "posix":
+        return None
+    signum = -returncode
+    if signum == signal.SIGXCPU:
+        return "CPU time limit exceeded"
+    if signum == signal.SIGXFSZ:
+        return "output size limit exceeded"
+    if signum == signal.SIGKILL:
+        return "killed (CPU or memory limit exceeded)"
+    return f"terminated by signal {signum}"
+
+
+def run_sandboxed(
+    cmd: List[str],
+    cwd: Path,
+    limits: CompileLimits,
+    on_process: Optional[Callable[[subprocess.Popen], None]] = None,
+) -> Tuple[int, str]:
+    """
+    Runs cmd in its own process group with CPU, memory and output-size rlimits.
+    stdout is discarded; returns (returncode, stderr).
+    Raises SandboxTimeout after killing the process group if the wall deadline passes.
+    """
+    process = subprocess.Popen(
+        cmd, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        text=True, encoding="utf-8", errors="replace",
+        preexec_fn=_limit_setter(limits),
+        start_new_session=(os.name == "posix"),
+    )
+    if on_process is not None:
+        on_process(process)
+    try:
+        _, stderr = process.communicate(timeout=limits.wall_seconds or None)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process)
+        process.communicate()
+        raise SandboxTimeout(f"Process exceeded its {limits.wall_seconds:g}s deadline and was killed.")
+    except BaseException:
+        kill_process_group(process)
+        raise
+    return process.returncode, stderr or ""
+
+
+def _tmpfs_base_dir() -> str:
+    """Prefers a RAM-backed directory for workspaces, falling back to LATEX_WORK_DIR."""
+    candidate = settings.LATEX_SANDBOX_TMPFS_DIR
+    if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+        return candidate
+    return settings.LATEX_WORK_DIR
+
+
+class WorkspacePool:
+    '''
+        Fixed set of pre-created compile directories. A workspace is wiped when it
+        is returned, so compiles never pay for creating and deleting temp trees.
+        The pool size also caps how many one-off compiles run at the same time.
+    '''
+    def __init__(self, base_dir: str, size: int, acquire_timeout: float = 60.0):
+        Path(base_dir).mkdir(parents=True, exist_ok=True)
+        self.root_dir = Path(tempfile.mkdtemp(prefix="latex_workspaces_", dir=base_dir))
+        self.acquire_timeout = acquire_timeout
+        self._free: "queue.Queue[Path]" = queue.Queue()
+        for index in range(max(1, size)):
+            workspace = self.root_dir / f"ws{index}"
+            workspace.mkdir()
+            self._free.put(workspace)
+        self.size = max(1, size)
+        logger.info(f"WorkspacePool initialized with {self.size} workspaces in {self.root_dir}.")
+
+    @staticmethod
+    def _wipe(workspace: Path) -> None:
+        for entry in os.scandir(workspace):
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    @contextmanager
+    def acquire(self) -> Iterator[Path]:
+        """Lends out an empty workspace directory for the duration of the with-block."""
+        try:
+            workspace = self._free.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise WorkspaceUnavailable(f"No compile workspace became free within {self.acquire_timeout:g}s.") from None
+        try:
+            yield workspace
+        finally:
+            self._wipe(workspace)
+            self._free.put(workspace)
+
+    def close(self) -> None:
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+
+_cached_workspace_pool: Optional[WorkspacePool] = None
+# First use can come from several threadpool threads at once; a second pool would double the workspaces
+_workspace_pool_lock = threading.Lock()
+
+def get_workspace_pool() -> WorkspacePool:
+    """Returns the process-wide WorkspacePool instance."""
+    global _cached_workspace_pool
+
+    if _cached_workspace_pool is None:
+        with _workspace_pool_lock:
+            if _cached_workspace_pool is None:
+                pool = WorkspacePool(_tmpfs_base_dir(), size=settings.LATEX_SANDBOX_WORKSPACES)
+                atexit.register(pool.close)
+                _cached_workspace_pool = pool
+
+    return _cached_workspace_pool
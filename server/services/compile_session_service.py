@@ -0,0 +1,190 @@
+# server/services/compile_session_service.py
+
+import asyncio
+import logging
+import re
+import shutil
+import subprocess
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from . import pdf_service
+from .pdf_service import PDFGenerationError, OUTPUT_BASE_NAME
+from .latex_log_parser import LatexLogSummary
+from .compile_sandbox import kill_process_group
+
+logger = logging.getLogger(__name__)
+
+# Session ids come from the browser and become directory names
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class CompileSessionError(Exception):
+    """Raised for invalid compile session requests."""
+    pass
+
+class CompileSuperseded(Exception):
+    """Raised when a newer compile request for the same session replaced this one."""
+    pass
+
+
+class CompileSession:
+    '''
+        One live editor preview. Keeps a stable working directory so .aux files
+        carry over between runs, and makes sure only the newest request compiles.
+    '''
+    def __init__(self, session_id: str, work_dir: Path):
+        self.session_id = session_id
+        self.work_dir = work_dir
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.last_used = time.monotonic()
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._process: Optional[subprocess.Popen] = None
+
+    @property
+    def is_busy(self) -> bool:
+        return self._lock.locked()
+
+    def _track_process(self, process: subprocess.Popen) -> None:
+        self._process = process
+
+    def cancel_running(self) -> None:
+        """Kills the pdflatex process of the compile currently in progress, if any."""
+        process = self._process
+        if process is not None and process.poll() is None:
+            logger.info(f"Compile session {self.session_id}: killing stale pdflatex run (pid {process.pid}).")
+            kill_process_group(process)
+
+    def _discard_aux(self) -> None:
+        # A killed run can leave a truncated .aux behind, which would break the next pass
+        (self.work_dir / f"{OUTPUT_BASE_NAME}.aux").unlink(missing_ok=True)
+
+    async def compile(
+        self,
+        latex_content: str,
+        debounce_seconds: float = 0.0,
+        keep_raw_log: bool = False,
+        on_diagnostics: Optional[Callable[[LatexLogSummary], None]] = None,
+    ) -> bytes:
+        """
+        Compiles latex_content in this session's working directory.
+        Requests arriving within debounce_seconds of each other are coalesced:
+        only the newest one compiles, older ones raise CompileSuperseded.
+        """
+        self._generation += 1
+        generation = self._generation
+        self.last_used = time.monotonic()
+        self.cancel_running()
+
+        if debounce_seconds > 0:
+            await asyncio.sleep(debounce_seconds)
+        if generation != self._generation:
+            raise CompileSuperseded(f"Compile request superseded in session {self.session_id}.")
+
+        async with self._lock:
+            if generation != self._generation:
+                raise CompileSuperseded(f"Compile request superseded in session {self.session_id}.")
+            try:
+                pdf_path = await run_in_threadpool(
+                    pdf_service.run_pdflatex_passes,
+                    latex_content,
+                    self.work_dir,
+                    on_process=self._track_process,
+                    reuse_aux=True,
+                    keep_raw_log=keep_raw_log,
+                    on_diagnostics=on_diagnostics,
+                )
+                pdf_bytes = pdf_path.read_bytes()
+            except PDFGenerationError:
+                if generation != self._generation:
+                    self._discard_aux()
+                    raise CompileSuperseded(f"Compile request superseded in session {self.session_id}.") from None
+                raise
+            finally:
+                self._process = None
+                self.last_used = time.monotonic()
+
+        if generation != self._generation:
+            raise CompileSuperseded(f"Compile request superseded in session {self.session_id}.")
+        logger.info(f"Compile session {self.session_id}: produced PDF ({len(pdf_bytes)} bytes).")
+        return pdf_bytes
+
+
+class CompileSessionManager:
+    '''
+        Owns all live editor compile sessions and expires the idle ones: on every
+        request, and every sweep_interval_seconds from a background task that runs
+        while any session exists, so directories of closed editors do not linger.
+    '''
+    def __init__(
+        self,
+        root_dir: str,
+        idle_ttl_seconds: int = 900,
+        debounce_seconds: float = 0.3,
+        sweep_interval_seconds: float = 60.0,
+    ):
+        self.root_dir = Path(root_dir) / "sessions"
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.debounce_seconds = debounce_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._sessions: Dict[str, CompileSession] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        logger.info(f"CompileSessionManager initialized (root: {self.root_dir}).")
+
+    def get_session(self, session_id: str) -> CompileSession:
+        if not _SESSION_ID_PATTERN.match(session_id or ""):
+            raise CompileSessionError("session_id must be 1-64 characters of letters, digits, '-' or '_'.")
+        self.expire_idle()
+        session = self._sessions.get(session_id)
+        if session is None:
+            logger.info(f"Creating compile session {session_id}.")
+            session = CompileSession(session_id, self.root_dir / session_id)
+            self._sessions[session_id] = session
+        return session
+
+    async def compile(
+        self,
+        session_id: str,
+        latex_content: str,
+        keep_raw_log: bool = False,
+        on_diagnostics: Optional[Callable[[LatexLogSummary], None]] = None,
+    ) -> bytes:
+        session = self.get_session(session_id)
+        self._start_sweeper()
+        return await session.compile(
+            latex_content, debounce_seconds=self.debounce_seconds, keep_raw_log=keep_raw_log, on_diagnostics=on_diagnostics,
+        )
+
+    def close_session(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.cancel_running()
+        shutil.rmtree(session.work_dir, ignore_errors=True)
+        logger.info(f"Closed compile session {session_id}.")
+        return True
+
+    def _start_sweeper(self) -> None:
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self) -> None:
+        # Runs on the event loop like compile(); ends with the last session and restarts with the next
+        while self._sessions:
+            await asyncio.sleep(self.sweep_interval_seconds)
+            try:
+                self.expire_idle()
+            except Exception as e:
+                logger.warning(f"Compile session sweep failed: {e}")
+
+    def expire_idle(self) -> None:
+        """Removes sessions (and their working directories) idle for longer than the TTL."""
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if not session.is_busy and now - session.last_used > self.idle_ttl_seconds:
+                logger.info(f"Expiring idle compile session {session_id}.")
+                self.close_session(session_id)
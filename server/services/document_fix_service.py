@@ -0,0 +1,167 @@
+# server/services/document_fix_service.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, List, Optional
+
+from .ai_service import AIService
+
+logger = logging.getLogger(__name__)
+
+# Environments that hold exactly one problem and are fixed as a whole
+PROBLEM_ENVIRONMENTS = ("problem", "zadatak", "solution", "rjesenje")
+_PROBLEM_BEGIN = re.compile(r"\\begin\{(?P<env>" + "|".join(PROBLEM_ENVIRONMENTS) + r")\}")
+# An \item runs until the next \item, list boundary, problem environment or end of document
+_ITEM = re.compile(r"\\item\b")
+_ITEM_END = re.compile(
+    r"\\item\b|\\(?:begin|end)\{(?:enumerate|itemize|description)\}"
+    r"|\\begin\{(?:" + "|".join(PROBLEM_ENVIRONMENTS) + r")\}|\\end\{document\}"
+)
+
+ACTIONS = ("fix_latex", "fix_grammar")
+
+
+@dataclass
+class DocumentChunk:
+    index: int
+    text: str
+    fixable: bool # False for structure between items (preamble, list environments, ...)
+
+    @property
+    def hash(self) -> str:
+        return text_hash(self.text)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def split_document(latex: str) -> List[DocumentChunk]:
+    """
+    Splits LaTeX into \\item and problem-environment chunks plus the structure between them.
+    Concatenating the chunk texts always gives back the original document.
+    """
+    body_start = latex.find("\\begin{document}")
+    position = 0 if body_start < 0 else body_start
+    pieces = [(latex[:position], False)] if position else []
+
+    while position < len(latex):
+        env = _PROBLEM_BEGIN.search(latex, position)
+        item = _ITEM.search(latex, position)
+        starts = [m for m in (env, item) if m]
+        if not starts:
+            break
+        first = min(starts, key=lambda m: m.start())
+        if first.start() > position:
+            pieces.append((latex[position:first.start()], False))
+
+        if first is env:
+            end_marker = f"\\end{{{env.group('env')}}}"
+            end = latex.find(end_marker, env.end())
+            end = len(latex) if end < 0 else end + len(end_marker)
+        else:
+            next_boundary = _ITEM_END.search(latex, item.end())
+            end = next_boundary.start() if next_boundary else len(latex)
+        pieces.append((latex[first.start():end], True))
+        position = end
+
+    if position < len(latex):
+        pieces.append((latex[position:], False))
+    return [DocumentChunk(index, text, fixable) for index, (text, fixable) in enumerate(pieces) if text]
+
+
+def _split_whitespace(text: str):
+    core = text.strip()
+    if not core:
+        return text, "", ""
+    leading = text[:len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()):]
+    return leading, core, trailing
+
+
+class DocumentFixService:
+    '''
+        Fixes a whole document by sending its items to the LLM concurrently
+        (bounded by max_concurrency) and streaming results back in document order.
+        Outputs the service produced are remembered by hash, so chunks that are
+        already fixed are not sent again.
+    '''
+    def __init__(self, max_concurrency: int = 6, max_known_hashes: int = 10000):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_known_hashes = max_known_hashes
+        self._known_clean: "OrderedDict[str, None]" = OrderedDict()
+
+    def _remember_clean(self, action: str, text: str) -> None:
+        key = f"{action}:{text_hash(text)}"
+        self._known_clean[key] = None
+        self._known_clean.move_to_end(key)
+        while len(self._known_clean) > self.max_known_hashes:
+            self._known_clean.popitem(last=False)
+
+    def _is_known_clean(self, action: str, chunk: DocumentChunk, skip_hashes: set) -> bool:
+        return chunk.hash in skip_hashes or f"{action}:{chunk.hash}" in self._known_clean
+
+    async def _fix_chunk(self, ai_service: AIService, action: str, core: str, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            stream = await getattr(ai_service, action)(user_input=core)
+            return "".join([chunk async for chunk in stream]).strip()
+
+    async def fix_document(
+        self,
+        ai_service: AIService,
+        latex: str,
+        action: str = "fix_latex",
+        skip_hashes: Optional[Iterable[str]] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Yields one result per chunk, in document order, as soon as it and every chunk
+        before it are done. Joining the "fixed" fields gives the fixed document.
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Unsupported action '{action}'. Use one of: {', '.join(ACTIONS)}.")
+        skip = set(skip_hashes or ())
+        chunks = split_document(latex)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = {}
+        for chunk in chunks:
+            _, core, _ = _split_whitespace(chunk.text)
+            if chunk.fixable and core and not self._is_known_clean(action, chunk, skip):
+                tasks[chunk.index] = asyncio.create_task(self._fix_chunk(ai_service, action, core, semaphore))
+        logger.info(f"Document fix ({action}): {len(chunks)} chunks, {len(tasks)} sent to the model.")
+
+        try:
+            for chunk in chunks:
+                result = {"index": chunk.index, "hash": chunk.hash, "original": chunk.text, "fixed": chunk.text}
+                task = tasks.get(chunk.index)
+                if not chunk.fixable:
+                    result["status"] = "passthrough"
+                elif task is None:
+                    result["status"] = "skipped"
+                else:
+                    leading, _, trailing = _split_whitespace(chunk.text)
+                    try:
+                        fixed_core = await task
+                    except Exception as e:
+                        logger.warning(f"Document fix: chunk {chunk.index} failed: {e}")
+                        result.update(status="error", error=str(e))
+                    else:
+                        result["fixed"] = f"{leading}{fixed_core}{trailing}"
+                        result["status"] = "fixed" if fixed_core != chunk.text.strip() else "unchanged"
+                        self._remember_clean(action, fixed_core)
+                yield result
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    async def fix_document_ndjson(self, *args, **kwargs) -> AsyncIterator[str]:
+        """fix_document as newline-delimited JSON, ending with a summary line."""
+        counts = {}
+        async for result in self.fix_document(*args, **kwargs):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "counts": counts}) + "\n"
@@ -0,0 +1,164 @@
+# server/services/figure_cache.py
+
+import logging
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ..config import settings
+from .pdf_cache import PDFCache
+
+logger = logging.getLogger(__name__)
+
+# Figure environments compiled on their own and inlined as PDFs
+FIGURE_ENVIRONMENTS = ("tikzpicture", "tikzcd")
+_FIGURE = re.compile(
+    r"\\begin\{(?P<env>" + "|".join(FIGURE_ENVIRONMENTS) + r")\}.*?\\end\{(?P=env)\}",
+    re.DOTALL,
+)
+# Preamble lines a figure may depend on. Everything else (title, page layout, hyperref
+# metadata) is left out so the same figure hashes the same in every problemset.
+_PREAMBLE_KEEP = re.compile(
+    r"^\s*\\(?:usepackage|RequirePackage|usetikzlibrary|usepgfplotslibrary|tikzset|pgfplotsset"
+    r"|newcommand|renewcommand|providecommand|DeclareMathOperator|definecolor|colorlet)\b"
+)
+_PREAMBLE_SKIP_PACKAGES = re.compile(r"\{[^}]*\b(?:geometry|hyperref|fancyhdr|titlesec|inputenc)\b")
+_GRAPHICX_LOADED = re.compile(r"\\usepackage(?:\[[^\]]*\])?\{[^}]*\bgraphicx\b")
+_UNESCAPED_COMMENT = re.compile(r"(?<!\\)%")
+# Pictures that draw relative to the page cannot be compiled on their own
+_NOT_EXTERNALIZABLE = ("remember picture", "overlay")
+
+FigureCompiler = Callable[[str, Path], Path]
+
+
+def _figure_preamble(preamble: str) -> str:
+    kept: List[str] = []
+    for line in preamble.splitlines():
+        line = _UNESCAPED_COMMENT.split(line, 1)[0].rstrip()
+        if not _PREAMBLE_KEEP.match(line) or _PREAMBLE_SKIP_PACKAGES.search(line):
+            continue
+        if line.count("{") != line.count("}"):
+            continue # Multi-line definitions are not worth reconstructing
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def standalone_source(figure: str, preamble: str = "") -> str:
+    """Wraps one figure environment into a document that compiles to a tightly cropped PDF."""
+    return (
+        "\\documentclass[tikz]{standalone}\n"
+        f"{_figure_preamble(preamble)}\n"
+        "\\begin{document}\n"
+        f"{figure}\n"
+        "\\end{document}\n"
+    )
+
+
+def _is_commented_out(source: str, position: int) -> bool:
+    line_start = source.rfind("\n", 0, position) + 1
+    return bool(_UNESCAPED_COMMENT.search(source, line_start, position))
+
+
+def _link_into(cached_path: Path, target: Path) -> None:
+    target.unlink(missing_ok=True)
+    try:
+        os.symlink(cached_path, target)
+    except OSError:
+        shutil.copyfile(cached_path, target)
+
+
+class FigureExternalizer:
+    '''
+        Replaces figure environments with \\includegraphics of PDFs compiled once per
+        distinct figure and kept in a shared content-addressed cache.
+    '''
+    def __init__(self, cache: PDFCache, failure_ttl_seconds: float = 3600.0, clock=time.monotonic):
+        self.cache = cache
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.clock = clock
+        self._failed: Dict[str, float] = {} # Figures with LaTeX errors standalone -> when to retry; kept inline until then
+
+    def _cached_figure(self, source: str, work_dir: Path, compile_figure: FigureCompiler) -> Optional[Path]:
+        key = self.cache.key_for(source)
+        cached_path = self.cache.get(key)
+        if cached_path or self._failed.get(key, 0.0) > self.clock():
+            return cached_path
+
+        with self.cache.lock_for(key):
+            cached_path = self.cache.get(key)
+            if cached_path:
+                return cached_path
+            figure_dir = work_dir / "_figures" / key[:16]
+            figure_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                logger.info(f"Figure cache miss: {key[:12]}, compiling standalone.")
+                return self.cache.store(key, compile_figure(source, figure_dir))
+            except Exception as e:
+                logger.warning(f"Figure {key[:12]} could not be externalized, keeping it inline: {e}")
+                # Only LaTeX errors repeat on every compile; timeouts and a busy pool may not
+                diagnostics = getattr(e, "diagnostics", None)
+                if diagnostics is not None and diagnostics.errors:
+                    if len(self._failed) > 1000:
+                        self._failed.clear()
+                    self._failed[key] = self.clock() + self.failure_ttl_seconds
+                return None
+            finally:
+                shutil.rmtree(figure_dir, ignore_errors=True)
+
+    def externalize(self, latex_content: str, work_dir: Path, compile_figure: FigureCompiler) -> str:
+        """
+        Returns latex_content with every externalizable figure in the document body
+        replaced by \\includegraphics of its cached PDF, linked into work_dir.
+        Line numbers are kept, so pdflatex diagnostics point at the original source.
+        compile_figure(source, directory) compiles a standalone document and returns the PDF path.
+        """
+        body_start = latex_content.find("\\begin{document}")
+        if body_start < 0 or not _FIGURE.search(latex_content, body_start):
+            return latex_content
+        preamble = latex_content[:body_start]
+
+        parts: List[str] = []
+        position = body_start
+        replaced = 0
+        for match in _FIGURE.finditer(latex_content, body_start):
+            figure = match.group(0)
+            if _is_commented_out(latex_content, match.start()) or any(marker in figure for marker in _NOT_EXTERNALIZABLE):
+                continue
+            cached_path = self._cached_figure(standalone_source(figure, preamble), work_dir, compile_figure)
+            if cached_path is None:
+                continue
+            local_name = f"fig-{cached_path.stem[:16]}.pdf"
+            _link_into(cached_path, work_dir / local_name)
+            parts.append(latex_content[position:match.start()])
+            # One comment line per removed line break: same line count, no added space or paragraph,
+            # and text after \\end{...} stays on its line
+            parts.append("%\n" * figure.count("\n") + f"\\includegraphics{{{local_name}}}")
+            position = match.end()
+            replaced += 1
+
+        if not replaced:
+            return latex_content
+        parts.append(latex_content[position:])
+        if not _GRAPHICX_LOADED.search(preamble):
+            preamble += "\\usepackage{graphicx}" # On the \\begin{document} line, so no line is added
+        logger.info(f"Externalized {replaced} figure(s).")
+        return preamble + "".join(parts)
+
+
+_cached_figure_externalizer: Optional[FigureExternalizer] = None
+
+def get_figure_externalizer() -> FigureExternalizer:
+    """Returns the process-wide FigureExternalizer backed by the shared figure cache."""
+    global _cached_figure_externalizer
+
+    if _cached_figure_externalizer is None:
+        cache = PDFCache(
+            settings.LATEX_WORK_DIR, max_bytes=settings.FIGURE_CACHE_MAX_BYTES,
+            subdir="figure_cache", linearize=False,
+        )
+        _cached_figure_externalizer = FigureExternalizer(cache)
+
+    return _cached_figure_externalizer
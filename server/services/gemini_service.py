@@ -1,12 +1,19 @@
+import asyncio
+import hashlib
 import logging
 import json
 from typing import Dict, Any, AsyncIterator, List, Tuple, Optional
 
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
 
 
 from ..config import settings
+from .llm_providers import GeminiProvider, LLMProvider
+from .llm_scheduler import INTERACTIVE, LLMScheduler, estimate_tokens
+from .llm_telemetry import LLMCallRecord
+from .prompt_cache import PromptPrefixManager
 
 logger = logging.getLogger(__name__)
 
@@ -27,15 +34,141 @@ class GeminiResponseValidationError(GeminiServiceError):
      pass
 
 
+def _normalize_text(text: Optional[str]) -> Optional[str]:
+    # Line endings and surrounding whitespace do not change what the model is asked
+    return text.replace("\r\n", "\n").strip() if text is not None else None
+
+def _request_key(
+    model: str,
+    system_prompt: str,
+    user_input_text: Optional[str],
+    user_input_bytes: Optional[bytes],
+    user_input_bytes_mime_type: Optional[str],
+    shots: Optional[List[Tuple[str, str]]],
+    temperature: float,
+    top_p: float,
+    thinking_budget: Optional[int],
+    response_mime_type: str,
+    response_schema: Optional[types.Schema],
+) -> str:
+    """Hash identifying everything that determines a model response."""
+    material = json.dumps({
+        "model": model,
+        "system_prompt": system_prompt,
+        "shots": shots or [],
+        "text": _normalize_text(user_input_text),
+        "bytes": hashlib.sha256(user_input_bytes).hexdigest() if user_input_bytes is not None else None,
+        "mime": user_input_bytes_mime_type,
+        "temperature": temperature,
+        "top_p": top_p,
+        "thinking_budget": thinking_budget,
+        "response_mime_type": response_mime_type,
+        "response_schema": response_schema.model_dump_json(exclude_none=True) if response_schema is not None else None,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    '''
+        One upstream stream and the chunks it produced so far.
+    '''
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class _SingleFlight:
+    '''
+        Coalesces identical concurrent streams: the first caller starts the upstream
+        stream, later callers with the same key attach to it and first receive the
+        chunks buffered so far. If every subscriber leaves, the upstream stream is cancelled.
+    '''
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    async def _run(self, key: str, flight: _Flight, produce) -> None:
+        try:
+            async for chunk in produce():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except BaseException as e: # Includes cancellation, which subscribers must also see
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.notify()
+
+    async def subscribe(self, key: str, produce) -> AsyncIterator[str]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, produce))
+        else:
+            logger.info(f"Joining in-flight Gemini stream {key[:12]} ({len(flight.chunks)} chunks buffered).")
+        flight.subscribers += 1
+
+        position = 0
+        try:
+            while True:
+                changed = flight._changed
+                while position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        if isinstance(flight.error, asyncio.CancelledError):
+                            raise GeminiServiceError("Upstream Gemini stream was cancelled.")
+                        raise flight.error
+                    return
+                await changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                logger.info(f"All subscribers left Gemini stream {key[:12]}, cancelling it.")
+                flight.task.cancel()
+
+
 class GeminiService:
     '''
         Low-level wrapper around the client for streaming.
+        Upstream calls go to provider (the Gemini API on client by default, see llm_providers).
+        With a scheduler, upstream calls are admitted under its quotas and retried on
+        retryable errors (see LLMScheduler). System prompts and few-shot pairs are
+        built once per action and, with prompt_cache enabled, sent as provider-side
+        cached content (see PromptPrefixManager).
     '''
-    def __init__(self, client: genai.Client):
+    def __init__(
+        self,
+        client: Optional[genai.Client] = None,
+        coalesce: bool = True,
+        scheduler: Optional[LLMScheduler] = None,
+        provider: Optional[LLMProvider] = None,
+        prompt_cache: Optional[PromptPrefixManager] = None,
+    ):
+        if provider is None and client is None:
+            raise ValueError("GeminiService needs a client or a provider.")
         self.client = client
-        logger.info("GeminiService initialized.")
+        self.provider = provider or GeminiProvider(client)
+        self.coalesce = coalesce
+        self.scheduler = scheduler
+        self.prompt_cache = prompt_cache or PromptPrefixManager(self.provider, enabled=False)
+        self._flights = _SingleFlight()
+        logger.info(f"GeminiService initialized (provider: {self.provider.name}).")
 
-    async def stream(
+    def stream(
         self,
         model: str,
         system_prompt: str,
@@ -48,22 +181,56 @@ class GeminiService:
         thinking_budget: Optional[int] = None,
         response_mime_type: str = "text/plain",
         response_schema: Optional[types.Schema] = None, # might not work with other llms
+        priority: int = INTERACTIVE, # scheduler lane, see llm_scheduler
+        record: Optional[LLMCallRecord] = None, # telemetry of the calling action, see llm_telemetry
+        coalesce: bool = True, # False always makes a new upstream request (hedges, see llm_router)
     ) -> AsyncIterator[str]:
         '''
-            Build contents from system prompt, few-shot pairs, and user input,
-            then stream text chunks from Gemini.
+            Stream text chunks from Gemini. Identical requests that overlap in time
+            share one upstream stream (see _SingleFlight).
         '''
-        contents: List[types.Content] = []
+        request = dict(
+            model=model,
+            system_prompt=system_prompt,
+            user_input_text=user_input_text,
+            user_input_bytes=user_input_bytes,
+            user_input_bytes_mime_type=user_input_bytes_mime_type,
+            shots=shots,
+            temperature=temperature,
+            top_p=top_p,
+            thinking_budget=thinking_budget,
+            response_mime_type=response_mime_type,
+            response_schema=response_schema,
+        )
+        if not (self.coalesce and coalesce):
+            return self._stream_upstream(**request, priority=priority, record=record)
+        key = _request_key(**request)
+        if record is not None and self._flights.in_flight(key):
+            record.source = "coalesced" # The leader's record gets the token usage
+        return self._flights.subscribe(key, lambda: self._stream_upstream(**request, priority=priority, record=record))
 
-        # Add few-shot examples
-        if shots:
-            for user_ex, model_ex in shots:
-                contents.append(
-                    types.Content(role="user", parts=[types.Part.from_text(text=user_ex)])
-                )
-                contents.append(
-                    types.Content(role="model", parts=[types.Part.from_text(text=model_ex)])
-                )
+    async def _stream_upstream(
+        self,
+        model: str,
+        system_prompt: str,
+        user_input_text: Optional[str] = None,
+        user_input_bytes: Optional[bytes] = None,
+        user_input_bytes_mime_type: Optional[str] = None,
+        shots: Optional[List[Tuple[str, str]]] = None, # list of (user_example, model_example)
+        temperature: float = 0.0,
+        top_p: float = 1.0,
+        thinking_budget: Optional[int] = None,
+        response_mime_type: str = "text/plain",
+        response_schema: Optional[types.Schema] = None, # might not work with other llms
+        priority: int = INTERACTIVE,
+        record: Optional[LLMCallRecord] = None,
+    ) -> AsyncIterator[str]:
+        '''
+            Build contents from the prompt prefix (system prompt and few-shot pairs)
+            and user input, then stream text chunks from Gemini. When the prefix is
+            held as cached content only the user turn is sent.
+        '''
+        prefix = self.prompt_cache.prefix(model, system_prompt, shots)
 
         # Add final user input
         final_user_parts: List[types.Part] = []
@@ -89,12 +256,9 @@ class GeminiService:
                 "The final user message must contain content. "
                 "Provide either user_input_text or user_input_image (with user_input_image_mime_type)."
             )
-        
-        contents.append(types.Content(role="user", parts=final_user_parts))
-        
+        user_turn = types.Content(role="user", parts=final_user_parts)
 
         # Build GenerateContentConfig
-        system_prompt = [types.Part.from_text(text=system_prompt)]
         thinking_config = types.ThinkingConfig(thinking_budget=thinking_budget or 0)
 
         config_kwargs = {
@@ -102,32 +266,33 @@ class GeminiService:
             "top_p": top_p,
             "thinking_config": thinking_config,
             "response_mime_type": response_mime_type,
-            "system_instruction": system_prompt
         }
         if response_schema is not None:
             config_kwargs["response_schema"] = response_schema
-        gen_config = types.GenerateContentConfig(**config_kwargs)
+        cost = estimate_tokens(user_input_text, images=int(user_input_bytes is not None)) + prefix.tokens
 
-        response_stream = await self.client.aio.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=gen_config,
-        )
-
-        # Call Gemini streaming API
-        async for chunk in response_stream:
-            text_to_yield = None # Initialized to None
-            if hasattr(chunk, 'text') and chunk.text:
-                text_to_yield = chunk.text
-            elif hasattr(chunk, 'candidates') and chunk.candidates and \
-                    hasattr(chunk.candidates[0], 'content') and chunk.candidates[0].content and \
-                    hasattr(chunk.candidates[0].content, 'parts') and chunk.candidates[0].content.parts:
-                part_texts = [part.text for part in chunk.candidates[0].content.parts if hasattr(part, 'text')]
-                if part_texts: # This condition is important
-                    text_to_yield = "".join(part_texts)
-            
-            if text_to_yield is not None: # This condition ensures we only yield actual text
-                yield text_to_yield
+        def generate(cache_name: Optional[str]) -> AsyncIterator[str]:
+            if cache_name is not None:
+                # Cached content already holds the system instruction and shots
+                contents = [user_turn]
+                gen_config = types.GenerateContentConfig(**config_kwargs, cached_content=cache_name)
             else:
-                # This else block means if text_to_yield is STILL None, nothing is yielded FOR THIS CHUNK
-                logger.debug(f"Received chunk with no text content: {chunk.to_dict() if hasattr(chunk, 'to_dict') else chunk}")
+                contents = prefix.shot_contents + [user_turn]
+                gen_config = types.GenerateContentConfig(**config_kwargs, system_instruction=prefix.system_instruction)
+            if self.scheduler is None:
+                return self.provider.generate(model, contents, gen_config, record)
+            return self.scheduler.stream(model, lambda: self.provider.generate(model, contents, gen_config, record), priority=priority, cost=cost)
+
+        cache_name = await self.prompt_cache.cache_name(prefix)
+        started = False
+        try:
+            async for chunk in generate(cache_name):
+                started = True
+                yield chunk
+        except genai_errors.APIError as e:
+            # Cached content can disappear before our expiry (deleted, or expired early)
+            if cache_name is None or started or e.code not in (400, 403, 404):
+                raise
+            self.prompt_cache.invalidate(prefix)
+            async for chunk in generate(None):
+                yield chunk
@@ -0,0 +1,165 @@
+# server/services/image_preprocessing.py
+
+import asyncio
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Pixels darker than this (after inverting, brighter) count as content when cropping margins
+MARGIN_THRESHOLD = 40
+MARGIN_PADDING = 16
+
+
+class ImageTooLarge(Exception):
+    """The image has more pixels than Pillow will decode (Image.MAX_IMAGE_PIXELS)."""
+    pass
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    hash: str # sha256 of data, i.e. of the bytes actually sent to the model
+    original_size: int
+    processed: bool
+
+
+def _digest(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def _crop_margins(image: Image.Image) -> Image.Image:
+    mask = ImageOps.invert(image).point(lambda p: 255 if p > MARGIN_THRESHOLD else 0)
+    box = mask.getbbox()
+    if box is None:
+        return image
+    left, top, right, bottom = box
+    return image.crop((
+        max(0, left - MARGIN_PADDING),
+        max(0, top - MARGIN_PADDING),
+        min(image.width, right + MARGIN_PADDING),
+        min(image.height, bottom + MARGIN_PADDING),
+    ))
+
+
+def _encode(image: Image.Image, jpeg_quality: int) -> Tuple[bytes, str]:
+    """Smaller of grayscale PNG (clean screenshots, scans) and JPEG (photos)."""
+    png, jpeg = io.BytesIO(), io.BytesIO()
+    image.save(png, "PNG", compress_level=6) # optimize=True is ~10x slower for a few % smaller
+    image.save(jpeg, "JPEG", quality=jpeg_quality, optimize=True)
+    if png.tell() <= jpeg.tell():
+        return png.getvalue(), "image/png"
+    return jpeg.getvalue(), "image/jpeg"
+
+
+def prepare_image(
+    data: bytes,
+    mime_type: str,
+    max_side: int = settings.IMAGE_MAX_SIDE,
+    jpeg_quality: int = settings.IMAGE_JPEG_QUALITY,
+) -> PreparedImage:
+    """
+    Shrinks an uploaded image before it is sent to the model: applies the EXIF
+    orientation, converts to grayscale, crops blank margins, downscales so the
+    longer side is at most max_side and re-encodes compactly.
+    Images Pillow cannot decode are passed through unchanged; images too large
+    to decode safely (decompression bombs) raise ImageTooLarge.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as opened:
+            # JPEGs decode straight to grayscale at a reduced scale (still >= max_side), much faster for phone photos
+            opened.draft("L", (max_side, max_side))
+            image = ImageOps.exif_transpose(opened).convert("L")
+    except Image.DecompressionBombError as e:
+        logger.warning(f"Rejected {mime_type} image ({len(data)} bytes): {e}")
+        raise ImageTooLarge(str(e)) from e
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.warning(f"Image preprocessing skipped, could not decode {mime_type} ({len(data)} bytes): {e}")
+        return PreparedImage(data, mime_type, _digest(data), len(data), processed=False)
+
+    image = _crop_margins(image)
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    encoded, encoded_mime = _encode(image, jpeg_quality)
+    logger.info(f"Preprocessed image: {len(data)} -> {len(encoded)} bytes ({image.width}x{image.height} {encoded_mime}).")
+    return PreparedImage(encoded, encoded_mime, _digest(encoded), len(data), processed=True)
+
+
+class ImageResultCache:
+    '''
+        LRU cache of model outputs for images, keyed by the digest of the preprocessed
+        bytes, so uploading the same picture again finds the earlier result. Matching is
+        exact on purpose: worksheets that differ by a single symbol look alike to any
+        perceptual hash but must not share a transcription. Entries are stored as
+        streamed chunks, like AIResponseCache.
+    '''
+    def __init__(self, max_entries: int = 500):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        logger.info(f"ImageResultCache initialized (max_entries: {max_entries}).")
+
+    def get(self, namespace: str, image_hash: str) -> Optional[List[str]]:
+        with self._lock:
+            key = (namespace, image_hash)
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, namespace: str, image_hash: str, chunks: List[str]) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[(namespace, image_hash)] = list(chunks)
+            self._entries.move_to_end((namespace, image_hash))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def _record(self, namespace: str, image_hash: str, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        chunks: List[str] = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        if "".join(chunks).strip(): # Never cache an empty answer
+            self.put(namespace, image_hash, chunks)
+
+    @staticmethod
+    async def _replay(chunks: List[str]) -> AsyncIterator[str]:
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(0)
+
+    def stream(self, namespace: str, image_hash: str, produce) -> AsyncIterator[str]:
+        """Replays the cached output for an identical image, or calls produce() and caches what it streams."""
+        chunks = self.get(namespace, image_hash)
+        if chunks is not None:
+            logger.info(f"Image result cache hit: {namespace} {image_hash[:19]}")
+            return self._replay(chunks)
+        return self._record(namespace, image_hash, produce())
+
+
+_cached_image_result_cache: Optional[ImageResultCache] = None
+
+def get_image_result_cache() -> ImageResultCache:
+    """Returns the process-wide ImageResultCache instance."""
+    global _cached_image_result_cache
+
+    if _cached_image_result_cache is None:
+        _cached_image_result_cache = ImageResultCache(max_entries=settings.IMAGE_CACHE_MAX_ENTRIES)
+
+    return _cached_image_result_cache
@@ -0,0 +1,208 @@
+# server/services/json_stream.py
+
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, List, Optional, Tuple, Union
+
+_WHITESPACE = " \t\r\n"
+_LITERAL_END = ",}]" + _WHITESPACE
+
+PathElement = Union[str, int]
+
+
+class JSONStreamError(ValueError):
+    """Raised when streamed text cannot be valid JSON."""
+    pass
+
+
+@dataclass
+class JSONEvent:
+    path: Tuple[PathElement, ...] # () for the whole document, ("problems_latex", 0) for an array element
+    value: Any
+
+    @property
+    def key(self) -> Optional[PathElement]:
+        return self.path[0] if self.path else None
+
+    @property
+    def index(self) -> Optional[int]:
+        return self.path[-1] if self.path and isinstance(self.path[-1], int) else None
+
+
+@dataclass
+class _Frame:
+    container: Union[dict, list]
+    path: Tuple[PathElement, ...]
+    key: Optional[str] = None # Key whose value is being read, for objects
+
+
+class StreamingJSONParser:
+    '''
+        Incremental JSON parser for text that arrives in chunks (structured LLM output).
+        feed() returns a JSONEvent for every value that has just become complete: each
+        field of an object, each element of an array, at any nesting depth up to
+        max_depth (None for all), and finally the whole document with path ().
+        Works for any response_schema, since it only follows JSON syntax.
+    '''
+    def __init__(self, max_depth: Optional[int] = None):
+        self.max_depth = max_depth
+        self.buffer = ""
+        self.pos = 0
+        self.state = "value"
+        self.done = False
+        self.result: Any = None
+        self._stack: List[_Frame] = []
+
+    def feed(self, text: str) -> List[JSONEvent]:
+        # Drop what is already consumed so the buffer only holds the unfinished token
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        events: List[JSONEvent] = []
+        while self._step(events):
+            pass
+        return events
+
+    def close(self) -> Any:
+        """Returns the whole document; raises JSONStreamError if the stream ended early."""
+        rest = self.buffer[self.pos:].strip()
+        if not self.done and not self._stack and rest:
+            # A bare number or literal at the top level has no delimiter after it
+            self.pos = len(self.buffer)
+            self._complete(self._loads(rest), [])
+            rest = ""
+        if not self.done:
+            raise JSONStreamError(f"JSON stream ended before the document was complete (open containers: {len(self._stack)}).")
+        if rest:
+            raise JSONStreamError("Unexpected data after the end of the JSON document.")
+        return self.result
+
+    def _next_char(self) -> Optional[str]:
+        while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+            self.pos += 1
+        return self.buffer[self.pos] if self.pos < len(self.buffer) else None
+
+    def _expect(self, char: str, allowed: str) -> None:
+        if char not in allowed:
+            raise JSONStreamError(f"Expected one of {allowed!r}, got {char!r} (state: {self.state}).")
+
+    def _child_path(self) -> Tuple[PathElement, ...]:
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict):
+            return frame.path + (frame.key,)
+        return frame.path + (len(frame.container),)
+
+    def _emit(self, path: Tuple[PathElement, ...], value: Any, events: List[JSONEvent]) -> None:
+        if self.max_depth is None or len(path) <= self.max_depth or not path:
+            events.append(JSONEvent(path, value))
+
+    def _complete(self, value: Any, events: List[JSONEvent]) -> None:
+        """Stores a finished value in its parent (or as the result) and emits its event."""
+        if not self._stack:
+            self.result = value
+            self.done = True
+            self._emit((), value, events)
+            return
+        path = self._child_path()
+        frame = self._stack[-1]
+        if isinstance(frame.container, dict):
+            frame.container[frame.key] = value
+        else:
+            frame.container.append(value)
+        self.state = "separator"
+        self._emit(path, value, events)
+
+    def _step(self, events: List[JSONEvent]) -> bool:
+        """Advances over one token; False when more input is needed."""
+        if self.done:
+            return False
+        char = self._next_char()
+        if char is None:
+            return False
+
+        if self.state in ("first_key", "first_item"):
+            closing = "}" if self.state == "first_key" else "]"
+            if char == closing:
+                self.pos += 1
+                self._close_container(events)
+                return True
+            self.state = "key" if self.state == "first_key" else "value"
+            return True
+
+        if self.state == "value":
+            if char in "{[":
+                path = self._child_path() if self._stack else ()
+                self._stack.append(_Frame({} if char == "{" else [], path))
+                self.pos += 1
+                self.state = "first_key" if char == "{" else "first_item"
+                return True
+            end = self._token_end(self.pos)
+            if end is None:
+                return False
+            value = self._loads(self.buffer[self.pos:end])
+            self.pos = end
+            self._complete(value, events)
+        elif self.state == "key":
+            self._expect(char, '"')
+            end = self._token_end(self.pos)
+            if end is None:
+                return False
+            self._stack[-1].key = self._loads(self.buffer[self.pos:end])
+            self.pos = end
+            self.state = "colon"
+        elif self.state == "colon":
+            self._expect(char, ":")
+            self.pos += 1
+            self.state = "value"
+        elif self.state == "separator":
+            is_object = isinstance(self._stack[-1].container, dict)
+            self._expect(char, ",}" if is_object else ",]")
+            self.pos += 1
+            if char == ",":
+                self.state = "key" if is_object else "value"
+            else:
+                self._close_container(events)
+        return True
+
+    def _close_container(self, events: List[JSONEvent]) -> None:
+        frame = self._stack.pop()
+        self._complete(frame.container, events)
+
+    def _loads(self, text: str) -> Any:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(f"Invalid JSON token {text[:40]!r}: {e}")
+
+    def _token_end(self, start: int) -> Optional[int]:
+        """End offset of the string, number or literal starting at start, or None if it is still streaming."""
+        buffer = self.buffer
+        if buffer[start] == '"':
+            i = start + 1
+            while i < len(buffer):
+                if buffer[i] == "\\":
+                    i += 2
+                    continue
+                if buffer[i] == '"':
+                    return i + 1
+                i += 1
+            return None
+        # Numbers and literals end at the next delimiter, which must already have arrived
+        i = start
+        while i < len(buffer) and buffer[i] not in _LITERAL_END:
+            i += 1
+        return i if i < len(buffer) else None
+
+
+async def json_events(stream: AsyncIterator[str], max_depth: Optional[int] = None) -> AsyncIterator[JSONEvent]:
+    """
+    Parses a text stream (e.g. GeminiService.stream with response_mime_type="application/json")
+    and yields JSONEvents as values complete. Raises JSONStreamError if the stream ends early.
+    """
+    parser = StreamingJSONParser(max_depth=max_depth)
+    async for chunk in stream:
+        for event in parser.feed(chunk):
+            yield event
+    finished = parser.done
+    result = parser.close()
+    if not finished: # Bare top-level number or literal, only complete at the end of the stream
+        yield JSONEvent((), result)
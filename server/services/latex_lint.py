@@ -0,0 +1,176 @@
+# server/services/latex_lint.py
+
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from ..config import settings
+from .latex_log_parser import LatexDiagnostic, LatexLogSummary
+
+logger = logging.getLogger(__name__)
+
+# One token per match: \begin{env}, \end{env}, \verb|..|, \url{..} (and \href's URL), any escaped char, or a special char
+_TOKEN = re.compile(
+    r"\\(?P<kind>begin|end)\s*\{(?P<env>[^{}]*)\}"
+    r"|\\verb\*?(?P<delim>[^\sA-Za-z*]).*?(?P=delim)"
+    r"|\\(?:url|path|href)\{[^{}]*\}" # May contain % (URL escapes), which is not a comment there
+    r"|\\[A-Za-z@]+|\\."
+    r"|\$\$|[{}$%]"
+)
+# Environments whose content is not parsed as LaTeX
+_VERBATIM_ENVS = {"verbatim", "verbatim*", "lstlisting", "minted", "comment", "Verbatim"}
+
+MAX_LINT_DIAGNOSTICS = 20
+
+
+class LatexValidationError(Exception):
+    """Raised when LaTeX input fails static validation before compilation."""
+    def __init__(self, message, diagnostics: LatexLogSummary):
+        super().__init__(message)
+        self.diagnostics = diagnostics
+
+
+def _error(message: str, line: int, context: Optional[str] = None) -> LatexDiagnostic:
+    return LatexDiagnostic(severity="error", message=message, line=line, context=context)
+
+
+def _warning(message: str, line: int, context: Optional[str] = None) -> LatexDiagnostic:
+    return LatexDiagnostic(severity="warning", message=message, line=line, context=context)
+
+
+def check_latex(source: str, require_document: bool = True) -> List[LatexDiagnostic]:
+    """
+    Cheap static checks that catch documents pdflatex can never compile:
+    brace balance, \\begin/\\end matching, unbalanced $ / $$ and, for full documents,
+    missing \\documentclass, \\begin{document} or \\end{document}.
+    Environment and math checks only apply after \\begin{document}, because macro
+    definitions in the preamble legitimately contain unbalanced pieces.
+    Only findings a macro or verbatim-like construct cannot explain are errors
+    (missing \\documentclass / \\begin{document}, mismatched \\end); brace, math and
+    unclosed-environment findings are warnings.
+    Returns diagnostics with 1-based line numbers; an empty list means no problems found.
+    """
+    diagnostics: List[LatexDiagnostic] = []
+    brace_stack: List[int] = [] # line numbers of unclosed "{"
+    env_stack: List[Tuple[str, int]] = []
+    math_open: Optional[Tuple[str, int]] = None # ("$" or "$$", line)
+    verbatim_env: Optional[str] = None
+    seen_documentclass = False
+    in_body = not require_document
+    seen_begin_document = False
+    seen_end_document = False
+
+    for line_no, line in enumerate(source.splitlines(), start=1):
+        if len(diagnostics) >= MAX_LINT_DIAGNOSTICS:
+            break
+
+        if verbatim_env is not None:
+            if f"\\end{{{verbatim_env}}}" in line:
+                verbatim_env = None
+            continue
+
+        # A blank line ends the paragraph, which inline or display math may not span
+        if not line.strip():
+            if math_open is not None:
+                delim, opened_at = math_open
+                diagnostics.append(_warning(f"Unclosed math mode '{delim}' opened on line {opened_at} (paragraph ended).", opened_at))
+                math_open = None
+            continue
+
+        skip_until = 0 # End of a verbatim environment that opened and closed on this line
+        for match in _TOKEN.finditer(line):
+            if match.start() < skip_until:
+                continue
+            token = match.group(0)
+            if token == "%":
+                break # Rest of the line is a comment
+
+            kind = match.group("kind")
+            if kind:
+                env = match.group("env").strip()
+                if env == "document":
+                    if kind == "begin":
+                        seen_begin_document = in_body = True
+                    else:
+                        seen_end_document = True
+                        in_body = False
+                    continue
+                if not in_body:
+                    continue
+                if kind == "begin":
+                    if env in _VERBATIM_ENVS:
+                        end = line.find(f"\\end{{{env}}}", match.end())
+                        if end >= 0:
+                            skip_until = end + len(f"\\end{{{env}}}")
+                            continue
+                        verbatim_env = env
+                        break
+                    env_stack.append((env, line_no))
+                elif not env_stack:
+                    diagnostics.append(_error(f"\\end{{{env}}} without matching \\begin{{{env}}}.", line_no, line.strip()))
+                else:
+                    open_env, opened_at = env_stack.pop()
+                    if open_env != env:
+                        diagnostics.append(_error(
+                            f"\\end{{{env}}} does not match \\begin{{{open_env}}} on line {opened_at}.",
+                            line_no, line.strip(),
+                        ))
+                continue
+
+            if token == "\\documentclass":
+                seen_documentclass = True
+            elif token == "{":
+                brace_stack.append(line_no)
+            elif token == "}":
+                if brace_stack:
+                    brace_stack.pop()
+                else:
+                    diagnostics.append(_warning("Unmatched closing brace '}'.", line_no, line.strip()))
+            elif token in ("$", "$$") and in_body:
+                if math_open is None:
+                    math_open = (token, line_no)
+                elif math_open[0] == token:
+                    math_open = None
+                else:
+                    diagnostics.append(_warning(f"'{token}' closes math mode opened with '{math_open[0]}' on line {math_open[1]}.", line_no, line.strip()))
+                    math_open = None
+
+    if len(diagnostics) < MAX_LINT_DIAGNOSTICS:
+        if math_open is not None:
+            diagnostics.append(_warning(f"Unclosed math mode '{math_open[0]}'.", math_open[1]))
+        for env, opened_at in env_stack:
+            diagnostics.append(_warning(f"\\begin{{{env}}} is never closed.", opened_at))
+        if brace_stack:
+            diagnostics.append(_warning(f"{len(brace_stack)} unclosed '{{' (first on line {brace_stack[0]}).", brace_stack[0]))
+        if require_document:
+            if not seen_documentclass:
+                diagnostics.append(_error("Missing \\documentclass.", 1))
+            if not seen_begin_document:
+                diagnostics.append(_error("Missing \\begin{document}.", 1))
+            elif not seen_end_document:
+                diagnostics.append(_warning("Missing \\end{document}.", len(source.splitlines()) or 1))
+
+    return diagnostics[:MAX_LINT_DIAGNOSTICS]
+
+
+def lint_errors(source: str, require_document: bool = True) -> List[LatexDiagnostic]:
+    """The blocking findings of check_latex; none while LATEX_LINT_ENABLED is off. Warnings are only logged."""
+    if not settings.LATEX_LINT_ENABLED:
+        return []
+    diagnostics = check_latex(source, require_document=require_document)
+    warnings = [d for d in diagnostics if d.severity == "warning"]
+    if warnings:
+        logger.info(f"LaTeX static validation: {len(warnings)} warnings, first: {warnings[0].message} (line {warnings[0].line})")
+    return [d for d in diagnostics if d.severity == "error"]
+
+
+def validate_latex(source: str, require_document: bool = True) -> None:
+    """Raises LatexValidationError if check_latex found errors; warnings are left to pdflatex."""
+    errors = lint_errors(source, require_document=require_document)
+    if errors:
+        first = errors[0]
+        logger.info(f"LaTeX rejected by static validation: {first.message} (line {first.line})")
+        raise LatexValidationError(
+            f"LaTeX validation failed: {first.message}",
+            diagnostics=LatexLogSummary(errors=errors),
+        )
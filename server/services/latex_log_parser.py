@@ -0,0 +1,206 @@
+# server/services/latex_log_parser.py
+
+import logging
+import re
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# "-file-line-error" style: ./problemset_output.tex:12: Undefined control sequence.
+_FILE_LINE_ERROR = re.compile(r"^(?P<file>[^\s:]*\.[A-Za-z]+):(?P<line>\d+): (?P<message>.*)$")
+# Classic style error start: ! Undefined control sequence.
+_BANG_ERROR = re.compile(r"^! (?P<message>.*)$")
+# Line marker following an error: l.12 \foo
+_LINE_MARKER = re.compile(r"^l\.(?P<line>\d+) ?(?P<context>.*)$")
+_WARNING = re.compile(r"^(?:LaTeX|Package (?P<package>\S+)|Class \S+) Warning: (?P<message>.*)$")
+_ON_INPUT_LINE = re.compile(r"on input line (\d+)")
+_BOX = re.compile(
+    r"^(?P<kind>Overfull|Underfull) \\[hv]box \((?:(?P<points>[\d.]+)pt too \w+|badness (?P<badness>\d+))\)"
+    r"(?:.*?lines? (?P<line>\d+))?"
+)
+# "(./file.tex" opens a file, ")" closes the innermost one
+_FILE_TOKEN = re.compile(r"\((?P<path>[^\s()]*)|\)")
+
+# How many lines after "! ..." to look for the "l.<n>" marker
+_ERROR_LOOKAHEAD = 12
+# Warnings continue on wrapped lines or "(package)" lines, up to this many
+_WARNING_MAX_LINES = 6
+# pdflatex hard-wraps log lines at this width (max_print_line)
+_LOG_LINE_WIDTH = 79
+_PACKAGE_CONTINUATION = re.compile(r"^\(\S+\)\s+")
+
+
+@dataclass
+class LatexDiagnostic:
+    severity: str # "error" or "warning"
+    message: str
+    file: Optional[str] = None
+    line: Optional[int] = None
+    context: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class LatexLogSummary:
+    errors: List[LatexDiagnostic] = field(default_factory=list)
+    warnings: List[LatexDiagnostic] = field(default_factory=list)
+    overfull_boxes: int = 0
+    underfull_boxes: int = 0
+    max_overfull_pt: float = 0.0
+    truncated: bool = False # More diagnostics than max_diagnostics were found
+
+    def to_dict(self) -> dict:
+        return {
+            "errors": [d.to_dict() for d in self.errors],
+            "warnings": [d.to_dict() for d in self.warnings],
+            "overfull_boxes": self.overfull_boxes,
+            "underfull_boxes": self.underfull_boxes,
+            "max_overfull_pt": self.max_overfull_pt,
+            "truncated": self.truncated,
+        }
+
+
+class _FileStack:
+    '''
+        Tracks which input file TeX is reading, following the "(file ... )"
+        nesting in the log. Non-file parentheses are tracked as None.
+    '''
+    def __init__(self):
+        self._stack: List[Optional[str]] = []
+
+    @property
+    def current(self) -> Optional[str]:
+        for path in reversed(self._stack):
+            if path:
+                return path
+        return None
+
+    def feed(self, line: str) -> None:
+        for match in _FILE_TOKEN.finditer(line):
+            if match.group(0) == ")":
+                if self._stack:
+                    self._stack.pop()
+            else:
+                path = match.group("path")
+                looks_like_file = bool(path) and ("/" in path or "." in path)
+                self._stack.append(Path(path).name if looks_like_file else None)
+
+
+def parse_latex_log(lines: Iterable[str], max_diagnostics: int = 50) -> LatexLogSummary:
+    """
+    Scans pdflatex log lines once and extracts errors, warnings and box statistics.
+    Only the current diagnostic is buffered, so memory does not grow with log size.
+    """
+    summary = LatexLogSummary()
+    files = _FileStack()
+    pending_error: Optional[LatexDiagnostic] = None
+    pending_error_age = 0
+    pending_warning: Optional[LatexDiagnostic] = None
+    pending_warning_lines = 0
+    previous_line = ""
+
+    def add(target: List[LatexDiagnostic], diagnostic: LatexDiagnostic) -> None:
+        if len(target) < max_diagnostics:
+            target.append(diagnostic)
+        else:
+            summary.truncated = True
+
+    def flush_warning() -> None:
+        nonlocal pending_warning
+        if pending_warning is not None:
+            line_match = _ON_INPUT_LINE.search(pending_warning.message)
+            if line_match and pending_warning.line is None:
+                pending_warning.line = int(line_match.group(1))
+            add(summary.warnings, pending_warning)
+            pending_warning = None
+
+    for raw_line in lines:
+        line = raw_line.rstrip("\r\n")
+        wrapped = len(previous_line) >= _LOG_LINE_WIDTH
+        previous_line = line
+
+        # Continuations of a multi-line warning
+        if pending_warning is not None:
+            continues = wrapped or _PACKAGE_CONTINUATION.match(line)
+            if line.strip() and continues and pending_warning_lines < _WARNING_MAX_LINES:
+                separator = "" if wrapped else " "
+                pending_warning.message += separator + _PACKAGE_CONTINUATION.sub("", line).strip()
+                pending_warning_lines += 1
+                continue
+            flush_warning()
+
+        # Waiting for the "l.<n>" marker of the last "!" error
+        if pending_error is not None:
+            marker = _LINE_MARKER.match(line)
+            if marker:
+                pending_error.line = int(marker.group("line"))
+                pending_error.context = marker.group("context").strip() or None
+                add(summary.errors, pending_error)
+                pending_error = None
+                continue
+            pending_error_age += 1
+            if pending_error_age > _ERROR_LOOKAHEAD or line.startswith("! "):
+                add(summary.errors, pending_error)
+                pending_error = None
+
+        file_line = _FILE_LINE_ERROR.match(line)
+        if file_line:
+            add(summary.errors, LatexDiagnostic(
+                severity="error",
+                message=file_line.group("message").strip(),
+                file=Path(file_line.group("file")).name,
+                line=int(file_line.group("line")),
+            ))
+            continue
+
+        bang = _BANG_ERROR.match(line)
+        if bang:
+            pending_error = LatexDiagnostic(severity="error", message=bang.group("message").strip(), file=files.current)
+            pending_error_age = 0
+            continue
+
+        # A "l.<n>" marker after a file-line-error refines the context of that error
+        marker = _LINE_MARKER.match(line)
+        if marker and summary.errors and summary.errors[-1].context is None:
+            summary.errors[-1].context = marker.group("context").strip() or None
+            continue
+
+        warning = _WARNING.match(line)
+        if warning:
+            message = warning.group("message").strip()
+            if warning.group("package"):
+                message = f"{warning.group('package')}: {message}"
+            pending_warning = LatexDiagnostic(severity="warning", message=message, file=files.current)
+            pending_warning_lines = 0
+            continue
+
+        box = _BOX.match(line)
+        if box:
+            if box.group("kind") == "Overfull":
+                summary.overfull_boxes += 1
+                if box.group("points"):
+                    summary.max_overfull_pt = max(summary.max_overfull_pt, float(box.group("points")))
+            else:
+                summary.underfull_boxes += 1
+            continue
+
+        files.feed(line)
+
+    if pending_error is not None:
+        add(summary.errors, pending_error)
+    flush_warning()
+    return summary
+
+
+def parse_latex_log_file(log_path: Path, max_diagnostics: int = 50) -> Optional[LatexLogSummary]:
+    """Parses a pdflatex .log file line by line. Returns None if the file cannot be read."""
+    try:
+        with open(log_path, "r", encoding="utf-8", errors="replace") as log_file:
+            return parse_latex_log(log_file, max_diagnostics=max_diagnostics)
+    except OSError as e:
+        logger.warning(f"Could not read LaTeX log file {log_path}: {e}")
+        return None
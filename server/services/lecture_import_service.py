@@ -0,0 +1,265 @@
+# server/services/lecture_import_service.py
+
+import asyncio
+import difflib
+import json
+import logging
+import re
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.problem import Problem
+from ..models.problemset import Problemset
+from ..models.problemset_problems import ProblemsetProblems
+from ..schemas.problemset import ProblemOutput
+from .ai_service import AIService
+from .json_stream import JSONEvent, JSONStreamError, json_events
+from .pdf_splitter import PDFSplitter
+
+logger = logging.getLogger(__name__)
+
+# Used until the model has streamed the real title (or if it never does)
+PLACEHOLDER_TITLE = "Novo predavanje"
+# Problems at the end of one page range that are compared with the start of the next
+BOUNDARY_WINDOW = 3
+_END = object()
+
+
+class LectureImporter:
+    '''
+        Writes one extracted lecture to the database as it streams in: the problemset
+        as soon as its metadata (or its first problem) arrives, then every problem
+        in its own small transaction, so finished problems are visible immediately.
+    '''
+    def __init__(self, db: Session):
+        self.db = db
+        self.problemset: Optional[Problemset] = None
+        self.lecture_name: Optional[str] = None
+        self.group_name: Optional[str] = None
+        self.problem_count = 0
+
+    def set_field(self, key: str, value) -> Optional[Problemset]:
+        """Records lecture metadata; returns the problemset once it is created or renamed."""
+        if key == "lecture_name" and isinstance(value, str) and value.strip():
+            self.lecture_name = value.strip()
+        elif key == "group_name" and isinstance(value, str):
+            self.group_name = value
+        else:
+            return None
+
+        if self.problemset is None:
+            if self.lecture_name is None or self.group_name is None:
+                return None
+            return self.ensure_problemset()
+        self.problemset.title = self.lecture_name or self.problemset.title
+        self.problemset.group_name = self.group_name
+        self.db.commit()
+        return self.problemset
+
+    def ensure_problemset(self) -> Problemset:
+        if self.problemset is None:
+            self.problemset = Problemset(
+                title=self.lecture_name or PLACEHOLDER_TITLE,
+                group_name=self.group_name,
+                type="predavanje",
+                part_of="skola matematike",
+            )
+            self.db.add(self.problemset)
+            self.db.commit()
+            logger.info(f"Lecture import: created problemset {self.problemset.id} ('{self.problemset.title}').")
+        return self.problemset
+
+    def add_problem(self, data: ProblemOutput) -> Problem:
+        problemset = self.ensure_problemset()
+        problem = Problem(latex_text=data.latex_text, category=data.category)
+        self.db.add(problem)
+        self.db.flush()
+        self.problem_count += 1
+        self.db.add(ProblemsetProblems(id_problemset=problemset.id, id_problem=problem.id, position=self.problem_count))
+        self.db.commit()
+        return problem
+
+
+def _normalized_latex(problem: Any) -> str:
+    text = problem.get("latex_text") if isinstance(problem, dict) else None
+    return re.sub(r"\s+", " ", text).strip().lower() if isinstance(text, str) else ""
+
+
+def same_problem(first: Any, second: Any) -> bool:
+    """True if two extracted problems are the same problem, possibly cut off at a page-range boundary."""
+    a, b = _normalized_latex(first), _normalized_latex(second)
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    if len(shorter) >= 30 and (longer.startswith(shorter) or longer.endswith(shorter)):
+        return True
+    return difflib.SequenceMatcher(None, a, b).ratio() >= 0.9
+
+
+def _fuller(first: Any, second: Any) -> Any:
+    return first if len(_normalized_latex(first)) >= len(_normalized_latex(second)) else second
+
+
+async def lecture_pdf_events(ai_service: AIService, pdf_bytes: bytes, splitter: Optional[PDFSplitter] = None) -> AsyncIterator[JSONEvent]:
+    """
+    JSON events of the extracted lecture (fields at depth 1, problems at depth 2), like
+    json_events over a single model stream. With a splitter, a long PDF is extracted as
+    page ranges concurrently and merged in page order: each field comes from the first
+    range that has it, and a problem repeated across a boundary is kept once (the more
+    complete copy). Problems still stream as they complete, except the last few of each
+    range, which wait until the start of the next range has been compared with them.
+    """
+    parts = await run_in_threadpool(splitter.split, pdf_bytes) if splitter is not None else [(None, pdf_bytes)]
+    if len(parts) == 1:
+        stream = await ai_service.process_lecture_pdf(pdf_bytes)
+        async for event in json_events(stream, max_depth=2):
+            yield event
+        return
+
+    queues: List[asyncio.Queue] = [asyncio.Queue() for _ in parts]
+    semaphore = asyncio.Semaphore(settings.LLM_BATCH_CONCURRENCY)
+
+    async def extract(index: int) -> None:
+        page_range, part_bytes = parts[index]
+        try:
+            async with semaphore:
+                stream = await ai_service.process_lecture_pdf(part_bytes, part=page_range)
+                async for event in json_events(stream, max_depth=2):
+                    queues[index].put_nowait(event)
+            queues[index].put_nowait(_END)
+        except Exception as e:
+            queues[index].put_nowait(e)
+
+    tasks = [asyncio.create_task(extract(index)) for index in range(len(parts))]
+    seen_fields = set()
+    pending: Deque[Any] = deque() # Problems not yielded yet, in page order
+    emitted = 0
+    try:
+        for index, queue in enumerate(queues):
+            boundary = len(pending) # Tail of the previous range, still open to duplicates
+            checked = 0
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if len(item.path) == 1 and item.key != "problems_latex":
+                    if item.key not in seen_fields and item.value not in ("", None):
+                        seen_fields.add(item.key)
+                        yield item
+                    continue
+                if len(item.path) != 2 or item.key != "problems_latex":
+                    continue
+
+                problem = item.value
+                if boundary:
+                    checked += 1
+                    match = next((i for i in range(boundary) if same_problem(pending[i], problem)), None)
+                    if checked >= BOUNDARY_WINDOW:
+                        boundary = 0
+                    if match is not None:
+                        logger.info(f"Lecture import: problem repeated across the boundary before pages {parts[index][0].spec}, merged.")
+                        pending[match] = _fuller(pending[match], problem)
+                        continue
+                pending.append(problem)
+                while not boundary and len(pending) > BOUNDARY_WINDOW:
+                    yield JSONEvent(("problems_latex", emitted), pending.popleft())
+                    emitted += 1
+        while pending:
+            yield JSONEvent(("problems_latex", emitted), pending.popleft())
+            emitted += 1
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _problemset_event(problemset: Problemset) -> dict:
+    return {"event": "problemset", "problemset_id": problemset.id, "title": problemset.title, "group_name": problemset.group_name}
+
+
+async def import_lecture_pdf(
+    ai_service: AIService,
+    db: Session,
+    pdf_bytes: bytes,
+    splitter: Optional[PDFSplitter] = None,
+) -> AsyncIterator[dict]:
+    """
+    Extracts a lecture PDF and saves it while the model is still streaming
+    (a long PDF as concurrent page ranges when a splitter is given, see lecture_pdf_events).
+    Yields progress events: problemset (created or renamed), problem (saved),
+    skipped (an element that did not match the schema), then done or error.
+    Problems saved before an error stay in the database.
+    """
+    started_at = time.monotonic()
+    importer = LectureImporter(db)
+    yield {"event": "started", "bytes": len(pdf_bytes)}
+
+    try:
+        # Depth 1 is the lecture metadata, depth 2 a single problem
+        async for event in lecture_pdf_events(ai_service, pdf_bytes, splitter):
+            if len(event.path) == 1 and event.key != "problems_latex":
+                problemset = importer.set_field(event.key, event.value)
+                if problemset is not None:
+                    yield _problemset_event(problemset)
+                continue
+            if len(event.path) != 2 or event.key != "problems_latex":
+                continue
+            try:
+                data = ProblemOutput.model_validate(event.value)
+            except ValidationError as e:
+                logger.warning(f"Lecture import: problem {event.index} does not match the schema: {e}")
+                yield {"event": "skipped", "index": event.index, "detail": str(e)}
+                continue
+            created = importer.problemset is None
+            problem = importer.add_problem(data)
+            if created:
+                yield _problemset_event(importer.problemset)
+            yield {
+                "event": "problem",
+                "problemset_id": importer.problemset.id,
+                "problem_id": problem.id,
+                "position": importer.problem_count,
+                "category": problem.category,
+                "latex_text": problem.latex_text,
+            }
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Lecture import failed after {importer.problem_count} problems: {e}", exc_info=True)
+        yield {
+            "event": "error",
+            "detail": f"Invalid AI response: {e}" if isinstance(e, JSONStreamError) else str(e),
+            "problemset_id": importer.problemset.id if importer.problemset else None,
+            "problems": importer.problem_count,
+        }
+        return
+
+    problemset = importer.ensure_problemset()
+    elapsed = time.monotonic() - started_at
+    logger.info(f"Lecture import: problemset {problemset.id} with {importer.problem_count} problems in {elapsed:.1f}s.")
+    yield {"event": "done", "problemset_id": problemset.id, "problems": importer.problem_count, "seconds": round(elapsed, 2)}
+
+
+async def import_lecture_pdf_ndjson(
+    ai_service: AIService,
+    db: Session,
+    pdf_bytes: bytes,
+    splitter: Optional[PDFSplitter] = None,
+) -> AsyncIterator[str]:
+    """
+    import_lecture_pdf as newline-delimited JSON, for a StreamingResponse. Closes db at
+    the end: the request's get_db cleanup has already run before the body streams.
+    """
+    try:
+        async for event in import_lecture_pdf(ai_service, db, pdf_bytes, splitter):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    finally:
+        db.close()
@@ -0,0 +1,264 @@
+# server/services/llm_providers.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types
+
+from .llm_telemetry import LLMCallRecord
+
+logger = logging.getLogger(__name__)
+
+# Roughly how many characters one model token covers, for stub pacing
+CHARS_PER_TOKEN = 4
+
+
+class LLMProvider:
+    '''
+        Backend that turns one prepared request (model, contents, config) into a
+        stream of text chunks. GeminiService builds the request and handles
+        coalescing and scheduling; providers only talk to the model.
+        When a telemetry record is given, providers fill in its token counts.
+        Providers with supports_prompt_cache can hold a request prefix (system
+        instruction and leading turns) as cached content, see prompt_cache.
+    '''
+    name = "base"
+    supports_prompt_cache = False
+
+    def generate(
+        self,
+        model: str,
+        contents: List[types.Content],
+        config: types.GenerateContentConfig,
+        record: Optional[LLMCallRecord] = None,
+    ) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def create_prompt_cache(
+        self,
+        model: str,
+        system_instruction: List[types.Part],
+        contents: List[types.Content],
+        ttl_seconds: float,
+    ) -> str:
+        """Stores the prefix for model and returns the name to pass as config.cached_content."""
+        raise NotImplementedError
+
+    async def refresh_prompt_cache(self, name: str, ttl_seconds: float) -> None:
+        """Extends the cached content's lifetime to ttl_seconds from now."""
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    '''
+        The real backend: one streaming call on the shared google-genai client.
+    '''
+    name = "gemini"
+    supports_prompt_cache = True
+
+    def __init__(self, client: genai.Client):
+        self.client = client
+
+    async def create_prompt_cache(
+        self,
+        model: str,
+        system_instruction: List[types.Part],
+        contents: List[types.Content],
+        ttl_seconds: float,
+    ) -> str:
+        cached = await self.client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=types.Content(role="system", parts=system_instruction),
+                contents=contents or None,
+                ttl=f"{int(ttl_seconds)}s",
+            ),
+        )
+        return cached.name
+
+    async def refresh_prompt_cache(self, name: str, ttl_seconds: float) -> None:
+        await self.client.aio.caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(ttl_seconds)}s"))
+
+    async def generate(
+        self,
+        model: str,
+        contents: List[types.Content],
+        config: types.GenerateContentConfig,
+        record: Optional[LLMCallRecord] = None,
+    ) -> AsyncIterator[str]:
+        response_stream = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+
+        # Call Gemini streaming API
+        async for chunk in response_stream:
+            if record is not None and getattr(chunk, "usage_metadata", None) is not None:
+                record.set_usage(chunk.usage_metadata)
+            text_to_yield = None # Initialized to None
+            if hasattr(chunk, 'text') and chunk.text:
+                text_to_yield = chunk.text
+            elif hasattr(chunk, 'candidates') and chunk.candidates and \
+                    hasattr(chunk.candidates[0], 'content') and chunk.candidates[0].content and \
+                    hasattr(chunk.candidates[0].content, 'parts') and chunk.candidates[0].content.parts:
+                part_texts = [part.text for part in chunk.candidates[0].content.parts if hasattr(part, 'text')]
+                if part_texts: # This condition is important
+                    text_to_yield = "".join(part_texts)
+
+            if text_to_yield is not None: # This condition ensures we only yield actual text
+                yield text_to_yield
+            else:
+                # This else block means if text_to_yield is STILL None, nothing is yielded FOR THIS CHUNK
+                logger.debug(f"Received chunk with no text content: {chunk.to_dict() if hasattr(chunk, 'to_dict') else chunk}")
+
+
+def _contents_text(contents: List[types.Content]) -> str:
+    return "".join(part.text or "" for content in contents for part in content.parts or ())
+
+
+def _last_user_text(contents: List[types.Content]) -> str:
+    for content in reversed(contents):
+        if content.role == "user":
+            return "".join(part.text for part in content.parts or () if part.text)
+    return ""
+
+
+def _request_digest(model: str, contents: List[types.Content], config: types.GenerateContentConfig) -> str:
+    digest = hashlib.sha256(model.encode("utf-8"))
+    for content in contents:
+        for part in content.parts or ():
+            if part.text:
+                digest.update(part.text.encode("utf-8"))
+            elif part.inline_data is not None and part.inline_data.data:
+                digest.update(part.inline_data.data)
+    return digest.hexdigest()
+
+
+def stub_value(schema: types.Schema, seed: str, name: str = "value", array_items: int = 2) -> Any:
+    """Deterministic instance of schema; the same seed always gives the same value."""
+    kind = schema.type
+    if kind == types.Type.OBJECT:
+        properties = schema.properties or {}
+        order = list(schema.property_ordering or ()) + [key for key in properties if key not in (schema.property_ordering or ())]
+        return {key: stub_value(properties[key], f"{seed}/{key}", key, array_items) for key in order if key in properties}
+    if kind == types.Type.ARRAY:
+        if schema.items is None:
+            return []
+        return [stub_value(schema.items, f"{seed}/{index}", name, array_items) for index in range(array_items)]
+    number = int(hashlib.sha256(seed.encode("utf-8")).hexdigest()[:8], 16)
+    if kind == types.Type.INTEGER:
+        return number % 100
+    if kind == types.Type.NUMBER:
+        return (number % 10000) / 100
+    if kind == types.Type.BOOLEAN:
+        return number % 2 == 0
+    if schema.enum:
+        return schema.enum[number % len(schema.enum)]
+    return f"{name} {number % 1000}"
+
+
+class StubProvider(LLMProvider):
+    '''
+        Offline backend for load tests and benchmarks. Output is deterministic:
+        plain-text requests echo the last user text, JSON requests get a value built
+        from the response schema. Chunks are paced by time-to-first-token and tokens
+        per second, and a share of calls can be made to fail like a quota error.
+        Cached content is kept in memory with its expiry, as a stand-in for the API's.
+    '''
+    name = "stub"
+    supports_prompt_cache = True
+
+    def __init__(
+        self,
+        ttft_seconds: float = 0.3,
+        tokens_per_second: float = 80.0,
+        tokens_per_chunk: int = 8,
+        failure_rate: float = 0.0,
+        failure_code: int = 503,
+        seed: int = 0,
+    ):
+        self.ttft_seconds = ttft_seconds
+        self.tokens_per_second = tokens_per_second
+        self.tokens_per_chunk = max(1, tokens_per_chunk)
+        self.failure_rate = failure_rate
+        self.failure_code = failure_code
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.caches: Dict[str, Tuple[List[types.Content], int, float]] = {} # name -> (contents, tokens, expires at)
+        self.clock = time.monotonic
+        logger.info(
+            f"StubProvider initialized (ttft: {ttft_seconds}s, {tokens_per_second} tokens/s, "
+            f"failure rate: {failure_rate})."
+        )
+
+    async def create_prompt_cache(
+        self,
+        model: str,
+        system_instruction: List[types.Part],
+        contents: List[types.Content],
+        ttl_seconds: float,
+    ) -> str:
+        name = f"cachedContents/stub-{len(self.caches) + 1}"
+        text = "".join(part.text or "" for part in system_instruction) + _contents_text(contents)
+        self.caches[name] = (list(contents), max(1, len(text) // CHARS_PER_TOKEN), self.clock() + ttl_seconds)
+        return name
+
+    def _live_cache(self, name: str) -> Tuple[List[types.Content], int, float]:
+        cached = self.caches.get(name)
+        if cached is None or self.clock() >= cached[2]:
+            raise genai_errors.APIError(404, {"error": {"code": 404, "status": "NOT_FOUND", "message": f"{name} not found."}})
+        return cached
+
+    async def refresh_prompt_cache(self, name: str, ttl_seconds: float) -> None:
+        contents, tokens, _ = self._live_cache(name)
+        self.caches[name] = (contents, tokens, self.clock() + ttl_seconds)
+
+    def response_text(self, model: str, contents: List[types.Content], config: types.GenerateContentConfig) -> str:
+        if config.response_mime_type == "application/json":
+            digest = _request_digest(model, contents, config)
+            if config.response_schema is None:
+                return json.dumps({"message": f"stub {digest[:8]}"})
+            return json.dumps(stub_value(config.response_schema, digest), ensure_ascii=False)
+        return _last_user_text(contents) or "stub response"
+
+    async def generate(
+        self,
+        model: str,
+        contents: List[types.Content],
+        config: types.GenerateContentConfig,
+        record: Optional[LLMCallRecord] = None,
+    ) -> AsyncIterator[str]:
+        self.calls += 1
+        sent_tokens = max(1, len(_contents_text(contents)) // CHARS_PER_TOKEN)
+        cached_tokens = 0
+        if config.cached_content:
+            cached_contents, cached_tokens, _ = self._live_cache(config.cached_content)
+            contents = cached_contents + list(contents)
+        text = self.response_text(model, contents, config)
+        if record is not None:
+            # Same rough estimate as the pacing, so offline runs still report token usage
+            record.input_tokens = cached_tokens + sent_tokens
+            record.output_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+            record.cached_tokens = cached_tokens
+        fails = self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+        await asyncio.sleep(self.ttft_seconds)
+        if fails:
+            raise genai_errors.APIError(
+                self.failure_code,
+                {"error": {"code": self.failure_code, "status": "UNAVAILABLE", "message": "Injected stub failure."}},
+            )
+        chunk_chars = self.tokens_per_chunk * CHARS_PER_TOKEN
+        chunk_delay = self.tokens_per_chunk / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for start in range(0, len(text), chunk_chars):
+            if start:
+                await asyncio.sleep(chunk_delay)
+            yield text[start:start + chunk_chars]
@@ -0,0 +1,311 @@
+# server/services/llm_router.py
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+from ..config import settings
+from .llm_scheduler import is_retryable
+from .llm_telemetry import LLMCallRecord, LLMTelemetry
+
+logger = logging.getLogger(__name__)
+
+FLASH = settings.GEMINI_FLASH_2_5
+PRO = settings.GEMINI_PRO_2_5
+
+# Pro cannot turn thinking off; below this budget requests are rejected
+MIN_THINKING_BUDGET = {PRO: 128}
+# Where requests go while a model's circuit is open
+FALLBACK_MODELS = {FLASH: PRO, PRO: FLASH}
+
+_EMPTY = object() # First "chunk" of a stream that ended without any
+
+# call(model, thinking_budget, record, shared) -> stream of text chunks; shared=False asks for
+# a fresh upstream request instead of joining an identical one in flight (used by hedges)
+ModelCall = Callable[[str, int, LLMCallRecord, bool], AsyncIterator[str]]
+
+
+async def _close_quietly(stream: AsyncIterator[str]) -> None:
+    try:
+        await stream.aclose()
+    except Exception as e:
+        logger.debug(f"Closing a losing stream raised: {e}")
+
+
+async def _first_to_start(
+    primary: AsyncIterator[str],
+    delay: Optional[float],
+    start_hedge: Callable[[], AsyncIterator[str]],
+) -> Tuple[AsyncIterator[str], object]:
+    """
+    Waits for the first chunk of primary, starting a hedge stream if none came within
+    delay (None: never). Returns the stream that produced a chunk first, with that chunk
+    (_EMPTY if it ended without one), after closing the other. A stream's error is only
+    raised when no other stream is left to wait for.
+    """
+    streams = [primary]
+    pending = {asyncio.ensure_future(primary.__anext__()): primary}
+    winner, first, error = None, _EMPTY, None
+    try:
+        while pending and winner is None:
+            hedging = delay is not None and len(streams) == 1
+            done, _ = await asyncio.wait(pending, timeout=delay if hedging else None, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                stream = start_hedge()
+                streams.append(stream)
+                pending[asyncio.ensure_future(stream.__anext__())] = stream
+                continue
+            for future in done:
+                stream = pending.pop(future)
+                try:
+                    first = future.result()
+                except StopAsyncIteration:
+                    first = _EMPTY
+                except Exception as e:
+                    error = error or e
+                    continue
+                winner = stream
+                break
+        if winner is None:
+            raise error
+        return winner, first
+    finally:
+        for future in pending:
+            future.cancel()
+        # A generator cannot be closed while its __anext__ is still running
+        await asyncio.gather(*pending, return_exceptions=True)
+        for stream in streams:
+            if stream is not winner:
+                await _close_quietly(stream)
+
+
+@dataclass(frozen=True)
+class RoutePolicy:
+    model: str
+    thinking_budget: int
+    large_model: Optional[str] = None # For inputs above the router's large_input_tokens; None keeps model
+    large_thinking_budget: Optional[int] = None
+    hedge: bool = False # Interactive calls that are slow to start get a duplicate request
+
+
+ACTION_POLICIES: Dict[str, RoutePolicy] = {
+    "hello": RoutePolicy(FLASH, 0),
+    "fix_latex": RoutePolicy(FLASH, 0, large_model=PRO, large_thinking_budget=1024, hedge=True),
+    "fix_grammar": RoutePolicy(FLASH, 0, large_thinking_budget=512, hedge=True),
+    "translate": RoutePolicy(FLASH, 0, large_thinking_budget=512, hedge=True),
+    "translate_segment": RoutePolicy(FLASH, 0),
+    "image_to_latex": RoutePolicy(FLASH, 0),
+    "extract_latex_from_image": RoutePolicy(FLASH, 0),
+    "process_lecture_pdf": RoutePolicy(FLASH, 0),
+}
+
+
+@dataclass
+class Route:
+    action: str
+    model: str
+    thinking_budget: int
+    fallback: Optional[str] = None # None when the caller pinned the model
+    hedge: bool = False
+
+    def thinking_for(self, model: str) -> int:
+        return max(self.thinking_budget, MIN_THINKING_BUDGET.get(model, 0))
+
+
+class CircuitBreaker:
+    '''
+        Per-model failure counter. After failure_threshold consecutive failures a model
+        is unavailable for cooldown_seconds; after that requests reach it again, and the
+        first failure opens the circuit again while the first success closes it.
+    '''
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.clock = clock
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+
+    def available(self, model: str) -> bool:
+        return self.clock() >= self._open_until.get(model, 0.0)
+
+    def success(self, model: str) -> None:
+        if self._failures.get(model, 0) >= self.failure_threshold:
+            logger.info(f"Circuit for {model} closed.")
+        self._failures[model] = 0
+
+    def failure(self, model: str) -> None:
+        failures = self._failures[model] = self._failures.get(model, 0) + 1
+        if failures >= self.failure_threshold:
+            self._open_until[model] = self.clock() + self.cooldown_seconds
+            logger.warning(f"Circuit for {model} open for {self.cooldown_seconds}s after {failures} consecutive failures.")
+
+    def state(self, model: str) -> str:
+        if not self.available(model):
+            return "open"
+        return "half_open" if self._failures.get(model, 0) >= self.failure_threshold else "closed"
+
+    def stats(self) -> Dict[str, dict]:
+        return {model: {"state": self.state(model), "failures": failures} for model, failures in sorted(self._failures.items())}
+
+
+class ModelRouter:
+    '''
+        Picks the model and thinking budget of an AI action from ACTION_POLICIES and the
+        input size, and runs the call:
+        - a model whose circuit is open is routed around (FALLBACK_MODELS), and a call
+          that fails before its first chunk with a retryable error is retried once on
+          the fallback model;
+        - hedged actions that get no first chunk within the action's recent
+          time-to-first-chunk percentile (from telemetry) send a duplicate request;
+          whichever stream starts first is used and the other is cancelled.
+        A model given by the caller is pinned: no size routing and no fallback.
+    '''
+    def __init__(
+        self,
+        policies: Optional[Dict[str, RoutePolicy]] = None,
+        large_input_tokens: int = 1500,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay_seconds: float = 0.5,
+        hedge_max_delay_seconds: float = 8.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.policies = ACTION_POLICIES if policies is None else policies
+        self.large_input_tokens = large_input_tokens
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = max(1, hedge_min_samples)
+        self.hedge_min_delay_seconds = hedge_min_delay_seconds
+        self.hedge_max_delay_seconds = hedge_max_delay_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        logger.info(
+            f"ModelRouter initialized (large input: {large_input_tokens} tokens, hedge at p{int(hedge_percentile * 100)} "
+            f"ttfc after {hedge_min_samples} samples)."
+        )
+
+    def route(self, action: str, input_tokens: int, model: Optional[str] = None, thinking_budget: Optional[int] = None) -> Route:
+        policy = self.policies.get(action) or RoutePolicy(FLASH, 0)
+        if model is not None:
+            return Route(action, model, thinking_budget if thinking_budget is not None else policy.thinking_budget, hedge=policy.hedge)
+
+        chosen, budget = policy.model, policy.thinking_budget
+        if input_tokens > self.large_input_tokens:
+            chosen = policy.large_model or chosen
+            budget = policy.large_thinking_budget if policy.large_thinking_budget is not None else budget
+        if thinking_budget is not None:
+            budget = thinking_budget
+        fallback = FALLBACK_MODELS.get(chosen)
+        if not self.breaker.available(chosen) and fallback is not None and self.breaker.available(fallback):
+            logger.info(f"Routing {action} to {fallback}: circuit for {chosen} is open.")
+            chosen, fallback = fallback, chosen
+        return Route(action, chosen, budget, fallback=fallback, hedge=policy.hedge)
+
+    def hedge_delay(self, telemetry: LLMTelemetry, action: str, model: str) -> Optional[float]:
+        """How long to wait for the first chunk before hedging, or None while there are too few samples."""
+        ttfc = telemetry.ttfc_percentile(action, model, self.hedge_percentile, self.hedge_min_samples)
+        if ttfc is None:
+            return None
+        return min(max(ttfc, self.hedge_min_delay_seconds), self.hedge_max_delay_seconds)
+
+    def _failed(self, model: str, error: BaseException) -> None:
+        # Bad requests say nothing about the model's health
+        if is_retryable(error):
+            self.breaker.failure(model)
+
+    async def stream(
+        self,
+        route: Route,
+        call: ModelCall,
+        record: LLMCallRecord,
+        telemetry: LLMTelemetry,
+        hedge: bool = True,
+    ) -> AsyncIterator[str]:
+        started = False
+        try:
+            async for chunk in self._attempt(route, route.model, call, record, telemetry, hedge):
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            fallback = route.fallback
+            if started or fallback is None or not is_retryable(e) or not self.breaker.available(fallback):
+                raise
+            logger.warning(f"{route.action} on {route.model} failed before its first chunk ({e}), retrying on {fallback}.")
+        self.fallbacks += 1
+        record.model = fallback
+        async for chunk in self._attempt(route, fallback, call, record, telemetry, hedge):
+            yield chunk
+
+    async def _attempt(
+        self,
+        route: Route,
+        model: str,
+        call: ModelCall,
+        record: LLMCallRecord,
+        telemetry: LLMTelemetry,
+        hedge: bool,
+    ) -> AsyncIterator[str]:
+        thinking_budget = route.thinking_for(model)
+        delay = self.hedge_delay(telemetry, route.action, model) if hedge and route.hedge else None
+        primary = call(model, thinking_budget, record, True)
+
+        def start_hedge() -> AsyncIterator[str]:
+            self.hedges += 1
+            logger.info(f"No first chunk of {route.action} on {model} after {delay:.2f}s, sending a hedged request.")
+            hedge_record = telemetry.start(route.action, model)
+            hedge_record.source = "hedge"
+            return telemetry.measure(hedge_record, call(model, thinking_budget, hedge_record, False))
+
+        try:
+            winner, first = await _first_to_start(primary, delay, start_hedge)
+        except Exception as e:
+            self._failed(model, e)
+            raise
+        if winner is not primary:
+            self.hedge_wins += 1
+        self.breaker.success(model)
+
+        try:
+            if first is not _EMPTY:
+                yield first
+            async for chunk in winner:
+                yield chunk
+        except Exception as e:
+            self._failed(model, e)
+            raise
+        finally:
+            await _close_quietly(winner)
+
+    def stats(self) -> dict:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "circuits": self.breaker.stats(),
+        }
+
+
+_cached_model_router: Optional[ModelRouter] = None
+
+def get_model_router() -> ModelRouter:
+    """Returns the process-wide ModelRouter instance."""
+    global _cached_model_router
+
+    if _cached_model_router is None:
+        _cached_model_router = ModelRouter(
+            large_input_tokens=settings.LLM_ROUTE_LARGE_INPUT_TOKENS,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+            hedge_min_delay_seconds=settings.LLM_HEDGE_MIN_DELAY_SECONDS,
+            hedge_max_delay_seconds=settings.LLM_HEDGE_MAX_DELAY_SECONDS,
+            breaker=CircuitBreaker(
+                failure_threshold=settings.LLM_BREAKER_FAILURES,
+                cooldown_seconds=settings.LLM_BREAKER_COOLDOWN_SECONDS,
+            ),
+        )
+
+    return _cached_model_router
@@ -0,0 +1,271 @@
+# server/services/llm_scheduler.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from google.genai import errors as genai_errors
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower is served first
+INTERACTIVE = 0 # Editor actions a user is waiting on
+BATCH = 1       # Whole-document fixes, PDF extraction and other background work
+LANES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+_RETRY_DELAY = re.compile(r"^(?P<seconds>\d+(?:\.\d+)?)s$")
+
+
+class TokenBucket:
+    '''
+        Classic token bucket: refills at rate tokens per second up to capacity.
+    '''
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.clock = clock
+        self.tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens are available (0 if they already are)."""
+        missing = min(amount, self.capacity) - self.available()
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def take(self, amount: float) -> None:
+        # Requests larger than the whole bucket still pass once it is full
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self) -> None:
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+@dataclass
+class ModelQuota:
+    requests_per_minute: int
+    tokens_per_minute: int
+
+
+class _ModelLane:
+    '''
+        Buckets, waiting callers and counters for one model.
+    '''
+    def __init__(self, quota: ModelQuota, burst_seconds: float, clock: Callable[[], float]):
+        self.quota = quota
+        self.requests = TokenBucket(quota.requests_per_minute / 60, quota.requests_per_minute / 60 * burst_seconds, clock)
+        self.tokens = TokenBucket(quota.tokens_per_minute / 60, quota.tokens_per_minute / 60 * burst_seconds, clock)
+        self.waiting: List[Tuple[int, int]] = [] # heap of (priority, ticket)
+        self.changed = asyncio.Condition()
+        self.started: Deque[float] = deque() # Start times of calls in the last minute
+        self.in_flight = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+
+    def wait_time(self, cost: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(cost))
+
+    def prune_started(self, now: float) -> None:
+        while self.started and now - self.started[0] > 60:
+            self.started.popleft()
+
+
+def estimate_tokens(*texts: Optional[str], images: int = 0) -> int:
+    """Rough input token count (~4 characters per token, fixed cost per image) used for the TPM bucket."""
+    characters = sum(len(text) for text in texts if text)
+    return max(1, characters // 4 + images * 258)
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, genai_errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+def _server_retry_delay(error: BaseException) -> Optional[float]:
+    """The retryDelay Gemini attaches to 429 responses (google.rpc.RetryInfo), if any."""
+    details = getattr(error, "details", None)
+    if not isinstance(details, dict):
+        return None
+    for detail in (details.get("error") or {}).get("details") or ():
+        match = _RETRY_DELAY.match(str(detail.get("retryDelay", ""))) if isinstance(detail, dict) else None
+        if match:
+            return float(match.group("seconds"))
+    return None
+
+
+class LLMScheduler:
+    '''
+        Admits LLM calls under per-model request and token quotas.
+        Callers wait in priority lanes (interactive before batch, FIFO within a lane),
+        and calls that fail with a retryable error before producing any output are
+        retried with jittered exponential backoff.
+    '''
+    def __init__(
+        self,
+        quotas: Dict[str, ModelQuota],
+        default_quota: ModelQuota,
+        max_retries: int = 4,
+        backoff_base_seconds: float = 0.5,
+        backoff_max_seconds: float = 20.0,
+        burst_seconds: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.quotas = quotas
+        self.default_quota = default_quota
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.burst_seconds = burst_seconds
+        self.clock = clock
+        self._lanes: Dict[str, _ModelLane] = {}
+        self._tickets = itertools.count()
+        logger.info(f"LLMScheduler initialized (models: {', '.join(quotas) or 'default only'}, max_retries: {max_retries}).")
+
+    def _lane(self, model: str) -> _ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            lane = self._lanes[model] = _ModelLane(self.quotas.get(model, self.default_quota), self.burst_seconds, self.clock)
+        return lane
+
+    async def acquire(self, model: str, priority: int = INTERACTIVE, cost: int = 1) -> None:
+        """Waits until this caller is first in line for model and both of its buckets allow the call."""
+        lane = self._lane(model)
+        entry = (priority, next(self._tickets))
+        async with lane.changed:
+            heapq.heappush(lane.waiting, entry)
+            try:
+                while True:
+                    if lane.waiting[0] == entry:
+                        delay = lane.wait_time(cost)
+                        if delay <= 0:
+                            break
+                    else:
+                        delay = None # Someone ahead of us; wait until the line moves
+                    try:
+                        await asyncio.wait_for(lane.changed.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                heapq.heappop(lane.waiting)
+                lane.requests.take(1)
+                lane.tokens.take(cost)
+                lane.started.append(self.clock())
+                lane.prune_started(self.clock())
+            except BaseException:
+                # Cancelled while waiting: leave the line without consuming quota
+                if entry in lane.waiting:
+                    lane.waiting.remove(entry)
+                    heapq.heapify(lane.waiting)
+                raise
+            finally:
+                lane.changed.notify_all()
+
+    def backoff_delay(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than a delay the server asked for."""
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        server_delay = _server_retry_delay(error) if error is not None else None
+        return max(delay, min(server_delay, self.backoff_max_seconds)) if server_delay else delay
+
+    async def stream(
+        self,
+        model: str,
+        produce: Callable[[], AsyncIterator[str]],
+        priority: int = INTERACTIVE,
+        cost: int = 1,
+    ) -> AsyncIterator[str]:
+        """
+        Runs produce() once admitted and passes its chunks through. A retryable error
+        before the first chunk starts a new attempt; after it, the error is raised,
+        since the caller has already seen part of the output.
+        """
+        lane = self._lane(model)
+        attempt = 0
+        while True:
+            await self.acquire(model, priority, cost)
+            started = False
+            lane.in_flight += 1
+            try:
+                async for chunk in produce():
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                if isinstance(e, genai_errors.APIError) and e.code == 429:
+                    lane.rate_limited += 1
+                    lane.tokens.drain() # Our quota estimate was too generous; let everyone back off
+                    lane.requests.drain()
+                if started or attempt >= self.max_retries or not is_retryable(e):
+                    lane.failures += 1
+                    raise
+                delay = self.backoff_delay(attempt, e)
+                attempt += 1
+                lane.retries += 1
+                logger.warning(f"LLM call to {model} failed ({e}); retry {attempt}/{self.max_retries} in {delay:.2f}s.")
+            finally:
+                lane.in_flight -= 1
+            await asyncio.sleep(delay)
+
+    def usage(self) -> Dict[str, dict]:
+        """Current quota usage per model, for the /llm/usage endpoint."""
+        now = self.clock()
+        report = {}
+        for model, lane in self._lanes.items():
+            lane.prune_started(now)
+            waiting = {name: 0 for name in LANES.values()}
+            for priority, _ in lane.waiting:
+                waiting[LANES[priority]] += 1
+            report[model] = {
+                "requests_per_minute_limit": lane.quota.requests_per_minute,
+                "tokens_per_minute_limit": lane.quota.tokens_per_minute,
+                "requests_last_minute": len(lane.started),
+                "request_tokens_available": round(lane.requests.available(), 2),
+                "input_tokens_available": int(lane.tokens.available()),
+                "in_flight": lane.in_flight,
+                "waiting": waiting,
+                "retries": lane.retries,
+                "rate_limited": lane.rate_limited,
+                "failures": lane.failures,
+            }
+        return report
+
+
+_cached_llm_scheduler: Optional[LLMScheduler] = None
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Returns the process-wide LLMScheduler, configured from settings."""
+    global _cached_llm_scheduler
+
+    if _cached_llm_scheduler is None:
+        flash = ModelQuota(settings.LLM_FLASH_RPM, settings.LLM_FLASH_TPM)
+        pro = ModelQuota(settings.LLM_PRO_RPM, settings.LLM_PRO_TPM)
+        _cached_llm_scheduler = LLMScheduler(
+            quotas={settings.GEMINI_FLASH_2_5: flash, settings.GEMINI_PRO_2_5: pro},
+            default_quota=flash,
+            max_retries=settings.LLM_MAX_RETRIES,
+            backoff_base_seconds=settings.LLM_BACKOFF_BASE_SECONDS,
+            backoff_max_seconds=settings.LLM_BACKOFF_MAX_SECONDS,
+        )
+
+    return _cached_llm_scheduler
@@ -0,0 +1,181 @@
+# server/services/llm_telemetry.py
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Where a response came from: a model call, a stream shared with an identical request, a cache,
+# or a duplicate request sent because the first was slow to start (see llm_router)
+SOURCES = ("model", "coalesced", "cache", "hedge")
+# Sources whose latency is the model's: a coalesced stream joined a request already in flight
+LATENCY_SOURCES = ("model", "hedge")
+OUTCOMES = ("completed", "error", "cancelled")
+
+
+@dataclass
+class LLMCallRecord:
+    '''
+        Telemetry of one AI action as the caller sees it. Token counts are filled in by
+        the provider from the response usage metadata, so they stay 0 for answers that
+        did not cost a model call (cache hits, coalesced streams).
+    '''
+    action: str
+    model: str
+    source: str = "model"
+    outcome: str = "completed"
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time.monotonic)
+    ttfc_seconds: Optional[float] = None # time to first chunk
+    duration_seconds: float = 0.0
+    chunks: int = 0
+    output_chars: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    thinking_tokens: int = 0
+    cached_tokens: int = 0
+
+    def set_usage(self, usage) -> None:
+        """Copies a GenerateContentResponseUsageMetadata; later chunks carry the running totals."""
+        self.input_tokens = usage.prompt_token_count or self.input_tokens
+        self.output_tokens = usage.candidates_token_count or self.output_tokens
+        self.thinking_tokens = usage.thoughts_token_count or self.thinking_tokens
+        self.cached_tokens = usage.cached_content_token_count or self.cached_tokens
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+
+class _ActionStats:
+    def __init__(self, samples: int):
+        self.requests = 0
+        self.outcomes: Dict[str, int] = {outcome: 0 for outcome in OUTCOMES}
+        self.sources: Dict[str, int] = {source: 0 for source in SOURCES}
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.thinking_tokens = 0
+        self.cached_tokens = 0
+        self.chunks = 0
+        self.ttfc: Deque[float] = deque(maxlen=samples)
+        self.duration: Deque[float] = deque(maxlen=samples)
+
+    def add(self, record: LLMCallRecord) -> None:
+        self.requests += 1
+        self.outcomes[record.outcome] = self.outcomes.get(record.outcome, 0) + 1
+        self.sources[record.source] = self.sources.get(record.source, 0) + 1
+        self.input_tokens += record.input_tokens
+        self.output_tokens += record.output_tokens
+        self.thinking_tokens += record.thinking_tokens
+        self.cached_tokens += record.cached_tokens
+        self.chunks += record.chunks
+        if record.outcome == "completed" and record.source in LATENCY_SOURCES:
+            # Latency of model calls only; cache hits and late joiners would hide how slow the model is
+            if record.ttfc_seconds is not None:
+                self.ttfc.append(record.ttfc_seconds)
+            self.duration.append(record.duration_seconds)
+
+    def snapshot(self) -> dict:
+        ttfc, duration = list(self.ttfc), list(self.duration)
+        return {
+            "requests": self.requests,
+            "outcomes": dict(self.outcomes),
+            "sources": dict(self.sources),
+            "tokens": {
+                "input": self.input_tokens,
+                "output": self.output_tokens,
+                "thinking": self.thinking_tokens,
+                "cached": self.cached_tokens,
+            },
+            "chunks": self.chunks,
+            "ttfc_seconds": {"p50": _percentile(ttfc, 0.5), "p95": _percentile(ttfc, 0.95), "samples": len(ttfc)},
+            "duration_seconds": {"p50": _percentile(duration, 0.5), "p95": _percentile(duration, 0.95), "samples": len(duration)},
+        }
+
+
+class LLMTelemetry:
+    '''
+        In-process aggregates of AI action calls per (action, model): outcomes, where
+        the answers came from, token totals, and time-to-first-chunk / duration
+        percentiles over the last `samples` model calls. Every call is also logged.
+    '''
+    def __init__(self, samples: int = 1000):
+        self.samples = samples
+        self._stats: Dict[Tuple[str, str], _ActionStats] = {}
+        self._lock = threading.Lock()
+        logger.info(f"LLMTelemetry initialized (samples per action: {samples}).")
+
+    def start(self, action: str, model: str) -> LLMCallRecord:
+        return LLMCallRecord(action=action, model=model)
+
+    def record(self, record: LLMCallRecord) -> None:
+        with self._lock:
+            stats = self._stats.get((record.action, record.model))
+            if stats is None:
+                stats = self._stats[(record.action, record.model)] = _ActionStats(self.samples)
+            stats.add(record)
+        ttfc = f"{record.ttfc_seconds:.2f}s" if record.ttfc_seconds is not None else "-"
+        logger.info(
+            f"LLM {record.action} on {record.model} ({record.source}): {record.outcome}, "
+            f"ttfc {ttfc}, {record.duration_seconds:.2f}s, {record.chunks} chunks, "
+            f"tokens in/out/thinking {record.input_tokens}/{record.output_tokens}/{record.thinking_tokens}"
+            + (f", error: {record.error}" if record.error else "")
+        )
+
+    async def measure(self, record: LLMCallRecord, stream: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Passes stream through, timing it into record, and records it when the stream ends."""
+        record.started_at = time.monotonic()
+        try:
+            async for chunk in stream:
+                if record.ttfc_seconds is None:
+                    record.ttfc_seconds = time.monotonic() - record.started_at
+                record.chunks += 1
+                record.output_chars += len(chunk)
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            record.outcome = "cancelled"
+            raise
+        except Exception as e:
+            record.outcome = "error"
+            record.error = f"{type(e).__name__}: {e}"[:200]
+            raise
+        finally:
+            record.duration_seconds = time.monotonic() - record.started_at
+            self.record(record)
+
+    def ttfc_percentile(self, action: str, model: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """Recent time to first chunk of model calls, or None with fewer than min_samples."""
+        with self._lock:
+            stats = self._stats.get((action, model))
+            samples = list(stats.ttfc) if stats is not None else []
+        return _percentile(samples, q) if len(samples) >= min_samples else None
+
+    def snapshot(self) -> Dict[str, Dict[str, dict]]:
+        """{action: {model: aggregates}}"""
+        with self._lock:
+            result: Dict[str, Dict[str, dict]] = {}
+            for (action, model), stats in sorted(self._stats.items()):
+                result.setdefault(action, {})[model] = stats.snapshot()
+            return result
+
+
+_cached_llm_telemetry: Optional[LLMTelemetry] = None
+
+def get_llm_telemetry() -> LLMTelemetry:
+    """Returns the process-wide LLMTelemetry instance."""
+    global _cached_llm_telemetry
+
+    if _cached_llm_telemetry is None:
+        _cached_llm_telemetry = LLMTelemetry(samples=settings.LLM_TELEMETRY_SAMPLES)
+
+    return _cached_llm_telemetry
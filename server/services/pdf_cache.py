@@ -0,0 +1,152 @@
+# server/services/pdf_cache.py
+
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump when the compile pipeline changes in a way that alters the produced PDFs
+PDF_PIPELINE_VERSION = "2"
+
+
+class KeyedLocks:
+    '''
+        One lock per key, kept only while a thread holds or waits for it, so the
+        table never grows past the keys in use. Locks of different keys are
+        independent, so holding one while taking another cannot deadlock.
+    '''
+    def __init__(self):
+        self._locks: Dict[str, List] = {} # key -> [lock, holders and waiters]
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: str) -> Iterator[None]:
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class PDFCache:
+    '''
+        Content-addressed on-disk store of compiled PDFs.
+        Entries are keyed by a hash of the LaTeX source, written atomically
+        and linearized ("fast web view") when qpdf is available.
+    '''
+    def __init__(self, root_dir: str, max_bytes: int = 0, subdir: str = "pdf_cache", linearize: bool = True):
+        self.root_dir = Path(root_dir) / subdir
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.linearize = linearize
+        self._locks = KeyedLocks()
+        logger.info(f"PDFCache initialized (root: {self.root_dir}).")
+
+    @staticmethod
+    def key_for(latex_content: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(PDF_PIPELINE_VERSION.encode())
+        digest.update(b"\0")
+        digest.update(latex_content.encode("utf-8"))
+        return digest.hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.root_dir / f"{key}.pdf"
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.path_for(key)
+        if not path.is_file():
+            return None
+        try:
+            os.utime(path) # Recently used entries survive pruning
+        except OSError:
+            pass
+        return path
+
+    def lock_for(self, key: str):
+        """Per-key lock (a context manager) so concurrent requests for the same PDF compile it only once."""
+        return self._locks.hold(key)
+
+    def store(self, key: str, pdf_path: Path) -> Path:
+        """Moves a freshly compiled PDF into the cache (linearizing it) and returns its cached path."""
+        final_path = self.path_for(key)
+        fd, tmp_name = tempfile.mkstemp(dir=self.root_dir, suffix=".tmp")
+        os.close(fd)
+        tmp_path = Path(tmp_name)
+        try:
+            if not (self.linearize and self._linearize(pdf_path, tmp_path)):
+                shutil.copyfile(pdf_path, tmp_path)
+            os.replace(tmp_path, final_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        logger.info(f"Stored PDF in cache: {final_path.name} ({final_path.stat().st_size} bytes)")
+        self.prune()
+        return final_path
+
+    @staticmethod
+    def _linearize(source: Path, target: Path) -> bool:
+        qpdf_cmd = shutil.which("qpdf")
+        if not qpdf_cmd:
+            logger.debug("qpdf not found in PATH, storing PDF without linearization.")
+            return False
+        process = subprocess.run(
+            [qpdf_cmd, "--linearize", str(source), str(target)],
+            capture_output=True, text=True, check=False, timeout=60,
+        )
+        # qpdf exits with 3 when it succeeded with warnings
+        if process.returncode not in (0, 3):
+            logger.warning(f"qpdf linearization failed ({process.returncode}): {process.stderr.strip()}")
+            return False
+        return True
+
+    def prune(self) -> None:
+        """Evicts least recently used entries once the cache grows past max_bytes."""
+        if not self.max_bytes:
+            return
+        entries = []
+        for path in self.root_dir.glob("*.pdf"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.info(f"Evicted {path.name} from PDF cache.")
+
+
+_cached_pdf_cache: Optional[PDFCache] = None
+
+def get_pdf_cache() -> PDFCache:
+    """Returns the process-wide PDFCache instance."""
+    global _cached_pdf_cache
+
+    if _cached_pdf_cache is None:
+        _cached_pdf_cache = PDFCache(settings.LATEX_WORK_DIR, max_bytes=settings.PDF_CACHE_MAX_BYTES)
+
+    return _cached_pdf_cache
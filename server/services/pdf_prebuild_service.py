@@ -0,0 +1,161 @@
+# server/services/pdf_prebuild_service.py
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import pdf_service
+from .pdf_service import PDFGenerationError, ProblemsetNotFound
+from .pdf_cache import get_pdf_cache
+from ..models.problemset_problems import ProblemsetProblems
+
+logger = logging.getLogger(__name__)
+
+# pdflatex runs for prebuilds yield the CPU to interactive compiles
+PREBUILD_NICENESS = 10
+
+
+class PDFPrebuildScheduler:
+    '''
+        Speculatively compiles problemset PDFs into the PDF cache after edits,
+        so the first download during a lecture is a cache hit.
+        Rapid edits of the same problemset are debounced into a single build,
+        and builds run one at a time on a low-priority background worker.
+        build_soon queues a build without the debounce (used for PDFs something is
+        waiting for, e.g. thumbnails). LaTeX that failed with errors is remembered
+        for failure_ttl_seconds and not built again meanwhile.
+    '''
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        enabled: bool = False,
+        debounce_seconds: float = 5.0,
+        failure_ttl_seconds: float = 3600.0,
+        clock=time.monotonic,
+    ):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.debounce_seconds = debounce_seconds
+        self.failure_ttl_seconds = failure_ttl_seconds
+        self.clock = clock
+        self._failed: Dict[str, Tuple[float, str]] = {} # LaTeX key -> (when to retry, first error)
+        self._timers: Dict[int, threading.Timer] = {}
+        self._timers_lock = threading.Lock()
+        self._queue: "queue.Queue[int]" = queue.Queue()
+        self._queued: Set[int] = set()
+        self._worker: Optional[threading.Thread] = None
+        logger.info(f"PDFPrebuildScheduler initialized (enabled: {enabled}).")
+
+    def schedule(self, problemset_id: int) -> None:
+        """(Re)starts the debounce timer for a problemset; the build is queued when it fires."""
+        if not self.enabled:
+            return
+        with self._timers_lock:
+            existing = self._timers.pop(problemset_id, None)
+            if existing is not None:
+                existing.cancel()
+            timer = threading.Timer(self.debounce_seconds, self._enqueue, args=(problemset_id,))
+            timer.daemon = True
+            self._timers[problemset_id] = timer
+            timer.start()
+        logger.debug(f"Prebuild scheduled for problemset {problemset_id} in {self.debounce_seconds}s.")
+
+    def build_soon(self, problemset_id: int, latex_key: Optional[str] = None) -> bool:
+        """
+        Queues a low-priority build now, unless one for the problemset is already queued.
+        Returns False when no build will run: prebuilds are disabled or latex_key is a known failure.
+        """
+        if not self.enabled or (latex_key is not None and self.known_failure(latex_key) is not None):
+            return False
+        with self._timers_lock:
+            if problemset_id in self._queued:
+                return True
+        self._enqueue(problemset_id)
+        return True
+
+    def known_failure(self, latex_key: str) -> Optional[str]:
+        """The first error of the last build of this LaTeX, while that failure is remembered."""
+        failure = self._failed.get(latex_key)
+        if failure is None or failure[0] <= self.clock():
+            return None
+        return failure[1]
+
+    def _remember_failure(self, latex_key: str, error: PDFGenerationError) -> None:
+        # Only LaTeX errors repeat on every build; timeouts and a busy pool may not
+        if error.diagnostics is None or not error.diagnostics.errors:
+            return
+        first = error.diagnostics.errors[0]
+        location = f" (line {first.line})" if first.line else ""
+        if len(self._failed) > 1000:
+            self._failed.clear()
+        self._failed[latex_key] = (self.clock() + self.failure_ttl_seconds, f"{first.message}{location}")
+
+    def schedule_for_problem(self, db: Session, problem_id: int) -> None:
+        """Schedules prebuilds for every problemset that contains the given problem."""
+        for problemset_id in self.problemsets_containing(db, problem_id):
+            self.schedule(problemset_id)
+
+    def problemsets_containing(self, db: Session, problem_id: int) -> List[int]:
+        """Problemsets to rebuild when the problem changes; read before a delete removes the links."""
+        if not self.enabled:
+            return []
+        rows = (
+            db.query(ProblemsetProblems.id_problemset)
+            .filter(ProblemsetProblems.id_problem == problem_id)
+            .all()
+        )
+        return [row.id_problemset for row in rows]
+
+    def _enqueue(self, problemset_id: int) -> None:
+        with self._timers_lock:
+            self._timers.pop(problemset_id, None)
+            if problemset_id in self._queued:
+                return
+            self._queued.add(problemset_id)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_worker, name="pdf-prebuild", daemon=True)
+                self._worker.start()
+        self._queue.put(problemset_id)
+
+    def _run_worker(self) -> None:
+        while True:
+            problemset_id = self._queue.get()
+            with self._timers_lock:
+                self._queued.discard(problemset_id) # Edits from now on need another build
+            try:
+                self.build(problemset_id)
+            finally:
+                self._queue.task_done()
+
+    def build(self, problemset_id: int) -> None:
+        """Compiles one problemset into the PDF cache. Failures are logged, never raised."""
+        db = self.session_factory()
+        try:
+            latex_content = pdf_service.get_problemset_latex(db, problemset_id)
+        except ProblemsetNotFound:
+            logger.info(f"Prebuild skipped: problemset {problemset_id} no longer exists.")
+            return
+        except Exception as e:
+            logger.warning(f"Prebuild of problemset {problemset_id} failed while loading LaTeX: {e}")
+            return
+        finally:
+            db.close()
+
+        latex_key = get_pdf_cache().key_for(latex_content)
+        if self.known_failure(latex_key) is not None:
+            logger.info(f"Prebuild of problemset {problemset_id} skipped: its LaTeX failed recently.")
+            return
+        try:
+            pdf_service.compile_latex_to_cached_pdf(latex_content, niceness=PREBUILD_NICENESS)
+            logger.info(f"Prebuilt PDF for problemset {problemset_id}.")
+        except PDFGenerationError as e:
+            logger.info(f"Prebuild of problemset {problemset_id} did not produce a PDF: {e}")
+            self._remember_failure(latex_key, e)
+        except FileNotFoundError as e:
+            logger.info(f"Prebuild of problemset {problemset_id} did not produce a PDF: {e}")
+        except Exception as e:
+            logger.exception(f"Unexpected error prebuilding problemset {problemset_id}: {e}")
@@ -4,17 +4,24 @@ import logging
 import os
 import shutil
 import subprocess
-import tempfile
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
+import hashlib
 import io # Needed for StreamingResponse
 
 from sqlalchemy.orm import Session, joinedload
 
+from ..config import settings
+
 # Import models - adjust paths if needed
 from ..models.problemset import Problemset
 from ..models.problemset_problems import ProblemsetProblems
 from ..models.problem import Problem
+from .pdf_cache import get_pdf_cache
+from .latex_log_parser import LatexLogSummary, parse_latex_log_file
+from .latex_lint import validate_latex, LatexValidationError
+from .figure_cache import get_figure_externalizer
+from .compile_sandbox import CompileLimits, SandboxTimeout, describe_exit, get_workspace_pool, run_sandboxed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,14 +29,26 @@ logger = logging.getLogger(__name__)
 
 class PDFGenerationError(Exception):
     """Custom exception for PDF generation failures."""
-    def __init__(self, message, log=None):
+    def __init__(self, message, log=None, diagnostics=None):
         super().__init__(message)
-        self.log = log # Store compilation log if available
+        self.log = log # Raw compilation log, only kept when explicitly requested
+        self.diagnostics = diagnostics # LatexLogSummary parsed from the .log file, if available
 
 class ProblemsetNotFound(Exception):
     """Custom exception for when a problemset isn't found."""
     pass
 
+# Base name of the .tex/.pdf/.log/.aux files inside a compile directory
+OUTPUT_BASE_NAME = "problemset_output"
+
+def _file_digest(path: Path) -> Optional[str]:
+    """Returns the SHA-256 of a file's contents, or None if it does not exist."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
 def _escape_latex(text: Optional[str]) -> str:
     """
     Basic LaTeX escaping for safety. Handles None input.
@@ -134,105 +153,160 @@ def _generate_problemset_latex(problemset: Problemset) -> str:
     # logger.debug(f"Generated LaTeX string:\n{latex_string[:500]}...") # Log start of LaTeX
     return latex_string
 
-def compile_latex_to_pdf(latex_content: str) -> bytes:
+def run_pdflatex_passes(
+    latex_content: str,
+    work_dir: Path,
+    on_process: Optional[Callable[[subprocess.Popen], None]] = None,
+    reuse_aux: bool = False,
+    niceness: int = 0,
+    keep_raw_log: bool = False,
+    externalize_figures: bool = True,
+    max_passes: int = 2,
+    on_diagnostics: Optional[Callable[[LatexLogSummary], None]] = None,
+) -> Path:
     """
-    Compiles a given LaTeX string into PDF bytes using pdflatex.
-    Handles temporary files and captures logs.
+    Writes the LaTeX source into work_dir and runs pdflatex there (up to 2 passes).
+    When reuse_aux is True and an .aux file from a previous run exists, the second
+    pass is skipped if the first one left the .aux unchanged.
+    on_process receives each spawned process so callers can kill it early.
+    Every pass runs in the compile sandbox (CPU, memory and output-size limits plus
+    a wall-clock deadline); a positive niceness also lowers its scheduling priority.
+    On failure the raised PDFGenerationError carries parsed diagnostics; the raw
+    .log text is attached only when keep_raw_log is True. On success the .log of the
+    final pass is parsed once and passed to on_diagnostics (warnings, box stats).
+    Input that fails static validation is rejected before pdflatex is spawned.
+    With externalize_figures, TikZ pictures are compiled once through the shared
+    figure cache and inlined as PDFs.
+    Returns the path of the generated PDF.
     """
+    try:
+        validate_latex(latex_content)
+    except LatexValidationError as e:
+        raise PDFGenerationError(str(e), diagnostics=e.diagnostics) from e
+
     pdflatex_cmd = shutil.which("pdflatex")
     if not pdflatex_cmd:
         logger.error("pdflatex command not found in PATH.")
         raise FileNotFoundError("pdflatex command not found. Ensure a TeX distribution is installed and in the system PATH.")
 
-    # Use a temporary directory for all intermediate files
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_path = Path(temp_dir)
-        # Define base name for output files
-        output_base_name = "problemset_output"
-        tex_filename = f"{output_base_name}.tex"
-        pdf_filename = f"{output_base_name}.pdf"
-        log_filename = f"{output_base_name}.log"
-        aux_filename = f"{output_base_name}.aux" # Common auxiliary file
-
-        tex_filepath = temp_path / tex_filename
-        pdf_filepath = temp_path / pdf_filename
-        log_filepath = temp_path / log_filename
-
-        # Write the LaTeX content to the .tex file
+    work_dir = Path(work_dir)
+    if externalize_figures and settings.LATEX_EXTERNALIZE_FIGURES:
+        def compile_figure(source: str, figure_dir: Path) -> Path:
+            return run_pdflatex_passes(
+                source, figure_dir, niceness=niceness, externalize_figures=False, max_passes=1,
+            )
+        latex_content = get_figure_externalizer().externalize(latex_content, work_dir, compile_figure)
+
+    tex_filepath = work_dir / f"{OUTPUT_BASE_NAME}.tex"
+    pdf_filepath = work_dir / f"{OUTPUT_BASE_NAME}.pdf"
+    log_filepath = work_dir / f"{OUTPUT_BASE_NAME}.log"
+    aux_filepath = work_dir / f"{OUTPUT_BASE_NAME}.aux"
+
+    # Write the LaTeX content to the .tex file
+    try:
+        with open(tex_filepath, "w", encoding="utf-8") as f:
+            f.write(latex_content)
+        logger.info(f"Temporary .tex file written to {tex_filepath}")
+    except IOError as e:
+        logger.error(f"Failed to write temporary .tex file: {e}", exc_info=True)
+        raise PDFGenerationError(f"Failed to write temporary LaTeX file: {e}")
+
+    # Command for pdflatex
+    cmd = [
+        pdflatex_cmd,
+        "-interaction=nonstopmode",
+        "-file-line-error",
+        f"-output-directory={work_dir}",
+        f"-jobname={OUTPUT_BASE_NAME}",
+        str(tex_filepath),
+    ]
+
+    aux_before = _file_digest(aux_filepath) if reuse_aux else None
+
+    def failure(message: str) -> PDFGenerationError:
+        diagnostics = parse_latex_log_file(log_filepath) if log_filepath.exists() else None
+        raw_log = None
+        if keep_raw_log and log_filepath.exists():
+            raw_log = log_filepath.read_text(encoding="utf-8", errors="replace")
+        return PDFGenerationError(message, log=raw_log, diagnostics=diagnostics)
+
+    limits = CompileLimits.from_settings(niceness=niceness)
+    compilation_successful = False
+    # Run pdflatex twice for references, TOC, etc.
+    for i in range(max_passes):
+        logger.info(f"Running pdflatex command (Pass {i+1}/{max_passes}): {' '.join(cmd)}")
         try:
-            with open(tex_filepath, "w", encoding="utf-8") as f:
-                f.write(latex_content)
-            logger.info(f"Temporary .tex file written to {tex_filepath}")
-        except IOError as e:
-            logger.error(f"Failed to write temporary .tex file: {e}", exc_info=True)
-            raise PDFGenerationError(f"Failed to write temporary LaTeX file: {e}")
-
-        # Command for pdflatex
-        # Use the output_base_name for -jobname
-        cmd = [
-            pdflatex_cmd,
-            "-interaction=nonstopmode",
-            f"-output-directory={temp_dir}",
-            f"-jobname={output_base_name}", # <-- CORRECTED: Use the base name string
-            str(tex_filepath),
-        ]
-
-        log_output = ""
-        compilation_successful = False
-        # Run pdflatex twice for references, TOC, etc.
-        for i in range(2):
-            logger.info(f"Running pdflatex command (Pass {i+1}/2): {' '.join(cmd)}")
-            try:
-                process = subprocess.run(
-                    cmd, capture_output=True, text=True, encoding="utf-8", errors="replace", check=False, timeout=30 # Added timeout
-                )
-                # Append logs from stdout/stderr
-                log_output += f"\n--- Pass {i+1} ---\nReturn Code: {process.returncode}\n"
-                if process.stdout: log_output += f"Stdout:\n{process.stdout}\n"
-                if process.stderr: log_output += f"Stderr:\n{process.stderr}\n"
-
-                # Try reading the specific .log file
-                if log_filepath.exists():
-                    try:
-                        with open(log_filepath, "r", encoding="utf-8", errors="replace") as logf:
-                            partial_log = logf.read()
-                        log_output += f"\nLog File Content (Pass {i+1}):\n{partial_log}\n"
-                        # Check for common LaTeX error indicators in the log
-                        if "! LaTeX Error:" in partial_log or "Fatal error occurred" in partial_log:
-                             logger.warning(f"LaTeX errors detected in log file on pass {i+1}.")
-                             if process.returncode != 0: # Combine log check with return code
-                                 raise PDFGenerationError(f"pdflatex compilation failed with errors (see log).", log=log_output)
-                    except IOError:
-                        log_output += f"\nCould not read log file {log_filepath} on pass {i+1}.\n"
-                else:
-                     log_output += f"\nLog file {log_filepath} not found after pass {i+1}.\n"
-
-                # Check return code strictly after potential log reading
-                if process.returncode != 0:
-                    logger.error(f"pdflatex failed on pass {i+1} with return code {process.returncode}.")
-                    raise PDFGenerationError(f"pdflatex exited with code {process.returncode} on pass {i+1}.", log=log_output)
-
-                # If we completed the second pass without non-zero return code
-                if i == 1 and process.returncode == 0:
-                     compilation_successful = True
-
-            except FileNotFoundError:
-                logger.error("pdflatex command execution failed: FileNotFoundError.")
-                raise # Re-raise the original FileNotFoundError
-            except subprocess.TimeoutExpired:
-                 logger.error("pdflatex command timed out.")
-                 raise PDFGenerationError("pdflatex compilation timed out after 30 seconds.", log=log_output)
-            except Exception as e:
-                # Log the original exception type and message
-                logger.error(f"Subprocess execution failed unexpectedly: {type(e).__name__} - {e}", exc_info=True)
-                # Wrap the original error message in the custom exception
-                raise PDFGenerationError(f"Subprocess execution failed: {e}", log=log_output)
-
-
-        # Final check after loops
-        if not compilation_successful or not pdf_filepath.is_file():
-            logger.error(f"PDF file not found or compilation failed after 2 passes: {pdf_filepath}")
-            raise PDFGenerationError("PDF file was not generated successfully after 2 compilation passes.", log=log_output)
+            # stdout mirrors the .log file, so it is discarded instead of buffered
+            returncode, stderr = run_sandboxed(cmd, work_dir, limits, on_process=on_process)
+            if stderr:
+                logger.warning(f"pdflatex stderr (pass {i+1}): {stderr[:500]}")
+
+            if returncode != 0:
+                reason = describe_exit(returncode)
+                if reason:
+                    logger.error(f"pdflatex {reason} on pass {i+1}.")
+                    raise failure(f"pdflatex {reason} on pass {i+1}.")
+                logger.error(f"pdflatex failed on pass {i+1} with return code {returncode}.")
+                raise failure(f"pdflatex exited with code {returncode} on pass {i+1}.")
+
+            # A previous run's .aux that did not change means references are already resolved
+            if i == 0 and aux_before is not None and _file_digest(aux_filepath) == aux_before:
+                logger.info("Auxiliary file unchanged after first pass, skipping second pass.")
+                compilation_successful = True
+                break
+
+            # If we completed the last pass without non-zero return code
+            if i == max_passes - 1:
+                 compilation_successful = True
+
+        except FileNotFoundError:
+            logger.error("pdflatex command execution failed: FileNotFoundError.")
+            raise # Re-raise the original FileNotFoundError
+        except PDFGenerationError:
+            raise
+        except SandboxTimeout:
+             logger.error("pdflatex command timed out.")
+             raise failure(f"pdflatex compilation timed out after {limits.wall_seconds:g} seconds.")
+        except Exception as e:
+            # Log the original exception type and message
+            logger.error(f"Subprocess execution failed unexpectedly: {type(e).__name__} - {e}", exc_info=True)
+            # Wrap the original error message in the custom exception
+            raise failure(f"Subprocess execution failed: {e}")
+
+    # Final check after loops
+    if not compilation_successful or not pdf_filepath.is_file():
+        logger.error(f"PDF file not found or compilation failed: {pdf_filepath}")
+        raise failure("PDF file was not generated successfully after compilation.")
+
+    # Scanned once, line by line, after the final pass
+    diagnostics = parse_latex_log_file(log_filepath)
+    if diagnostics is not None:
+        if diagnostics.warnings or diagnostics.overfull_boxes or diagnostics.underfull_boxes:
+            logger.info(
+                f"pdflatex succeeded with {len(diagnostics.warnings)} warnings, {diagnostics.overfull_boxes} overfull "
+                f"and {diagnostics.underfull_boxes} underfull boxes."
+            )
+        if on_diagnostics is not None:
+            on_diagnostics(diagnostics)
+
+    return pdf_filepath
+
+
+def compile_latex_to_pdf(
+    latex_content: str,
+    keep_raw_log: bool = False,
+    on_diagnostics: Optional[Callable[[LatexLogSummary], None]] = None,
+) -> bytes:
+    """
+    Compiles a given LaTeX string into PDF bytes using pdflatex.
+    Compiles in a pooled sandbox workspace; failures carry structured diagnostics,
+    successful compiles pass theirs to on_diagnostics.
+    """
+    # Borrow a pooled workspace for all intermediate files; it is wiped afterwards
+    with get_workspace_pool().acquire() as workspace:
+        pdf_filepath = run_pdflatex_passes(
+            latex_content, workspace, keep_raw_log=keep_raw_log, on_diagnostics=on_diagnostics,
+        )
 
         # Read the generated PDF bytes
         try:
@@ -242,7 +316,7 @@ def compile_latex_to_pdf(latex_content: str) -> bytes:
             return pdf_bytes
         except IOError as e:
             logger.error(f"Failed to read generated PDF file: {e}", exc_info=True)
-            raise PDFGenerationError(f"Failed to read generated PDF file: {e}", log=log_output)
+            raise PDFGenerationError(f"Failed to read generated PDF file: {e}")
 
 
 # def get_problemset_pdf(db: Session, problemset_id: int) -> bytes:
@@ -283,13 +357,11 @@ def compile_latex_to_pdf(latex_content: str) -> bytes:
 #         raise PDFGenerationError(f"An unexpected error occurred during PDF compilation: {e}")
 
 
-def get_problemset_pdf(db: Session, problemset_id: int) -> bytes:
+def get_problemset_latex(db: Session, problemset_id: int) -> str:
     """
-    Fetches Problemset data (with related problems), uses existing raw_latex if available
-    or generates it, compiles to PDF, and returns PDF bytes.
+    Fetches Problemset data (with related problems) and returns the LaTeX it renders to:
+    the stored raw_latex if available, otherwise a generated document.
     """
-    logger.info(f"Initiating PDF generation for Problemset ID: {problemset_id}")
-
     # Eagerly load the necessary relationships
     problemset = (
         db.query(Problemset)
@@ -308,24 +380,65 @@ def get_problemset_pdf(db: Session, problemset_id: int) -> bytes:
     # Decide whether to use stored LaTeX or generate new
     if problemset.raw_latex:
         logger.info(f"Using raw LaTeX from DB for Problemset ID: {problemset_id}")
-        latex_content = problemset.raw_latex
-    else:
-        logger.info(f"Generating LaTeX for Problemset '{problemset.title}' (ID: {problemset_id})")
-        try:
-            latex_content = _generate_problemset_latex(problemset)
-        except Exception as e:
-            logger.exception(f"Error generating LaTeX content for Problemset ID {problemset_id}: {e}")
-            raise PDFGenerationError(f"Failed to generate LaTeX content: {e}")
+        return problemset.raw_latex
+
+    logger.info(f"Generating LaTeX for Problemset '{problemset.title}' (ID: {problemset_id})")
+    try:
+        return _generate_problemset_latex(problemset)
+    except Exception as e:
+        logger.exception(f"Error generating LaTeX content for Problemset ID {problemset_id}: {e}")
+        raise PDFGenerationError(f"Failed to generate LaTeX content: {e}")
+
+
+def compile_latex_to_cached_pdf(latex_content: str, niceness: int = 0) -> Path:
+    """
+    Returns the path of the cached PDF for latex_content, compiling it on a cache miss.
+    Concurrent callers asking for the same document wait for a single compile.
+    """
+    cache = get_pdf_cache()
+    key = cache.key_for(latex_content)
+    cached_path = cache.get(key)
+    if cached_path:
+        logger.info(f"PDF cache hit: {key[:12]}")
+        return cached_path
+
+    with cache.lock_for(key):
+        # Another request may have finished the same compile while we waited
+        cached_path = cache.get(key)
+        if cached_path:
+            logger.info(f"PDF cache hit after wait: {key[:12]}")
+            return cached_path
+
+        logger.info(f"PDF cache miss: {key[:12]}, compiling.")
+        with get_workspace_pool().acquire() as workspace:
+            pdf_filepath = run_pdflatex_passes(latex_content, workspace, niceness=niceness)
+            return cache.store(key, pdf_filepath)
+
+
+def get_problemset_pdf_path(db: Session, problemset_id: int) -> Path:
+    """
+    Resolves a problemset's LaTeX and returns the path of its compiled (cached) PDF.
+    """
+    logger.info(f"Initiating PDF generation for Problemset ID: {problemset_id}")
+    latex_content = get_problemset_latex(db, problemset_id)
 
     # Compile to PDF
     logger.info(f"Compiling LaTeX to PDF for Problemset ID: {problemset_id}")
     try:
-        pdf_bytes = compile_latex_to_pdf(latex_content)
+        pdf_path = compile_latex_to_cached_pdf(latex_content)
         logger.info(f"PDF compilation successful for Problemset ID: {problemset_id}")
-        return pdf_bytes
+        return pdf_path
     except (PDFGenerationError, FileNotFoundError) as e:
         logger.error(f"PDF generation failed for Problemset ID {problemset_id}: {e}")
         raise
     except Exception as e:
         logger.exception(f"Unexpected error during PDF compilation for Problemset ID {problemset_id}: {e}")
         raise PDFGenerationError(f"An unexpected error occurred during PDF compilation: {e}")
+
+
+def get_problemset_pdf(db: Session, problemset_id: int) -> bytes:
+    """
+    Fetches Problemset data, compiles it to PDF (through the cache), and returns PDF bytes.
+    Prefer get_problemset_pdf_path for HTTP responses so the file is not held in memory.
+    """
+    return get_problemset_pdf_path(db, problemset_id).read_bytes()
@@ -0,0 +1,154 @@
+# server/services/pdf_splitter.py
+
+import logging
+import math
+import re
+import shutil
+import subprocess
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# A page whose first line looks like this opens a new problem, so cutting before it splits nothing
+PROBLEM_START = re.compile(r"^(?:\\item\b|(?:zadatak|problem|primjer)\s*\d+|\d{1,2}\s*[.)]\s)", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class PageRange:
+    first: int # 1-based, inclusive
+    last: int
+    total: int # pages in the whole document
+
+    @property
+    def spec(self) -> str:
+        return f"{self.first}-{self.last}"
+
+
+def starts_with_problem(page_text: str) -> bool:
+    first_line = next((line.strip() for line in page_text.splitlines() if line.strip()), "")
+    return bool(PROBLEM_START.match(first_line))
+
+
+def plan_page_ranges(
+    page_count: int,
+    pages_per_chunk: int,
+    page_texts: Optional[List[str]] = None,
+    search: int = 2,
+) -> List[PageRange]:
+    """
+    Cuts pages 1..page_count into ranges of about pages_per_chunk pages (balanced, so
+    the last one is not a stub). Each cut moves up to `search` pages to land right
+    before a page that opens a new problem. Where no such page is found (or there is
+    no page text), the page at the cut is put into both ranges, so a problem running
+    across it is complete in at least one of them; duplicates are merged afterwards.
+    """
+    if page_count <= pages_per_chunk:
+        return [PageRange(1, max(page_count, 1), page_count)]
+
+    ranges: List[PageRange] = []
+    first = 1
+    while first <= page_count:
+        remaining = page_count - first + 1
+        chunks_left = math.ceil(remaining / pages_per_chunk)
+        if chunks_left <= 1:
+            ranges.append(PageRange(first, page_count, page_count))
+            break
+        target = first + math.ceil(remaining / chunks_left) # first page of the next range
+        candidates = sorted(range(max(first + 2, target - search), min(page_count, target + search) + 1), key=lambda page: abs(page - target))
+        clean = next((page for page in candidates if page_texts and starts_with_problem(page_texts[page - 1])), None)
+        if clean is not None:
+            ranges.append(PageRange(first, clean - 1, page_count))
+            first = clean
+        else:
+            ranges.append(PageRange(first, target, page_count))
+            first = target # Shared page
+    return ranges
+
+
+class PDFSplitter:
+    '''
+        Splits long PDFs into page-range PDFs with qpdf, so they can be extracted
+        concurrently. pdftotext (poppler), when installed, provides page text for
+        cutting at problem boundaries. Without qpdf, or for short documents, the PDF
+        is returned whole.
+    '''
+    def __init__(self, pages_per_chunk: int = 8, min_pages: int = 12, timeout_seconds: float = 60.0):
+        self.pages_per_chunk = max(1, pages_per_chunk)
+        self.min_pages = min_pages
+        self.timeout_seconds = timeout_seconds
+        self.qpdf_cmd = shutil.which("qpdf")
+        self.pdftotext_cmd = shutil.which("pdftotext")
+        logger.info(
+            f"PDFSplitter initialized (pages per chunk: {pages_per_chunk}, min pages: {min_pages}, "
+            f"qpdf: {bool(self.qpdf_cmd)}, pdftotext: {bool(self.pdftotext_cmd)})."
+        )
+
+    def _run(self, cmd: List[str]) -> Optional[str]:
+        process = subprocess.run(cmd, capture_output=True, text=True, check=False, timeout=self.timeout_seconds)
+        # qpdf exits with 3 when it succeeded with warnings
+        if process.returncode not in (0, 3):
+            logger.warning(f"{Path(cmd[0]).name} failed ({process.returncode}): {process.stderr.strip()[:300]}")
+            return None
+        return process.stdout
+
+    def page_count(self, pdf_path: Path) -> Optional[int]:
+        output = self._run([self.qpdf_cmd, "--show-npages", str(pdf_path)])
+        try:
+            return int(output.strip()) if output is not None else None
+        except ValueError:
+            return None
+
+    def page_texts(self, pdf_path: Path, page_count: int) -> Optional[List[str]]:
+        if not self.pdftotext_cmd:
+            return None
+        output = self._run([self.pdftotext_cmd, "-layout", "-enc", "UTF-8", str(pdf_path), "-"])
+        if output is None:
+            return None
+        pages = output.split("\f") # pdftotext ends every page with a form feed
+        return pages[:page_count] if len(pages) >= page_count else None
+
+    def split(self, pdf_bytes: bytes) -> List[Tuple[Optional[PageRange], bytes]]:
+        """Returns (page range, PDF bytes) per chunk; a single (None, pdf_bytes) when not split."""
+        whole = [(None, pdf_bytes)]
+        if not self.qpdf_cmd:
+            return whole
+        try:
+            with tempfile.TemporaryDirectory(prefix="pdf_split_") as tmp:
+                source = Path(tmp) / "lecture.pdf"
+                source.write_bytes(pdf_bytes)
+                page_count = self.page_count(source)
+                if page_count is None or page_count < self.min_pages:
+                    return whole
+                ranges = plan_page_ranges(page_count, self.pages_per_chunk, self.page_texts(source, page_count))
+
+                parts = []
+                for index, page_range in enumerate(ranges):
+                    target = Path(tmp) / f"part_{index}.pdf"
+                    if self._run([self.qpdf_cmd, "--empty", "--pages", str(source), page_range.spec, "--", str(target)]) is None:
+                        return whole
+                    parts.append((page_range, target.read_bytes()))
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Splitting PDF failed, sending it whole: {e}")
+            return whole
+        logger.info(f"Split {page_count}-page PDF into {len(parts)} parts: {', '.join(r.spec for r, _ in parts)}.")
+        return parts
+
+
+_cached_pdf_splitter: Optional[PDFSplitter] = None
+
+def get_pdf_splitter() -> PDFSplitter:
+    """Returns the process-wide PDFSplitter instance."""
+    global _cached_pdf_splitter
+
+    if _cached_pdf_splitter is None:
+        _cached_pdf_splitter = PDFSplitter(
+            pages_per_chunk=settings.PDF_SPLIT_PAGES_PER_CHUNK,
+            min_pages=settings.PDF_SPLIT_MIN_PAGES,
+        )
+
+    return _cached_pdf_splitter
@@ -0,0 +1,138 @@
+# server/services/prompt_cache.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from google.genai import types
+
+from .llm_providers import LLMProvider
+from .llm_scheduler import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PromptPrefix:
+    '''
+        The part of a request that is the same for every call of an action: the
+        system instruction and the few-shot turns, built once.
+    '''
+    key: str
+    model: str
+    system_instruction: List[types.Part]
+    shot_contents: List[types.Content]
+    tokens: int # Estimated
+    cache_name: Optional[str] = None # Provider-side cached content holding this prefix
+    expires_at: float = 0.0
+    retry_after: float = 0.0 # After a failed create the prefix is sent inline until then
+    _refresh: Optional[asyncio.Task] = field(default=None, repr=False)
+
+
+class PromptPrefixManager:
+    '''
+        Builds each (model, system prompt, shots) prefix once and, when the provider
+        supports it, registers it as cached content so requests only send the user
+        turn. Caches are re-created once expired and their TTL is extended in the
+        background when a request uses them within refresh_margin_seconds of expiry.
+        Prefixes under min_tokens (the provider's minimum cache size) are always
+        sent inline, as is everything while disabled or after a failed create.
+    '''
+    def __init__(
+        self,
+        provider: LLMProvider,
+        enabled: bool = True,
+        ttl_seconds: float = 3600.0,
+        refresh_margin_seconds: float = 300.0,
+        min_tokens: int = 1024,
+        retry_seconds: float = 300.0,
+        clock=time.monotonic,
+    ):
+        self.provider = provider
+        self.enabled = enabled and provider.supports_prompt_cache
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = min(refresh_margin_seconds, ttl_seconds / 2)
+        self.min_tokens = min_tokens
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self._prefixes: Dict[str, PromptPrefix] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.creates = 0
+        self.refreshes = 0
+        logger.info(
+            f"PromptPrefixManager initialized (cached content: {self.enabled}, ttl: {ttl_seconds}s, "
+            f"min tokens: {min_tokens})."
+        )
+
+    def prefix(self, model: str, system_prompt: str, shots: Optional[List[Tuple[str, str]]]) -> PromptPrefix:
+        material = json.dumps({"model": model, "system_prompt": system_prompt, "shots": shots or []})
+        key = hashlib.sha256(material.encode("utf-8")).hexdigest()
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            shot_contents: List[types.Content] = []
+            for user_ex, model_ex in shots or ():
+                shot_contents.append(types.Content(role="user", parts=[types.Part.from_text(text=user_ex)]))
+                shot_contents.append(types.Content(role="model", parts=[types.Part.from_text(text=model_ex)]))
+            shot_texts = [text for pair in shots or () for text in pair]
+            prefix = self._prefixes[key] = PromptPrefix(
+                key=key,
+                model=model,
+                system_instruction=[types.Part.from_text(text=system_prompt)],
+                shot_contents=shot_contents,
+                tokens=estimate_tokens(system_prompt, *shot_texts),
+            )
+        return prefix
+
+    def cacheable(self, prefix: PromptPrefix) -> bool:
+        return self.enabled and prefix.tokens >= self.min_tokens
+
+    async def cache_name(self, prefix: PromptPrefix) -> Optional[str]:
+        """Name of live cached content for prefix, or None to send the prefix inline."""
+        if not self.cacheable(prefix):
+            return None
+        now = self.clock()
+        if prefix.cache_name is not None and now < prefix.expires_at:
+            if now >= prefix.expires_at - self.refresh_margin_seconds and prefix._refresh is None:
+                prefix._refresh = asyncio.create_task(self._extend(prefix))
+            return prefix.cache_name
+        if now < prefix.retry_after:
+            return None
+
+        lock = self._locks.setdefault(prefix.key, asyncio.Lock())
+        async with lock:
+            if prefix.cache_name is not None and self.clock() < prefix.expires_at:
+                return prefix.cache_name # Created while this call waited
+            try:
+                prefix.cache_name = await self.provider.create_prompt_cache(
+                    prefix.model, prefix.system_instruction, prefix.shot_contents, self.ttl_seconds,
+                )
+            except Exception as e:
+                logger.warning(f"Creating cached content for prefix {prefix.key[:12]} failed, sending it inline: {e}")
+                prefix.cache_name = None
+                prefix.retry_after = self.clock() + self.retry_seconds
+                return None
+            prefix.expires_at = self.clock() + self.ttl_seconds
+            self.creates += 1
+            logger.info(f"Cached prompt prefix {prefix.key[:12]} ({prefix.model}, ~{prefix.tokens} tokens) as {prefix.cache_name}.")
+            return prefix.cache_name
+
+    async def _extend(self, prefix: PromptPrefix) -> None:
+        try:
+            await self.provider.refresh_prompt_cache(prefix.cache_name, self.ttl_seconds)
+            prefix.expires_at = self.clock() + self.ttl_seconds
+            self.refreshes += 1
+        except Exception as e:
+            # Left to expire; the next request after that creates a new one
+            logger.warning(f"Extending cached content {prefix.cache_name} failed: {e}")
+        finally:
+            prefix._refresh = None
+
+    def invalidate(self, prefix: PromptPrefix) -> None:
+        """Forgets cached content the provider no longer has (e.g. it expired early)."""
+        logger.info(f"Cached content {prefix.cache_name} for prefix {prefix.key[:12]} is gone, re-creating on next use.")
+        prefix.cache_name = None
+        prefix.expires_at = 0.0
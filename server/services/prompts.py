@@ -1,10 +1,27 @@
 IMAGE_TO_LATEX_USER="Give me the latex for the following math problem."
 
+PROCESS_LECTURE_PDF_USER = "Extract lecture title, group, and list of problems (including LaTeX and category 'A', 'N', 'G', or 'C') according to the schema."
+# Appended when the PDF is one page range of a longer lecture
+PROCESS_LECTURE_PDF_PART_USER = " This file holds pages {first}-{last} of a {total}-page lecture. Include problems cut off at the start or end of these pages as far as they are visible. Leave lecture_name and group_name empty unless they appear on these pages."
+
+# Translation input is wrapped in this instruction, for the examples and the real request alike
+TRANSLATE_INSTRUCTION = 'Translate the following math problem to Bosnian. Keep Latex formatting: "{text}" '
+
 SYSTEM_PROMPTS = {
     "translate": "You are a helpful assistant that translates math problems from English to Bosnian.",
     "fix_latex": "You are a LaTeX expert who fixes malformed LaTeX code and improves mathematical formatting. Your tasks: 1) Fix syntax errors in LaTeX commands, 2) Automatically detect mathematical expressions and wrap them in appropriate math mode ($...$ for inline, $$...$$ for display), 3) Convert common math notation (like x^2, sqrt(x), sum, int) to proper LaTeX, 4) Fix spacing and formatting issues. CRITICAL: Only fix the specific item/task that is provided to you. Do NOT continue with or modify any other items/tasks that might come after. If you receive a single \\item, only fix that \\item. If you receive multiple lines, only fix those exact lines. Do not add new items or continue the enumeration. Don't put the code inside '```'. Don't try to solve the problems, just return everything the same except for fixed latex code.",
     "fix_grammar": "You are a grammar and text improvement expert specializing in LaTeX documents. Your task is to fix grammar, punctuation, and spelling errors while PRESERVING ALL LaTeX formatting exactly as it is. Do NOT change any LaTeX commands like \\text{}, \\item, \\begin{}, \\end{}, etc. Do NOT convert \\text{} to math mode ($...$). Only fix obvious grammar and spelling errors in the text content. IMPORTANT: Always use Bosnian ijekavica standard (ije, ije, ije) instead of ekavica (e, e, e). CRITICAL: Only fix the specific item/task that is provided to you. Do NOT continue with or modify any other items/tasks that might come after. If you receive a single \\item, only fix that \\item. If you receive multiple lines, only fix those exact lines. Do not add new items or continue the enumeration. Keep the original LaTeX structure completely intact. Return the fixed text directly without any code blocks.",
     "hello": "You are a friendly assistant that responds with a JSON greeting message.",
+    "process_lecture_pdf": """You are a highly accurate extraction engine specializing in mathematical lecture documents (PDFs) from math camps. Your task is to parse the provided PDF and extract the following specific pieces of information:
+
+1.  **Lecture Title:** Identify and extract the primary title or main topic of the lecture presented in the document.
+2.  **Target Group:** Determine the target student group for the lecture. This group name **MUST** be exactly one of the following five strings: 'napredna', 'olimpijska', 'pocetna', 'predolimpijska', 'srednja'. Map variations accurately to one of these.
+3.  **Problems:** Identify each distinct mathematical problem. For each problem, provide its full LaTeX source code AND its most likely category ('A' for Algebra, 'N' for Number Theory, 'G' for Geometry, or 'C' for Combinatorics). Collect this information as a list of objects, where each object contains the LaTeX and the category.
+4.  The language of the document is typically Bosnian/Serbo-Croatian.
+
+Adhere strictly to the provided JSON output schema.""",
+    "translate_segment": "You are a helpful assistant that translates single sentences of math problems from English to Bosnian, using standard Bosnian math terminology. Markers like ⟦0⟧ stand for formulas: keep every marker exactly once and unchanged, placed where Bosnian grammar needs it. Return only the translation.",
+    "image_to_latex": "You are a LaTeX extraction engine. You receive an image of a math problem and return its LaTeX code.",
     "extract_latex_from_image": "You are a latex extraction engine, and translation to Bosnian engine. You recive an image of math problems and return latex code. Don't put the code inside '```'. You need to translate given math problems to bosnian, and use appropriate Bosnian math terminology. You return ONLY the translation."
 }
 
@@ -31,4 +48,14 @@ FIX_LATEX_EXAMPLES: list[tuple[str, str]] = [
     ("\\item \\text{Naći derivaciju funkcije: } f(x) = e^x * ln(x)", "\\item \\text{Naći derivaciju funkcije: } $f(x) = e^x \\cdot \\ln(x)$"),
     ("\\item \\text{Rešiti sistem: } x + y = 5, x - y = 1", "\\item \\text{Rešiti sistem: } $x + y = 5$, $x - y = 1$"),
     ("\\item \\text{Izračunati: } (a + b)^2 = a^2 + 2ab + b^2", "\\item \\text{Izračunati: } $(a + b)^2 = a^2 + 2ab + b^2$"),
-]
\ No newline at end of file
+]
+TRANSLATE_EXAMPLES: list[tuple[str, str]] = [
+    (TRANSLATE_INSTRUCTION.format(text="Find the derivative of $f(x) = x^3 - 6x^2 + 5$. Calculate $f'(2)$."), "Nađite derivaciju funkcije $f(x) = x^3 - 6x^2 + 5$. Izračunajte $f'(2)$."),
+]
+
+# Sentences with their formulas replaced by markers, see translation_service
+TRANSLATE_SEGMENT_EXAMPLES: list[tuple[str, str]] = [
+    ("Let ⟦0⟧ be a positive integer such that ⟦1⟧ is prime.", "Neka je ⟦0⟧ prirodan broj takav da je ⟦1⟧ prost broj."),
+    ("Prove that ⟦0⟧ for all real numbers ⟦1⟧.", "Dokazati da vrijedi ⟦0⟧ za sve realne brojeve ⟦1⟧."),
+    ("Find all functions ⟦0⟧ such that", "Odrediti sve funkcije ⟦0⟧ takve da"),
+]
@@ -0,0 +1,115 @@
+# server/services/stream_guard.py
+
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi import Request
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+OUTCOMES = ("completed", "disconnected", "deadline", "failed")
+
+
+class StreamGuard:
+    '''
+        Wraps the body of a streamed LLM response so an abandoned generation stops
+        using capacity. While waiting for the next chunk it checks whether the
+        client is still connected and whether the request deadline has passed;
+        either way the upstream generator is closed, which cancels the model call
+        (or leaves a coalesced stream other subscribers still read).
+        Starlette's own disconnect handling (cancellation, or the generator being
+        dropped after a failed send) is recorded the same way.
+    '''
+    def __init__(self, deadline_seconds: float = 300.0, poll_interval_seconds: float = 0.5):
+        self.deadline_seconds = deadline_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.counts: Dict[str, int] = {outcome: 0 for outcome in OUTCOMES}
+        self.active = 0
+        logger.info(f"StreamGuard initialized (deadline: {deadline_seconds}s, poll interval: {poll_interval_seconds}s).")
+
+    def stats(self) -> dict:
+        return {"active": self.active, **self.counts}
+
+    async def guard(
+        self,
+        request: Request,
+        stream: AsyncIterator[str],
+        route: str,
+        deadline_chunk: Optional[str] = None, # sent as the last chunk when the deadline ends the stream
+    ) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        deadline = started_at + self.deadline_seconds if self.deadline_seconds > 0 else None
+        iterator = stream.__aiter__()
+        pending: Optional[asyncio.Future] = None
+        last_check = started_at
+        chunks = 0
+        outcome = "failed"
+        self.active += 1
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                timeout = self.poll_interval_seconds
+                if deadline is not None:
+                    timeout = min(timeout, deadline - loop.time())
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, timeout))
+
+                if pending in done:
+                    finished, pending = pending, None
+                    try:
+                        chunk = finished.result()
+                    except StopAsyncIteration:
+                        outcome = "completed"
+                        return
+                    chunks += 1
+                    yield chunk
+                    # Fast streams rarely wait, so also check between chunks now and then
+                    if loop.time() - last_check < self.poll_interval_seconds:
+                        continue
+
+                if deadline is not None and loop.time() >= deadline:
+                    outcome = "deadline"
+                    if deadline_chunk is not None:
+                        yield deadline_chunk
+                    return
+                last_check = loop.time()
+                if await request.is_disconnected():
+                    outcome = "disconnected"
+                    return
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "disconnected"
+            raise
+        finally:
+            self.active -= 1
+            if pending is not None:
+                pending.cancel()
+                await asyncio.wait({pending}) # Cancelled inside the generator, which unwinds
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self.counts[outcome] += 1
+            elapsed = loop.time() - started_at
+            message = f"LLM stream {route}: {outcome} after {elapsed:.1f}s and {chunks} chunks."
+            if outcome == "completed":
+                logger.debug(message)
+            else:
+                logger.info(message)
+
+
+_cached_stream_guard: Optional[StreamGuard] = None
+
+def get_stream_guard() -> StreamGuard:
+    """Returns the process-wide StreamGuard instance."""
+    global _cached_stream_guard
+
+    if _cached_stream_guard is None:
+        _cached_stream_guard = StreamGuard(
+            deadline_seconds=settings.LLM_REQUEST_DEADLINE_SECONDS,
+            poll_interval_seconds=settings.LLM_DISCONNECT_POLL_SECONDS,
+        )
+
+    return _cached_stream_guard
@@ -0,0 +1,107 @@
+# server/services/thumbnail_service.py
+
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, features
+
+from .compile_sandbox import CompileLimits, SandboxTimeout, run_sandboxed
+from .pdf_cache import KeyedLocks
+
+logger = logging.getLogger(__name__)
+
+# Bump when rendering settings change so stale thumbnails are not reused
+THUMBNAIL_VERSION = "1"
+
+
+class ThumbnailError(Exception):
+    """Raised when a PDF page cannot be rasterized."""
+    pass
+
+
+class ThumbnailService:
+    '''
+        Renders page 1 of cached PDFs into small WebP (or PNG) images.
+        Thumbnails are keyed by the PDF cache key, so a changed PDF gets a new
+        thumbnail and unchanged ones are never rendered twice.
+    '''
+    def __init__(self, root_dir: str, width: int = 320, max_bytes: int = 0):
+        self.root_dir = Path(root_dir) / "thumbnails"
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.width = width
+        self.max_bytes = max_bytes
+        self.use_webp = features.check("webp")
+        self.media_type = "image/webp" if self.use_webp else "image/png"
+        self._locks = KeyedLocks()
+        logger.info(f"ThumbnailService initialized (root: {self.root_dir}, format: {self.media_type}).")
+
+    def key_for(self, pdf_key: str) -> str:
+        return f"{pdf_key}-w{self.width}-v{THUMBNAIL_VERSION}"
+
+    def path_for(self, pdf_key: str) -> Path:
+        return self.root_dir / f"{self.key_for(pdf_key)}.{'webp' if self.use_webp else 'png'}"
+
+    def thumbnail_for(self, pdf_path: Path) -> Path:
+        """Returns the thumbnail of a cached PDF (named <cache key>.pdf), rendering it on first use."""
+        pdf_key = pdf_path.stem
+        target = self.path_for(pdf_key)
+        if target.is_file():
+            return target
+
+        with self._locks.hold(pdf_key):
+            if target.is_file():
+                return target
+            with tempfile.TemporaryDirectory(dir=self.root_dir) as temp_dir:
+                image = self._rasterize_first_page(pdf_path, Path(temp_dir))
+                tmp_target = Path(temp_dir) / target.name
+                with Image.open(image) as page:
+                    page = page.convert("RGB")
+                    if self.use_webp:
+                        page.save(tmp_target, "WEBP", quality=80, method=6)
+                    else:
+                        page.save(tmp_target, "PNG", optimize=True)
+                os.replace(tmp_target, target)
+        logger.info(f"Rendered thumbnail {target.name} ({target.stat().st_size} bytes).")
+        self.prune()
+        return target
+
+    def _rasterize_first_page(self, pdf_path: Path, work_dir: Path) -> Path:
+        pdftoppm_cmd = shutil.which("pdftoppm")
+        if not pdftoppm_cmd:
+            raise FileNotFoundError("pdftoppm command not found. Install poppler-utils to render thumbnails.")
+        output_prefix = work_dir / "page"
+        cmd = [
+            pdftoppm_cmd, "-png", "-singlefile", "-f", "1", "-l", "1",
+            "-scale-to-x", str(self.width), "-scale-to-y", "-1",
+            str(pdf_path), str(output_prefix),
+        ]
+        try:
+            returncode, stderr = run_sandboxed(cmd, work_dir, CompileLimits.from_settings())
+        except SandboxTimeout as e:
+            raise ThumbnailError(f"pdftoppm timed out: {e}")
+        image = output_prefix.with_suffix(".png")
+        if returncode != 0 or not image.is_file():
+            raise ThumbnailError(f"pdftoppm failed ({returncode}): {stderr.strip()[:300]}")
+        return image
+
+    def prune(self) -> None:
+        """Evicts least recently rendered thumbnails once the directory grows past max_bytes."""
+        if not self.max_bytes:
+            return
+        entries = []
+        for path in self.root_dir.glob("*.*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,317 @@
+# server/services/translation_service.py
+
+import asyncio
+import hashlib
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.translation_memory import TranslationMemoryEntry
+from .ai_service import AIService
+
+logger = logging.getLogger(__name__)
+
+TARGET_LANGUAGE = "bs"
+
+# Formulas (and figures) are never translated; inside a sentence they become ⟦n⟧ markers
+FORMULA = re.compile(
+    r"\$\$.*?\$\$"
+    r"|\$(?:\\.|[^$\\])+\$"
+    r"|\\\[.*?\\\]"
+    r"|\\\(.*?\\\)"
+    r"|\\begin\{(equation|align|gather|multline|eqnarray|tikzpicture)(\*?)\}.*?\\end\{\1\2\}",
+    re.DOTALL,
+)
+# Structural commands are kept verbatim between sentences
+STRUCTURE = re.compile(r"\\(?:(?:item|newline|par)\b|begin\{[A-Za-z*]+\}|end\{[A-Za-z*]+\})(?:\[[^\]]*\])?\s*|\\\\\s*")
+MARKER = re.compile(r"⟦(\d+)⟧")
+# Split after sentence punctuation, and at blank lines and line breaks, but never inside {...} or (...)
+SENTENCE_BREAK = re.compile(r"(?<=[.!?;:])\s+|\s*\n\s*")
+_DEPTH = {"{": 1, "(": 1, "}": -1, ")": -1}
+BRACE = re.compile(r"(?<!\\)[{}]")
+_FOLD = re.compile(r"[^\w⟦⟧]+")
+_FINAL_PUNCTUATION = tuple(".!?:;,")
+
+
+@dataclass
+class Segment:
+    source: str # Sentence with local markers ⟦0⟧, ⟦1⟧, ... in order of appearance
+    formulas: List[str] # The LaTeX each local marker stands for
+    separator: str # Whitespace that followed the sentence
+    verbatim: bool = False # Structural LaTeX, copied as it is
+
+    @property
+    def translatable(self) -> bool:
+        return not self.verbatim and bool(re.search(r"[^\W\d_]", MARKER.sub("", self.source)))
+
+    @property
+    def key(self) -> str:
+        return hashlib.sha256(" ".join(self.source.split()).encode("utf-8")).hexdigest()
+
+    @property
+    def fuzzy_key(self) -> str:
+        return fuzzy_key(self.source)
+
+    def render(self, target: str) -> str:
+        return MARKER.sub(lambda m: self.formulas[int(m.group(1))], target) + self.separator
+
+
+def fuzzy_key(source: str) -> str:
+    """Near-exact key: case, punctuation and spacing do not matter."""
+    folded = " ".join(_FOLD.sub(" ", source.lower()).split())
+    return hashlib.sha256(folded.encode("utf-8")).hexdigest()
+
+
+def _group_depths(masked: str) -> List[int]:
+    """Brace/paren nesting depth before every character; escaped \\{ and \\( do not count."""
+    depths: List[int] = []
+    depth, escaped = 0, False
+    for char in masked:
+        depths.append(depth)
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        else:
+            depth = max(0, depth + _DEPTH.get(char, 0))
+    depths.append(depth)
+    return depths
+
+
+def _sentences(masked: str, formulas: List[str]) -> List[Segment]:
+    pieces: List[Tuple[str, str]] = []
+    depths = _group_depths(masked)
+    position = 0
+    for match in SENTENCE_BREAK.finditer(masked):
+        if depths[match.start()] > 0: # "\emph{Note. It is hard}", "(e.g. $x$)"
+            continue
+        pieces.append((masked[position:match.start()], match.group(0)))
+        position = match.end()
+    pieces.append((masked[position:], ""))
+
+    segments: List[Segment] = []
+    for piece, separator in pieces:
+        if not piece and not separator:
+            continue
+        local: List[str] = []
+
+        def renumber(marker: re.Match) -> str:
+            local.append(formulas[int(marker.group(1))])
+            return f"⟦{len(local) - 1}⟧"
+
+        segments.append(Segment(MARKER.sub(renumber, piece), local, separator))
+    return segments
+
+
+def segment_latex(text: str) -> List[Segment]:
+    """
+    Splits a problem into sentences whose formulas are replaced by locally numbered
+    markers, and verbatim structural commands (\\item, \\begin{enumerate}, ...).
+    Rendering every segment with its own source gives the text back.
+    """
+    formulas: List[str] = []
+
+    def protect(match: re.Match) -> str:
+        formulas.append(match.group(0))
+        return f"⟦{len(formulas) - 1}⟧"
+
+    masked = FORMULA.sub(protect, text)
+    segments: List[Segment] = []
+    position = 0
+    for match in STRUCTURE.finditer(masked):
+        segments.extend(_sentences(masked[position:match.start()], formulas))
+        segments.append(Segment(match.group(0), [], "", verbatim=True))
+        position = match.end()
+    segments.extend(_sentences(masked[position:], formulas))
+    return segments
+
+
+def markers_intact(segment: Segment, target: str) -> bool:
+    found = sorted(int(index) for index in MARKER.findall(target))
+    return found == list(range(len(segment.formulas)))
+
+
+def braces_intact(segment: Segment, target: str) -> bool:
+    """A translation that adds or drops a brace would break the LaTeX it is rendered into."""
+    def counts(text: str) -> Tuple[int, int]:
+        found = BRACE.findall(text)
+        return found.count("{"), found.count("}")
+    return counts(target) == counts(segment.source)
+
+
+def _match_punctuation(source: str, matched_source: str, target: str) -> str:
+    """A near-exact match may end in different punctuation; the new source's wins."""
+    end, matched_end = source.rstrip()[-1:], matched_source.rstrip()[-1:]
+    if end == matched_end:
+        return target
+    target = target.rstrip()
+    if matched_end in _FINAL_PUNCTUATION and target.endswith(matched_end):
+        target = target[:-1]
+    return target + end if end in _FINAL_PUNCTUATION else target
+
+
+class TranslationMemory:
+    '''
+        Stored segment translations for one target language. Lookups try the exact
+        key first, then the near-exact (folded) key.
+    '''
+    def __init__(self, db: Session, language: str = TARGET_LANGUAGE):
+        self.db = db
+        self.language = language
+
+    def lookup(self, segments: Sequence[Segment]) -> Dict[str, str]:
+        """Translations by segment key, for every segment that has a match."""
+        if not segments:
+            return {}
+        keys = {segment.key for segment in segments}
+        fuzzy_keys = {segment.fuzzy_key for segment in segments}
+        entries = self.db.query(TranslationMemoryEntry).filter(
+            TranslationMemoryEntry.target_language == self.language,
+            or_(TranslationMemoryEntry.source_hash.in_(keys), TranslationMemoryEntry.fuzzy_hash.in_(fuzzy_keys)),
+        ).all()
+        exact = {entry.source_hash: entry for entry in entries}
+        fuzzy = {entry.fuzzy_hash: entry for entry in entries}
+
+        found: Dict[str, str] = {}
+        now = datetime.utcnow()
+        for segment in segments:
+            entry = exact.get(segment.key)
+            target = entry.target_text if entry else None
+            if entry is None:
+                entry = fuzzy.get(segment.fuzzy_key)
+                if entry is None:
+                    continue
+                target = _match_punctuation(segment.source, entry.source_text, entry.target_text)
+            if segment.key not in found:
+                entry.uses = (entry.uses or 0) + 1
+                entry.last_used_at = now
+            found[segment.key] = target
+        self.db.commit()
+        return found
+
+    def store(self, translations: Sequence[Tuple[Segment, str]]) -> None:
+        keys = [segment.key for segment, _ in translations]
+        stored = {row.source_hash for row in self.db.query(TranslationMemoryEntry.source_hash).filter(
+            TranslationMemoryEntry.target_language == self.language,
+            TranslationMemoryEntry.source_hash.in_(keys),
+        )}
+        for segment, target in translations:
+            if segment.key in stored:
+                continue
+            stored.add(segment.key)
+            self.db.add(TranslationMemoryEntry(
+                source_hash=segment.key,
+                fuzzy_hash=segment.fuzzy_key,
+                source_text=" ".join(segment.source.split()),
+                target_text=target,
+                target_language=self.language,
+                uses=0,
+            ))
+        try:
+            self.db.commit()
+        except IntegrityError:
+            # A concurrent batch stored the same sentence first; its translation is as good
+            self.db.rollback()
+            logger.info("Translation memory: concurrent insert of the same sentences, keeping the existing entries.")
+
+
+@dataclass
+class TranslationResult:
+    original_text: str
+    translated_text: str = ""
+    segments: int = 0
+    reused: int = 0 # From translation memory (or repeated within the batch)
+    translated: int = 0 # Sent to the model
+    status: str = "translated" # translated, fallback (whole problem sent to the model), error
+    error: Optional[str] = None
+    failed_keys: List[str] = field(default_factory=list)
+
+
+class BatchTranslator:
+    '''
+        Translates many problems at once through the translation memory. Every problem
+        is cut into sentences with formulas masked (segment_latex), known sentences
+        come from the memory, and each unique new sentence goes to the model once,
+        concurrently. A problem whose sentence translations come back without their
+        formula markers, or with different braces, is translated whole instead.
+    '''
+    def __init__(self, max_concurrency: int = 6):
+        self.max_concurrency = max(1, max_concurrency)
+
+    async def _translate_segment(self, ai_service: AIService, segment: Segment, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            stream = await ai_service.translate_segment(user_input=segment.source)
+            return "".join([chunk async for chunk in stream]).strip()
+
+    async def _translate_whole(self, ai_service: AIService, text: str, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            stream = await ai_service.translate(user_input=text)
+            return "".join([chunk async for chunk in stream]).strip()
+
+    async def translate(self, ai_service: AIService, db: Session, texts: Sequence[str]) -> List[TranslationResult]:
+        memory = TranslationMemory(db)
+        plans = [segment_latex(text) for text in texts]
+        unique: Dict[str, Segment] = {}
+        for segments in plans:
+            for segment in segments:
+                if segment.translatable:
+                    unique.setdefault(segment.key, segment)
+
+        known = memory.lookup(list(unique.values()))
+        new = [segment for key, segment in unique.items() if key not in known]
+        logger.info(f"Batch translation: {len(texts)} texts, {len(unique)} unique sentences, {len(known)} from memory, {len(new)} to translate.")
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        outputs = await asyncio.gather(*(self._translate_segment(ai_service, segment, semaphore) for segment in new), return_exceptions=True)
+        fresh: List[Tuple[Segment, str]] = []
+        for segment, output in zip(new, outputs):
+            if isinstance(output, BaseException):
+                logger.warning(f"Batch translation: sentence failed: {output}")
+            elif output and markers_intact(segment, output) and braces_intact(segment, output):
+                fresh.append((segment, output))
+            else:
+                logger.warning(f"Batch translation: formula markers or braces lost in '{segment.source[:40]}', not stored.")
+        if fresh:
+            memory.store(fresh)
+        translations = {**known, **{segment.key: target for segment, target in fresh}}
+
+        results: List[TranslationResult] = []
+        fallback: List[int] = []
+        counted = set()
+        for index, (text, segments) in enumerate(zip(texts, plans)):
+            result = TranslationResult(original_text=text, segments=sum(s.translatable for s in segments))
+            parts = []
+            for segment in segments:
+                if not segment.translatable:
+                    parts.append(segment.render(segment.source))
+                    continue
+                target = translations.get(segment.key)
+                if target is None:
+                    result.failed_keys.append(segment.key)
+                    continue
+                if segment.key in known or segment.key in counted:
+                    result.reused += 1
+                else:
+                    result.translated += 1
+                    counted.add(segment.key)
+                parts.append(segment.render(target))
+            result.translated_text = "".join(parts).strip()
+            if result.failed_keys:
+                fallback.append(index)
+            results.append(result)
+
+        if fallback:
+            outputs = await asyncio.gather(*(self._translate_whole(ai_service, texts[i], semaphore) for i in fallback), return_exceptions=True)
+            for index, output in zip(fallback, outputs):
+                result = results[index]
+                if isinstance(output, BaseException) or not output:
+                    result.status, result.error, result.translated_text = "error", str(output) or "Empty translation.", ""
+                else:
+                    result.status, result.translated_text = "fallback", output
+        return results
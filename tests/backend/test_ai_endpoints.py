@@ -0,0 +1,56 @@
+# tests/backend/test_ai_endpoints.py
+
+import pytest
+from fastapi import status
+
+from server.dependencies import get_gemini_service
+from server.main import app
+from server.services.ai_response_cache import AIResponseCache, get_ai_response_cache
+from server.services.image_preprocessing import ImageResultCache, get_image_result_cache
+
+
+class FakeGemini:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = []
+
+    async def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        for chunk in self.chunks:
+            yield chunk
+
+
+@pytest.fixture
+def fake_gemini(client):
+    gemini = FakeGemini(["Nađite ", "$x$. "])
+    cache = AIResponseCache()
+    app.dependency_overrides[get_gemini_service] = lambda: gemini
+    image_cache = ImageResultCache()
+    app.dependency_overrides[get_ai_response_cache] = lambda: cache
+    app.dependency_overrides[get_image_result_cache] = lambda: image_cache
+    return gemini
+
+
+def test_translate_uses_shared_service_and_cache(client, fake_gemini):
+    payload = {"latex_text": "Find $x$."}
+    first = client.post("/translate/latex-to-bosnian", json=payload)
+    second = client.post("/translate/latex-to-bosnian", json=payload)
+
+    assert first.status_code == status.HTTP_200_OK
+    assert first.json()["translated_text"] == "Nađite $x$."
+    assert second.json() == first.json()
+    assert len(fake_gemini.calls) == 1
+    assert 'Keep Latex formatting: "Find $x$."' in fake_gemini.calls[0]["user_input_text"]
+
+
+def test_image_to_latex_streams_through_service(client, fake_gemini):
+    response = client.post("/image-to-latex", files={"file": ("zadatak.png", b"\x89PNG fake", "image/png")})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["latex_text"] == "Nađite $x$."
+    assert fake_gemini.calls[0]["user_input_bytes_mime_type"] == "image/png"
+
+
+def test_image_to_latex_rejects_non_images(client, fake_gemini):
+    response = client.post("/image-to-latex", files={"file": ("a.txt", b"text", "text/plain")})
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
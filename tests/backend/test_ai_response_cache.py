@@ -0,0 +1,89 @@
+# tests/backend/test_ai_response_cache.py
+
+import pytest
+
+from server.services.ai_response_cache import AIResponseCache
+from server.services.ai_service import AIService
+
+
+class FakeGemini:
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.calls = []
+
+    async def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        for index, chunk in enumerate(self.chunks):
+            if self.fail_after is not None and index == self.fail_after:
+                raise RuntimeError("upstream failed")
+            yield chunk
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.asyncio
+async def test_repeated_action_is_replayed_as_stream():
+    gemini = FakeGemini(["\\item ", "$x^2$"])
+    service = AIService(gemini=gemini, cache=AIResponseCache())
+
+    first = await collect(await service.fix_latex(user_input="\\item x^2"))
+    second = await collect(await service.fix_latex(user_input="\\item x^2"))
+
+    assert first == second == ["\\item ", "$x^2$"]
+    assert len(gemini.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_key_covers_action_and_sampling_params():
+    gemini = FakeGemini(["ok"])
+    service = AIService(gemini=gemini, cache=AIResponseCache())
+
+    await collect(await service.fix_latex(user_input="tekst"))
+    await collect(await service.fix_grammar(user_input="tekst"))
+    await collect(await service.fix_latex(user_input="tekst", temperature=0.7))
+
+    assert len(gemini.calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_sampled_calls_are_never_replayed():
+    gemini = FakeGemini(["ok"])
+    cache = AIResponseCache()
+    service = AIService(gemini=gemini, cache=cache)
+
+    for _ in range(2):
+        await collect(await service.fix_latex(user_input="tekst", temperature=0.7))
+
+    assert len(gemini.calls) == 2
+    assert cache.hits == cache.misses == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_stream_is_not_cached():
+    gemini = FakeGemini(["a", "b"], fail_after=1)
+    cache = AIResponseCache()
+    service = AIService(gemini=gemini, cache=cache)
+
+    with pytest.raises(RuntimeError):
+        await collect(await service.fix_latex(user_input="x"))
+
+    assert cache.hits == 0
+    assert len(cache._entries) == 0
+
+
+def test_lru_bound_and_ttl():
+    cache = AIResponseCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", ["1"])
+    cache.put("b", ["2"])
+    cache.get("a")
+    cache.put("c", ["3"])
+
+    assert cache.get("b") is None # Least recently used entry was evicted
+    assert cache.get("a") == ["1"]
+
+    expired = AIResponseCache(ttl_seconds=0)
+    expired.put("a", ["1"])
+    assert expired.get("a") is None
@@ -0,0 +1,75 @@
+# tests/backend/test_compile_sandbox.py
+
+import sys
+import threading
+import time
+
+import pytest
+
+from server.services import compile_sandbox
+from server.services.compile_sandbox import CompileLimits, SandboxTimeout, WorkspacePool, WorkspaceUnavailable, run_sandboxed
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="rlimits and process groups are POSIX only")
+
+
+def test_limits_are_applied_in_child(tmp_path):
+    script = (
+        "import resource, sys;"
+        "sys.stderr.write(' '.join(str(resource.getrlimit(r)[0]) for r in "
+        "(resource.RLIMIT_CPU, resource.RLIMIT_AS, resource.RLIMIT_FSIZE)))"
+    )
+    limits = CompileLimits(cpu_seconds=5, memory_bytes=512 * 1024 * 1024, output_bytes=1024 * 1024, wall_seconds=10)
+
+    returncode, stderr = run_sandboxed([sys.executable, "-c", script], tmp_path, limits)
+
+    assert returncode == 0
+    assert stderr.split() == ["5", str(512 * 1024 * 1024), str(1024 * 1024)]
+
+
+def test_wall_deadline_kills_process(tmp_path):
+    limits = CompileLimits(wall_seconds=0.5)
+    started = time.monotonic()
+
+    with pytest.raises(SandboxTimeout):
+        run_sandboxed([sys.executable, "-c", "import time; time.sleep(30)"], tmp_path, limits)
+
+    assert time.monotonic() - started < 5
+
+
+def test_workspaces_are_wiped_and_reused(tmp_path):
+    pool = WorkspacePool(str(tmp_path), size=1, acquire_timeout=0.1)
+
+    with pool.acquire() as workspace:
+        (workspace / "problemset_output.aux").write_text("stale")
+        (workspace / "sub").mkdir()
+        with pytest.raises(WorkspaceUnavailable):
+            with pool.acquire():
+                pass
+
+    with pool.acquire() as reused:
+        assert reused == workspace
+        assert list(reused.iterdir()) == []
+    pool.close()
+
+
+def test_concurrent_first_use_creates_one_pool(tmp_path, monkeypatch):
+    created = []
+    class SlowPool:
+        def __init__(self, root_dir, size):
+            time.sleep(0.05) # Widens the window in which a second thread could build another pool
+            created.append(self)
+        def close(self):
+            pass
+    monkeypatch.setattr(compile_sandbox, "WorkspacePool", SlowPool)
+    monkeypatch.setattr(compile_sandbox, "_cached_workspace_pool", None)
+    monkeypatch.setattr(compile_sandbox, "_tmpfs_base_dir", lambda: str(tmp_path))
+    pools = []
+
+    threads = [threading.Thread(target=lambda: pools.append(compile_sandbox.get_workspace_pool())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert len(created) == 1
+    assert len(pools) == 8 and all(pool is created[0] for pool in pools)
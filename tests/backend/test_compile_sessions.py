@@ -0,0 +1,91 @@
+# tests/backend/test_compile_sessions.py
+
+import asyncio
+import time
+
+import pytest
+
+from server.services import pdf_service
+from server.services.compile_session_service import (
+    CompileSessionManager,
+    CompileSessionError,
+    CompileSuperseded,
+)
+
+
+def fake_pdflatex(calls):
+    # Stands in for pdflatex: records the source and writes a "PDF" into the work dir
+    def run(latex_content, work_dir, **kwargs):
+        calls.append(latex_content)
+        time.sleep(0.05)
+        pdf_path = work_dir / "problemset_output.pdf"
+        pdf_path.write_bytes(latex_content.encode())
+        return pdf_path
+    return run
+
+
+@pytest.mark.asyncio
+async def test_rapid_requests_are_coalesced(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pdf_service, "run_pdflatex_passes", fake_pdflatex(calls))
+    manager = CompileSessionManager(root_dir=str(tmp_path), debounce_seconds=0.05)
+
+    results = await asyncio.gather(
+        manager.compile("editor-1", "first"),
+        manager.compile("editor-1", "second"),
+        manager.compile("editor-1", "third"),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[0], CompileSuperseded)
+    assert isinstance(results[1], CompileSuperseded)
+    assert results[2] == b"third"
+    assert calls == ["third"]
+
+
+@pytest.mark.asyncio
+async def test_session_keeps_work_dir_between_runs(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pdf_service, "run_pdflatex_passes", fake_pdflatex(calls))
+    manager = CompileSessionManager(root_dir=str(tmp_path), debounce_seconds=0)
+
+    await manager.compile("editor-1", "a")
+    work_dir = manager.get_session("editor-1").work_dir
+    await manager.compile("editor-1", "b")
+
+    assert manager.get_session("editor-1").work_dir == work_dir
+    assert work_dir.is_dir()
+    assert calls == ["a", "b"]
+
+
+def test_idle_sessions_expire(tmp_path):
+    manager = CompileSessionManager(root_dir=str(tmp_path), idle_ttl_seconds=0)
+    session = manager.get_session("editor-1")
+    session.last_used -= 1
+
+    manager.expire_idle()
+
+    assert not session.work_dir.exists()
+    assert manager.close_session("editor-1") is False
+
+
+@pytest.mark.asyncio
+async def test_idle_sessions_expire_without_further_requests(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_service, "run_pdflatex_passes", fake_pdflatex([]))
+    manager = CompileSessionManager(
+        root_dir=str(tmp_path), idle_ttl_seconds=0.1, debounce_seconds=0, sweep_interval_seconds=0.05,
+    )
+
+    await manager.compile("editor-1", "a")
+    work_dir = manager.root_dir / "editor-1"
+    assert work_dir.is_dir()
+    await asyncio.sleep(0.4)
+
+    assert not work_dir.exists()
+    assert manager._sweeper.done() # Nothing left to sweep
+
+
+def test_invalid_session_id_rejected(tmp_path):
+    manager = CompileSessionManager(root_dir=str(tmp_path))
+    with pytest.raises(CompileSessionError):
+        manager.get_session("../etc")
@@ -0,0 +1,77 @@
+# tests/backend/test_document_fix.py
+
+import asyncio
+
+import pytest
+
+from server.services.document_fix_service import DocumentFixService, split_document
+
+DOCUMENT = r"""\documentclass{article}
+\begin{document}
+\begin{enumerate}
+  \item Rijesiti x^2 = 4.
+  \item Izracunati sum_{k=1}^n k.
+\end{enumerate}
+\begin{problem}
+Dokazati da je sqrt(2) iracionalan.
+\end{problem}
+\end{document}
+"""
+
+
+def test_split_round_trips_and_finds_items():
+    chunks = split_document(DOCUMENT)
+
+    assert "".join(c.text for c in chunks) == DOCUMENT
+    fixable = [c.text.strip() for c in chunks if c.fixable]
+    assert fixable == [
+        "\\item Rijesiti x^2 = 4.",
+        "\\item Izracunati sum_{k=1}^n k.",
+        "\\begin{problem}\nDokazati da je sqrt(2) iracionalan.\n\\end{problem}",
+    ]
+
+
+class SlowFirstAI:
+    '''Wraps x^2 in math mode; the first chunk is the slowest.'''
+    def __init__(self):
+        self.inputs = []
+        self.running = 0
+        self.max_running = 0
+
+    async def fix_latex(self, user_input):
+        self.inputs.append(user_input)
+        delay = 0.05 if len(self.inputs) == 1 else 0.01
+        async def stream():
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            await asyncio.sleep(delay)
+            self.running -= 1
+            yield user_input.replace("x^2", "$x^2$")
+        return stream()
+
+
+@pytest.mark.asyncio
+async def test_results_in_document_order_with_bounded_concurrency():
+    ai = SlowFirstAI()
+    service = DocumentFixService(max_concurrency=2)
+
+    results = [r async for r in service.fix_document(ai, DOCUMENT)]
+
+    assert [r["index"] for r in results] == sorted(r["index"] for r in results)
+    assert "\\item Rijesiti $x^2$ = 4." in "".join(r["fixed"] for r in results)
+    assert [r["status"] for r in results if r["status"] != "passthrough"] == ["fixed", "unchanged", "unchanged"]
+    assert ai.max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_already_fixed_chunks_are_skipped():
+    ai = SlowFirstAI()
+    service = DocumentFixService()
+    first = [r async for r in service.fix_document(ai, DOCUMENT)]
+    fixed_document = "".join(r["fixed"] for r in first)
+
+    ai.inputs.clear()
+    second = [r async for r in service.fix_document(ai, fixed_document)]
+
+    assert ai.inputs == []
+    assert {r["status"] for r in second} == {"passthrough", "skipped"}
@@ -0,0 +1,107 @@
+# tests/backend/test_figure_cache.py
+
+import threading
+import time
+from types import SimpleNamespace
+
+from server.services.figure_cache import FigureExternalizer
+from server.services.pdf_cache import PDFCache
+
+DOCUMENT = r"""\documentclass{article}
+\usepackage{tikz}
+\usetikzlibrary{calc}
+\title{Geometrija}
+\begin{document}
+Trokut $ABC$:
+\begin{tikzpicture}
+\draw (0,0) -- (1,0) -- (0,1) -- cycle;
+\end{tikzpicture}
+% \begin{tikzpicture}\draw (0,0) circle (1);\end{tikzpicture}
+\end{document}
+"""
+
+
+def make_externalizer(tmp_path):
+    compiled = []
+    def compile_figure(source, figure_dir):
+        compiled.append(source)
+        pdf_path = figure_dir / "figure.pdf"
+        pdf_path.write_bytes(b"%PDF-1.5 figure")
+        return pdf_path
+    return FigureExternalizer(PDFCache(str(tmp_path), subdir="figure_cache", linearize=False)), compile_figure, compiled
+
+
+def test_figure_is_compiled_once_and_inlined(tmp_path):
+    externalizer, compile_figure, compiled = make_externalizer(tmp_path)
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    first = externalizer.externalize(DOCUMENT, work_dir, compile_figure)
+    second = externalizer.externalize(DOCUMENT.replace("Geometrija", "Drugi naslov"), work_dir, compile_figure)
+
+    assert len(compiled) == 1
+    assert "\\usetikzlibrary{calc}" in compiled[0]
+    assert "\\title" not in compiled[0]
+    assert "\\usepackage{graphicx}\\begin{document}" in first
+    # Same number of lines, so pdflatex line numbers still match the source
+    assert first.splitlines()[-2:] == DOCUMENT.splitlines()[-2:]
+    assert len(first.splitlines()) == len(DOCUMENT.splitlines())
+    assert "\\draw (0,0) -- (1,0)" not in first
+    assert "% \\begin{tikzpicture}" in first # Commented-out figures are left alone
+    [local_name] = [p.name for p in work_dir.glob("fig-*.pdf")]
+    assert f"\\includegraphics{{{local_name}}}" in second
+
+
+def test_failed_figure_stays_inline(tmp_path):
+    externalizer = FigureExternalizer(PDFCache(str(tmp_path), subdir="figure_cache", linearize=False))
+    def failing_compile(source, figure_dir):
+        raise RuntimeError("pdflatex failed")
+
+    result = externalizer.externalize(DOCUMENT, tmp_path, failing_compile)
+
+    assert result == DOCUMENT
+
+
+class LatexFailure(Exception):
+    def __init__(self, errors):
+        super().__init__("pdflatex failed")
+        self.diagnostics = SimpleNamespace(errors=errors)
+
+
+def test_only_latex_errors_are_remembered(tmp_path):
+    externalizer, compile_figure, compiled = make_externalizer(tmp_path)
+    failures = [LatexFailure([]), LatexFailure(["Undefined control sequence."])] # A timeout, then a real error
+    def flaky_compile(source, figure_dir):
+        if failures:
+            raise failures.pop(0)
+        return compile_figure(source, figure_dir)
+
+    assert externalizer.externalize(DOCUMENT, tmp_path, flaky_compile) == DOCUMENT
+    assert externalizer.externalize(DOCUMENT, tmp_path, flaky_compile) == DOCUMENT # Retried after the timeout
+    assert externalizer.externalize(DOCUMENT, tmp_path, flaky_compile) == DOCUMENT # LaTeX error remembered
+    assert compiled == []
+
+    externalizer.clock = lambda: time.monotonic() + externalizer.failure_ttl_seconds + 1
+    assert externalizer.externalize(DOCUMENT, tmp_path, flaky_compile) != DOCUMENT
+    assert len(compiled) == 1
+
+
+def test_cache_locks_are_dropped_once_released(tmp_path):
+    cache = PDFCache(str(tmp_path), linearize=False)
+    order = []
+
+    def second():
+        with cache.lock_for("a"):
+            order.append("second")
+
+    with cache.lock_for("a"):
+        with cache.lock_for("b"): # Other keys never wait on "a"
+            pass
+        waiter = threading.Thread(target=second)
+        waiter.start()
+        time.sleep(0.05)
+        order.append("first")
+    waiter.join(timeout=2)
+
+    assert order == ["first", "second"]
+    assert len(cache._locks) == 0
@@ -0,0 +1,95 @@
+# tests/backend/test_gemini_coalescing.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from server.services.gemini_service import GeminiService
+
+
+class FakeModels:
+    def __init__(self, chunks, delay=0.01, fail=False):
+        self.chunks = chunks
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = False
+
+    async def generate_content_stream(self, model, contents, config):
+        self.calls += 1
+        async def response():
+            try:
+                for chunk in self.chunks:
+                    await asyncio.sleep(self.delay)
+                    yield SimpleNamespace(text=chunk)
+                if self.fail:
+                    raise RuntimeError("quota exceeded")
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        return response()
+
+
+def make_service(**kwargs):
+    models = FakeModels(**kwargs)
+    return GeminiService(client=SimpleNamespace(aio=SimpleNamespace(models=models))), models
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def request(text="\\item x^2"):
+    return dict(model="m", system_prompt="fix", user_input_text=text)
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_requests_share_one_stream():
+    service, models = make_service(chunks=["a", "b", "c"])
+
+    results = await asyncio.gather(
+        collect(service.stream(**request())),
+        collect(service.stream(**request("\\item x^2\r\n"))), # Same after normalization
+    )
+
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+    assert models.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_late_joiner_gets_buffered_prefix():
+    service, models = make_service(chunks=["a", "b", "c", "d"], delay=0.02)
+    first = service.stream(**request())
+    first_chunks = [await first.__anext__(), await first.__anext__()]
+
+    late = await collect(service.stream(**request()))
+    first_chunks += await collect(first)
+
+    assert late == first_chunks == ["a", "b", "c", "d"]
+    assert models.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_upstream_error_reaches_every_subscriber():
+    service, models = make_service(chunks=["a"], fail=True)
+
+    results = await asyncio.gather(
+        collect(service.stream(**request())),
+        collect(service.stream(**request())),
+        return_exceptions=True,
+    )
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert models.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_upstream_cancelled_when_all_subscribers_leave():
+    service, models = make_service(chunks=["a", "b", "c"], delay=0.05)
+    stream = service.stream(**request())
+    await stream.__anext__()
+    await stream.aclose()
+    await asyncio.sleep(0.1)
+
+    assert models.cancelled
@@ -0,0 +1,146 @@
+# tests/backend/test_image_preprocessing.py
+
+import functools
+import hashlib
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw
+
+from server.dependencies import get_gemini_service
+from server.main import app
+from server.services.image_preprocessing import (
+    ImageResultCache, ImageTooLarge, get_image_result_cache, prepare_image,
+)
+
+
+class FakeGemini:
+    def __init__(self):
+        self.calls = []
+
+    async def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        yield f"$x^2 = {len(self.calls) * 4}$"
+
+
+@pytest.fixture
+def fake_gemini(client):
+    gemini = FakeGemini()
+    cache = ImageResultCache()
+    app.dependency_overrides[get_gemini_service] = lambda: gemini
+    app.dependency_overrides[get_image_result_cache] = lambda: cache
+    return gemini
+
+
+@functools.lru_cache(maxsize=None)
+def phone_photo(seed=1, quality=95, orientation=6):
+    '''A 12 MP "photo" of a worksheet: white paper with margins, text-like strokes and sensor noise.'''
+    rng = random.Random(seed)
+    image = Image.new("RGB", (4000, 3000), (250, 250, 245))
+    draw = ImageDraw.Draw(image)
+    for line in range(16):
+        y = 600 + line * 110
+        x = 700
+        while x < 3300:
+            width = rng.randint(20, 90)
+            draw.rectangle((x, y, x + width, y + 40), fill=(20, 20, 30))
+            x += width + rng.randint(15, 40)
+    noise = Image.effect_noise((4000, 3000), 12).convert("RGB")
+    image = Image.blend(image, noise, 0.08)
+    exif = Image.Exif()
+    exif[0x0112] = orientation # Taken with the phone held upright
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_photo_is_oriented_cropped_and_shrunk():
+    raw = phone_photo()
+    prepared = prepare_image(raw, "image/jpeg", max_side=1536)
+
+    assert prepared.processed
+    assert len(prepared.data) * 10 <= len(raw)
+    with Image.open(io.BytesIO(prepared.data)) as result:
+        assert result.mode == "L"
+        assert max(result.size) <= 1536
+        assert result.height > result.width # EXIF orientation 6 rotates the landscape pixels upright
+
+
+def test_hash_is_a_digest_of_the_preprocessed_bytes():
+    first = prepare_image(phone_photo(seed=1), "image/jpeg")
+    again = prepare_image(phone_photo(seed=1), "image/jpeg")
+    other = prepare_image(phone_photo(seed=2), "image/jpeg")
+
+    assert first.hash == again.hash == "sha256:" + hashlib.sha256(first.data).hexdigest()
+    assert first.hash != other.hash
+
+
+def test_undecodable_images_pass_through():
+    prepared = prepare_image(b"not an image", "image/heic")
+
+    assert not prepared.processed
+    assert prepared.data == b"not an image"
+    assert prepared.hash.startswith("sha256:")
+
+
+def test_cache_is_keyed_per_action_and_exact_hash():
+    cache = ImageResultCache()
+    cache.put("image_to_latex", "sha256:aa", ["$x$"])
+
+    assert cache.get("image_to_latex", "sha256:aa") == ["$x$"]
+    assert cache.get("image_to_latex", "sha256:ab") is None
+    assert cache.get("other_action", "sha256:aa") is None
+
+
+def test_repeat_upload_is_served_from_cache(client, fake_gemini):
+    first = client.post("/image-to-latex", files={"file": ("a.jpg", phone_photo(), "image/jpeg")})
+    second = client.post("/image-to-latex", files={"file": ("b.jpg", phone_photo(), "image/jpeg")})
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["latex_text"] == first.json()["latex_text"]
+    assert len(fake_gemini.calls) == 1
+    assert fake_gemini.calls[0]["user_input_bytes_mime_type"] in ("image/png", "image/jpeg")
+
+
+def worksheet(symbol):
+    """A clean screenshot of an equation; only the last symbol changes."""
+    image = Image.new("L", (800, 200), 255)
+    draw = ImageDraw.Draw(image)
+    draw.text((40, 80), f"x + 2y = {symbol}", fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_images_differing_by_one_symbol_do_not_share_a_result(client, fake_gemini):
+    first = client.post("/image-to-latex", files={"file": ("a.png", worksheet("7"), "image/png")})
+    second = client.post("/image-to-latex", files={"file": ("b.png", worksheet("1"), "image/png")})
+
+    assert first.status_code == second.status_code == 200
+    assert len(fake_gemini.calls) == 2
+    assert second.json()["latex_text"] != first.json()["latex_text"]
+
+
+@pytest.mark.parametrize("endpoint", ["/image-to-latex", "/llm/extract-latex-from-image"])
+def test_decompression_bombs_are_rejected(client, fake_gemini, monkeypatch, endpoint):
+    bomb = worksheet("7") # 800x200 px
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 800 * 200 // 3) # Pillow refuses more than twice this
+
+    with pytest.raises(ImageTooLarge):
+        prepare_image(bomb, "image/png")
+    response = client.post(endpoint, files={"file": ("bomb.png", bomb, "image/png")})
+
+    assert response.status_code == 413
+    assert fake_gemini.calls == []
+
+
+def test_sampling_parameters_reach_the_model_and_skip_the_cache(client, fake_gemini):
+    form = {"temperature": "0.7", "top_p": "0.9", "thinking_budget": "256"}
+    for _ in range(2):
+        response = client.post("/llm/extract-latex-from-image", files={"file": ("a.png", worksheet("7"), "image/png")}, data=form)
+        assert response.status_code == 200
+
+    assert len(fake_gemini.calls) == 2
+    call = fake_gemini.calls[0]
+    assert (call["temperature"], call["top_p"], call["thinking_budget"]) == (0.7, 0.9, 256)
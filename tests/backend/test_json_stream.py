@@ -0,0 +1,94 @@
+# tests/backend/test_json_stream.py
+
+import json
+
+import pytest
+
+from server.services.json_stream import JSONStreamError, StreamingJSONParser, json_events
+
+DOCUMENT = {
+    "lecture_name": "Nejednakosti {I} \"AM-GM\"",
+    "group_name": "napredna",
+    "problems_latex": [
+        {"latex_text": "Dokazati $a^2 + b^2 \\geq 2ab$.", "category": "A", "tags": ["x", []]},
+        {"latex_text": "Neka je $[x]$ cijeli dio od $x$, {} ] }", "category": "N", "tags": []},
+    ],
+    "count": 2,
+    "meta": {"ok": True, "score": -1.5e3, "none": None},
+}
+
+
+def feed_in_chunks(parser, text, size):
+    events = []
+    for start in range(0, len(text), size):
+        events += parser.feed(text[start:start + size])
+    return events
+
+
+def test_events_are_the_same_for_any_chunking():
+    text = json.dumps(DOCUMENT, indent=1)
+    expected = None
+    for size in (1, 2, 5, 13, len(text)):
+        parser = StreamingJSONParser()
+        events = feed_in_chunks(parser, text, size)
+        paths = [event.path for event in events]
+        expected = expected or paths
+        assert paths == expected
+        assert parser.close() == DOCUMENT
+
+    assert expected[:4] == [("lecture_name",), ("group_name",), ("problems_latex", 0, "latex_text"), ("problems_latex", 0, "category")]
+    assert ("problems_latex", 0, "tags", 1) in expected
+    assert expected[-1] == ()
+
+
+def test_max_depth_limits_events_to_fields_and_elements():
+    parser = StreamingJSONParser(max_depth=2)
+    events = feed_in_chunks(parser, json.dumps(DOCUMENT), 4)
+
+    assert [event.path for event in events] == [
+        ("lecture_name",), ("group_name",), ("problems_latex", 0), ("problems_latex", 1),
+        ("problems_latex",), ("count",), ("meta", "ok"), ("meta", "score"), ("meta", "none"), ("meta",), (),
+    ]
+    assert events[3].value == DOCUMENT["problems_latex"][1]
+    assert (events[3].key, events[3].index) == ("problems_latex", 1)
+
+
+def test_elements_are_emitted_before_the_array_closes():
+    parser = StreamingJSONParser(max_depth=1)
+    events = parser.feed('[{"latex_text": "x", "category": "A"}, {"latex_')
+
+    assert [(event.path, event.value) for event in events] == [((0,), {"latex_text": "x", "category": "A"})]
+    assert not parser.done
+
+
+def test_numbers_wait_for_a_delimiter():
+    parser = StreamingJSONParser()
+    assert parser.feed('{"count": 12') == []
+    assert parser.feed('3}')[0].value == 123
+
+    bare = StreamingJSONParser()
+    assert bare.feed("42") == []
+    assert bare.close() == 42
+
+
+def test_truncated_or_invalid_streams_raise():
+    parser = StreamingJSONParser()
+    parser.feed('{"lecture_name": "x", "problems_latex": [')
+    with pytest.raises(JSONStreamError):
+        parser.close()
+
+    with pytest.raises(JSONStreamError):
+        StreamingJSONParser().feed('{"a" 1}')
+    with pytest.raises(JSONStreamError):
+        StreamingJSONParser().feed("Here is the JSON: {")
+
+
+@pytest.mark.asyncio
+async def test_json_events_over_a_text_stream():
+    async def stream():
+        for chunk in ('{"message": "Zdr', 'avo!"', "}"):
+            yield chunk
+
+    events = [event async for event in json_events(stream())]
+
+    assert [(event.path, event.value) for event in events] == [(("message",), "Zdravo!"), ((), {"message": "Zdravo!"})]
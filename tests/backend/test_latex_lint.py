@@ -0,0 +1,66 @@
+# tests/backend/test_latex_lint.py
+
+import pytest
+
+from server.services.latex_lint import LatexValidationError, check_latex, validate_latex
+
+VALID_DOCUMENT = r"""\documentclass{article}
+\newcommand{\be}{\begin{equation}} % unbalanced on purpose, preamble is not env-checked
+\begin{document}
+\begin{problem}
+Neka je $x \in \{1, 2\}$ i $$x^2 = 4.$$ Cijena je 5\$.
+\verb|{$| % verbatim content is ignored
+\end{problem}
+\end{document}
+"""
+
+
+def test_valid_document_passes():
+    assert check_latex(VALID_DOCUMENT) == []
+
+
+def test_environment_mismatch_reports_both_lines():
+    source = "\\documentclass{article}\n\\begin{document}\n\\begin{problem}\nx\n\\end{solution}\n\\end{document}\n"
+    errors = check_latex(source)
+
+    assert len(errors) == 1
+    assert errors[0].line == 5
+    assert "line 3" in errors[0].message
+
+
+def test_unbalanced_braces_and_math():
+    source = "\\documentclass{article}\n\\begin{document}\n\\textbf{a\nNeka je $x\n\nb}}\n\\end{document}\n"
+    messages = [(e.line, e.message) for e in check_latex(source)]
+
+    assert (4, "Unclosed math mode '$' opened on line 4 (paragraph ended).") in messages
+    assert any(line == 6 and "closing brace" in message for line, message in messages)
+
+
+def test_missing_document_structure():
+    messages = [e.message for e in check_latex("Samo tekst.")]
+
+    assert "Missing \\documentclass." in messages
+    assert "Missing \\begin{document}." in messages
+
+
+def test_fragment_mode_skips_document_checks():
+    assert check_latex("\\item Neka je $a > 0$.", require_document=False) == []
+
+
+def test_href_urls_and_one_line_verbatim_are_not_parsed():
+    source = (
+        "\\documentclass{article}\n\\begin{document}\n"
+        "Vidi \\href{http://x.org/a%20b}{ovdje}.\n"
+        "\\begin{verbatim}{$x\\end{verbatim} i $y$\n"
+        "\\end{document}\n"
+    )
+    assert check_latex(source) == []
+
+
+def test_only_certain_findings_block_compilation():
+    source = "\\documentclass{article}\n\\begin{document}\n\\textbf{a\n\\end{document}\n"
+
+    assert [d.severity for d in check_latex(source)] == ["warning"]
+    validate_latex(source) # Does not raise; pdflatex has the final word
+    with pytest.raises(LatexValidationError):
+        validate_latex("\\begin{document}\nx\n\\end{document}\n")
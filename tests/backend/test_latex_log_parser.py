@@ -0,0 +1,106 @@
+# tests/backend/test_latex_log_parser.py
+
+import json
+
+from server.services import pdf_service
+from server.services.latex_log_parser import parse_latex_log
+
+SAMPLE_LOG = r"""This is pdfTeX, Version 3.141592653-2.6-1.40.25 (TeX Live 2023) (preloaded format=pdflatex)
+entering extended mode
+(./problemset_output.tex
+LaTeX2e <2022-11-01> patch level 1
+(/usr/share/texlive/texmf-dist/tex/latex/base/article.cls
+Document Class: article 2022/07/02 v1.4n Standard LaTeX document class
+(/usr/share/texlive/texmf-dist/tex/latex/base/size11.clo))
+./problemset_output.tex:14: Undefined control sequence.
+l.14 Neka je \alphaa
+                     zadani broj.
+! Missing $ inserted.
+<inserted text>
+                $
+l.21 x^
+       2
+LaTeX Warning: Reference `zad3' on page 1 undefined on input line 25.
+
+Package hyperref Warning: Token not allowed in a PDF string (Unicode):
+(hyperref)                removing `math shift' on input line 30.
+
+Overfull \hbox (12.5pt too wide) in paragraph at lines 40--41
+[]\T1/ppl/m/n/10.95 Dokazati da je
+Overfull \hbox (3.0pt too wide) in paragraph at lines 50--51
+Underfull \hbox (badness 10000) in paragraph at lines 60--61
+)
+"""
+
+
+def test_errors_have_file_line_and_context():
+    summary = parse_latex_log(SAMPLE_LOG.splitlines(keepends=True))
+
+    assert len(summary.errors) == 2
+    first, second = summary.errors
+    assert first.file == "problemset_output.tex"
+    assert first.line == 14
+    assert first.message == "Undefined control sequence."
+    assert first.context == "Neka je \\alphaa"
+    assert second.message == "Missing $ inserted."
+    assert second.line == 21
+    assert second.file == "problemset_output.tex"
+
+
+def test_warnings_and_box_stats():
+    summary = parse_latex_log(SAMPLE_LOG.splitlines())
+
+    assert [w.line for w in summary.warnings] == [25, 30]
+    assert summary.warnings[1].message.startswith("hyperref: Token not allowed")
+    assert "removing `math shift'" in summary.warnings[1].message
+    assert summary.overfull_boxes == 2
+    assert summary.underfull_boxes == 1
+    assert summary.max_overfull_pt == 12.5
+
+
+def test_diagnostics_are_capped():
+    log = ["! Undefined control sequence.", "l.1 \\foo"] * 10
+    summary = parse_latex_log(log, max_diagnostics=3)
+
+    assert len(summary.errors) == 3
+    assert summary.truncated
+
+
+DOCUMENT = "\\documentclass{article}\n\\begin{document}\nSee \\ref{zad3}.\n\\end{document}\n"
+
+
+def fake_successful_pdflatex(monkeypatch):
+    # A pdflatex run that succeeds but leaves warnings and bad boxes in its .log
+    def run(cmd, work_dir, limits, on_process=None):
+        (work_dir / "problemset_output.pdf").write_bytes(b"%PDF-1.5")
+        log = SAMPLE_LOG.split("./problemset_output.tex:14:")[0] + SAMPLE_LOG.split("       2\n")[1]
+        (work_dir / "problemset_output.log").write_text(log)
+        return 0, ""
+    monkeypatch.setattr(pdf_service.shutil, "which", lambda name: "/usr/bin/pdflatex")
+    monkeypatch.setattr(pdf_service, "run_sandboxed", run)
+
+
+def test_successful_compile_reports_warnings_and_boxes(tmp_path, monkeypatch):
+    fake_successful_pdflatex(monkeypatch)
+    reported = []
+
+    pdf_path = pdf_service.run_pdflatex_passes(DOCUMENT, tmp_path, on_diagnostics=reported.append)
+
+    assert pdf_path.read_bytes() == b"%PDF-1.5"
+    [summary] = reported
+    assert summary.errors == []
+    assert [w.line for w in summary.warnings] == [25, 30]
+    assert (summary.overfull_boxes, summary.underfull_boxes) == (2, 1)
+
+
+def test_compile_endpoint_returns_diagnostics_header(client, monkeypatch):
+    fake_successful_pdflatex(monkeypatch)
+
+    response = client.post("/problemsets/compile-latex", json={"latex_code": DOCUMENT})
+
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1.5"
+    diagnostics = json.loads(response.headers["X-LaTeX-Diagnostics"])
+    assert diagnostics["errors"] == []
+    assert len(diagnostics["warnings"]) == 2
+    assert diagnostics["max_overfull_pt"] == 12.5
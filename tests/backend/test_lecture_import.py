@@ -0,0 +1,109 @@
+# tests/backend/test_lecture_import.py
+
+import asyncio
+import json
+
+import pytest
+
+from server.dependencies import get_gemini_service
+from server.main import app
+from server.models.problemset import Problemset
+from server.services.gemini_service import GeminiService
+from server.services.lecture_import_service import import_lecture_pdf
+from server.services.llm_providers import StubProvider
+
+PDF = ("lekcija.pdf", b"%PDF-1.4 fake lecture", "application/pdf")
+
+LECTURE_JSON = json.dumps({
+    "lecture_name": "Djeljivost",
+    "group_name": "pocetna",
+    "problems_latex": [
+        {"latex_text": "Dokazati da $3 \\mid n^3 - n$.", "category": "N"},
+        {"latex_text": "Naci sve $n$ takve da $n \\mid 2^n - 1$.", "category": "N"},
+        {"latex_text": "Bez kategorije"},
+    ],
+})
+
+
+class FakeAI:
+    '''Streams fixed JSON in small chunks; optionally fails after a number of characters.'''
+    def __init__(self, text=LECTURE_JSON, fail_at=None, gate=None, gate_at=0):
+        self.text = text
+        self.fail_at = fail_at
+        self.gate = gate
+        self.gate_at = gate_at
+
+    async def process_lecture_pdf(self, pdf_bytes):
+        async def stream():
+            for start in range(0, len(self.text), 16):
+                if self.fail_at is not None and start >= self.fail_at:
+                    raise RuntimeError("upstream failed")
+                if self.gate is not None and start >= self.gate_at:
+                    await self.gate.wait()
+                yield self.text[start:start + 16]
+        return stream()
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+@pytest.mark.asyncio
+async def test_problems_are_saved_while_the_model_is_still_streaming(test_db):
+    gate = asyncio.Event()
+    events = import_lecture_pdf(FakeAI(gate=gate, gate_at=LECTURE_JSON.index("Naci")), test_db, b"pdf")
+    seen = []
+    async for event in events:
+        seen.append(event)
+        if event["event"] == "problem":
+            break
+
+    # The first problem is committed although the rest of the JSON has not arrived yet
+    assert [e["event"] for e in seen] == ["started", "problemset", "problem"]
+    assert test_db.query(Problemset).one().title == "Djeljivost"
+
+    gate.set()
+    rest = await collect(events)
+    assert [e["event"] for e in rest] == ["problem", "skipped", "done"]
+    assert rest[-1]["problems"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failure_keeps_saved_problems_and_reports_error(test_db):
+    events = await collect(import_lecture_pdf(FakeAI(fail_at=LECTURE_JSON.index("Naci")), test_db, b"pdf"))
+
+    assert events[-1]["event"] == "error"
+    assert events[-1]["problems"] == 1
+    problemset = test_db.get(Problemset, events[-1]["problemset_id"])
+    assert len(problemset.problems) == 1
+
+
+def test_process_pdf_stream_endpoint_on_stub_provider(client):
+    service = GeminiService(provider=StubProvider(ttft_seconds=0, tokens_per_second=0))
+    app.dependency_overrides[get_gemini_service] = lambda: service
+
+    response = client.post("/problemsets/process-pdf/stream", files={"file": PDF})
+
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [e["event"] for e in events] == ["started", "problemset", "problem", "problem", "done"]
+    assert events[-1]["problems"] == 2
+
+
+def test_process_pdf_uses_the_same_pipeline(client):
+    service = GeminiService(provider=StubProvider(ttft_seconds=0, tokens_per_second=0))
+    app.dependency_overrides[get_gemini_service] = lambda: service
+
+    response = client.post("/problemsets/process-pdf", files={"file": PDF})
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["type"] == "predavanje"
+    assert [link["position"] for link in body["problems"]] == [1, 2]
+
+
+def test_process_pdf_rejects_non_pdf(client):
+    app.dependency_overrides[get_gemini_service] = lambda: GeminiService(provider=StubProvider())
+    response = client.post("/problemsets/process-pdf/stream", files={"file": ("a.png", b"png", "image/png")})
+
+    assert response.status_code == 415
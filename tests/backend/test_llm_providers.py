@@ -0,0 +1,95 @@
+# tests/backend/test_llm_providers.py
+
+import asyncio
+import json
+import time
+
+import pytest
+from google.genai import errors as genai_errors
+from google.genai import types
+
+from server.dependencies import get_gemini_service
+from server.main import app
+from server.services.ai_response_cache import AIResponseCache, get_ai_response_cache
+from server.services.gemini_service import GeminiService
+from server.services.llm_providers import StubProvider
+from server.services.llm_scheduler import LLMScheduler, ModelQuota
+
+SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "title": types.Schema(type=types.Type.STRING),
+        "problems": types.Schema(
+            type=types.Type.ARRAY,
+            items=types.Schema(
+                type=types.Type.OBJECT,
+                properties={"latex": types.Schema(type=types.Type.STRING), "number": types.Schema(type=types.Type.INTEGER)},
+                property_ordering=["number", "latex"],
+            ),
+        ),
+    },
+    property_ordering=["title", "problems"],
+)
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.asyncio
+async def test_stub_echoes_text_in_paced_chunks():
+    service = GeminiService(provider=StubProvider(ttft_seconds=0.05, tokens_per_second=1000, tokens_per_chunk=2))
+    started = time.monotonic()
+
+    chunks = await collect(service.stream(model="m", system_prompt="fix", user_input_text="Riješiti jednačinu x^2 = 4."))
+
+    assert "".join(chunks) == "Riješiti jednačinu x^2 = 4."
+    assert all(len(chunk) <= 8 for chunk in chunks)
+    assert time.monotonic() - started >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_stub_json_follows_schema_and_is_deterministic():
+    service = GeminiService(provider=StubProvider(ttft_seconds=0, tokens_per_second=0), coalesce=False)
+    request = dict(model="m", system_prompt="extract", user_input_text="pdf", response_mime_type="application/json", response_schema=SCHEMA)
+
+    first = "".join(await collect(service.stream(**request)))
+    second = "".join(await collect(service.stream(**request)))
+
+    data = json.loads(first)
+    assert first == second
+    assert list(data) == ["title", "problems"]
+    assert list(data["problems"][0]) == ["number", "latex"]
+    assert isinstance(data["problems"][1]["number"], int)
+
+
+@pytest.mark.asyncio
+async def test_injected_failures_are_retried_by_the_scheduler():
+    provider = StubProvider(ttft_seconds=0, failure_rate=0.5, seed=3)
+    scheduler = LLMScheduler(quotas={}, default_quota=ModelQuota(60_000, 10_000_000), max_retries=10, backoff_base_seconds=0.001)
+    service = GeminiService(provider=provider, coalesce=False, scheduler=scheduler)
+
+    results = await asyncio.gather(*(collect(service.stream(model="m", system_prompt="s", user_input_text=f"t{i}")) for i in range(8)))
+
+    assert ["".join(chunks) for chunks in results] == [f"t{i}" for i in range(8)]
+    assert provider.calls > 8
+    assert scheduler.usage()["m"]["retries"] == provider.calls - 8
+
+
+@pytest.mark.asyncio
+async def test_stub_failure_without_scheduler_raises():
+    service = GeminiService(provider=StubProvider(ttft_seconds=0, failure_rate=1.0))
+
+    with pytest.raises(genai_errors.APIError):
+        await collect(service.stream(model="m", system_prompt="s", user_input_text="x"))
+
+
+def test_llm_route_runs_offline_on_the_stub(client):
+    service = GeminiService(provider=StubProvider(ttft_seconds=0, tokens_per_second=0))
+    app.dependency_overrides[get_gemini_service] = lambda: service
+    app.dependency_overrides[get_ai_response_cache] = lambda: AIResponseCache(max_entries=0)
+
+    response = client.post("/llm/fix-latex", json={"code": "\\item $x^2$"})
+
+    assert response.status_code == 200
+    assert response.text == "\\item $x^2$"
@@ -0,0 +1,116 @@
+# tests/backend/test_llm_router.py
+
+import asyncio
+
+import pytest
+from google.genai import errors as genai_errors
+
+from server.services.llm_router import FLASH, PRO, CircuitBreaker, ModelRouter
+from server.services.llm_telemetry import LLMCallRecord, LLMTelemetry
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCalls:
+    '''Model calls with a per-model (and per-hedge) delay before the answer, or an error.'''
+    def __init__(self, delays=None, hedge_delay=0.0, failing=()):
+        self.delays = delays or {}
+        self.hedge_delay = hedge_delay
+        self.failing = set(failing)
+        self.calls = []
+        self.closed = []
+
+    def __call__(self, model, thinking_budget, record, shared):
+        self.calls.append((model, thinking_budget, shared))
+        name = f"{model}:{'primary' if shared else 'hedge'}"
+
+        async def stream():
+            try:
+                await asyncio.sleep(self.delays.get(model, 0.0) if shared else self.hedge_delay)
+                if model in self.failing:
+                    raise genai_errors.APIError(503, {"error": {"code": 503, "status": "UNAVAILABLE", "message": "overloaded"}})
+                yield f"{name} "
+                yield "done"
+            finally:
+                self.closed.append(name)
+        return stream()
+
+
+def warmed_telemetry(action, model, ttfc, samples=5):
+    telemetry = LLMTelemetry(samples=10)
+    for _ in range(samples):
+        telemetry.record(LLMCallRecord(action=action, model=model, ttfc_seconds=ttfc))
+    return telemetry
+
+
+async def run(router, route, calls, telemetry, hedge=True):
+    record = telemetry.start(route.action, route.model)
+    return "".join([chunk async for chunk in router.stream(route, calls, record, telemetry, hedge=hedge)]), record
+
+
+def test_routes_by_action_input_size_and_circuit_state():
+    clock = Clock()
+    router = ModelRouter(large_input_tokens=1000, breaker=CircuitBreaker(failure_threshold=2, cooldown_seconds=30, clock=clock))
+
+    small, large = router.route("fix_latex", 200), router.route("fix_latex", 3000)
+    assert (small.model, small.thinking_budget, small.fallback, small.hedge) == (FLASH, 0, PRO, True)
+    assert (large.model, large.thinking_budget) == (PRO, 1024)
+    assert router.route("translate", 3000).model == FLASH
+    assert router.route("fix_latex", 3000, model="custom").fallback is None
+
+    router.breaker.failure(FLASH)
+    router.breaker.failure(FLASH)
+    rerouted = router.route("fix_grammar", 10)
+    assert (rerouted.model, rerouted.fallback) == (PRO, FLASH)
+    assert rerouted.thinking_for(PRO) == 128 # Pro cannot run without thinking
+    clock.now = 31
+    assert router.route("fix_grammar", 10).model == FLASH
+    assert router.breaker.state(FLASH) == "half_open"
+
+
+@pytest.mark.asyncio
+async def test_slow_first_chunk_is_hedged_and_the_loser_cancelled():
+    router = ModelRouter(hedge_min_samples=5, hedge_min_delay_seconds=0.05)
+    telemetry = warmed_telemetry("fix_latex", FLASH, ttfc=0.01)
+    calls = FakeCalls(delays={FLASH: 1.0})
+
+    text, _ = await run(router, router.route("fix_latex", 10), calls, telemetry)
+
+    assert text == f"{FLASH}:hedge done"
+    assert [shared for _, _, shared in calls.calls] == [True, False]
+    assert calls.closed[0] == f"{FLASH}:primary"
+    assert (router.hedges, router.hedge_wins) == (1, 1)
+    assert telemetry.snapshot()["fix_latex"][FLASH]["sources"]["hedge"] == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_samples_or_for_batch_calls():
+    router = ModelRouter(hedge_min_samples=5, hedge_min_delay_seconds=0.01)
+    calls = FakeCalls(delays={FLASH: 0.1})
+
+    await run(router, router.route("fix_latex", 10), calls, LLMTelemetry(samples=10))
+    await run(router, router.route("fix_latex", 10), calls, warmed_telemetry("fix_latex", FLASH, 0.01), hedge=False)
+
+    assert router.hedges == 0 and len(calls.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_failing_model_falls_back_and_opens_its_circuit():
+    router = ModelRouter(breaker=CircuitBreaker(failure_threshold=2, cooldown_seconds=30))
+    calls = FakeCalls(failing={FLASH})
+    telemetry = LLMTelemetry(samples=10)
+
+    for _ in range(2):
+        text, record = await run(router, router.route("translate", 10), calls, telemetry)
+        assert text == f"{PRO}:primary done" and record.model == PRO
+
+    assert [model for model, _, _ in calls.calls] == [FLASH, PRO, FLASH, PRO]
+    assert calls.calls[1][1] == 128
+    assert router.breaker.state(FLASH) == "open" and router.fallbacks == 2
+    assert router.route("translate", 10).model == PRO
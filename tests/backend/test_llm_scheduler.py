@@ -0,0 +1,114 @@
+# tests/backend/test_llm_scheduler.py
+
+import asyncio
+
+import pytest
+from google.genai import errors as genai_errors
+
+from server.main import app
+from server.services.llm_scheduler import (
+    BATCH, INTERACTIVE, LLMScheduler, ModelQuota, TokenBucket, get_llm_scheduler,
+)
+
+
+def make_scheduler(rpm=600, tpm=10_000_000, **kwargs):
+    # 600 RPM with a 0.1s burst: one call admitted at once, then one every 0.1s
+    kwargs.setdefault("backoff_base_seconds", 0.001)
+    return LLMScheduler(quotas={}, default_quota=ModelQuota(rpm, tpm), burst_seconds=0.1, **kwargs)
+
+
+def quota_error(code=429):
+    return genai_errors.APIError(code, {"error": {"code": code, "status": "RESOURCE_EXHAUSTED", "message": "quota"}})
+
+
+def test_token_bucket_refills_at_rate():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, capacity=4, clock=lambda: now[0])
+    bucket.take(4)
+
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    now[0] += 1
+    assert bucket.available() == pytest.approx(2)
+    now[0] += 10
+    assert bucket.available() == 4 # Never above capacity
+
+
+@pytest.mark.asyncio
+async def test_interactive_calls_overtake_waiting_batch_calls():
+    scheduler = make_scheduler()
+    order = []
+    await scheduler.acquire("m") # Empties the bucket, everyone else has to wait
+
+    async def call(name, priority):
+        await scheduler.acquire("m", priority)
+        order.append(name)
+
+    batch = [asyncio.create_task(call(f"batch{i}", BATCH)) for i in range(2)]
+    await asyncio.sleep(0.01)
+    interactive = asyncio.create_task(call("interactive", INTERACTIVE))
+    await asyncio.gather(*batch, interactive)
+
+    assert order == ["interactive", "batch0", "batch1"]
+
+
+@pytest.mark.asyncio
+async def test_retryable_error_before_first_chunk_is_retried():
+    scheduler = make_scheduler(rpm=60_000)
+    attempts = []
+
+    async def produce():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise quota_error()
+        yield "ok"
+
+    chunks = [chunk async for chunk in scheduler.stream("m", produce)]
+
+    assert chunks == ["ok"]
+    assert len(attempts) == 3
+    assert scheduler.usage()["m"]["retries"] == 2
+    assert scheduler.usage()["m"]["rate_limited"] == 2
+
+
+@pytest.mark.asyncio
+async def test_error_after_first_chunk_is_not_retried():
+    scheduler = make_scheduler(rpm=60_000)
+    attempts = []
+
+    async def produce():
+        attempts.append(1)
+        yield "partial"
+        raise quota_error(503)
+
+    with pytest.raises(genai_errors.APIError):
+        [chunk async for chunk in scheduler.stream("m", produce)]
+    assert len(attempts) == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    scheduler = make_scheduler(rpm=60_000)
+    attempts = []
+
+    async def produce():
+        attempts.append(1)
+        raise quota_error(400)
+        yield
+
+    with pytest.raises(genai_errors.APIError):
+        [chunk async for chunk in scheduler.stream("m", produce)]
+    assert len(attempts) == 1
+
+
+def test_usage_endpoint(client):
+    scheduler = make_scheduler()
+    app.dependency_overrides[get_llm_scheduler] = lambda: scheduler
+    asyncio.run(scheduler.acquire("gemini-test", cost=100))
+
+    response = client.get("/llm/usage")
+
+    assert response.status_code == 200
+    usage = response.json()["models"]["gemini-test"]
+    assert usage["requests_last_minute"] == 1
+    assert usage["requests_per_minute_limit"] == 600
+    assert usage["waiting"] == {"interactive": 0, "batch": 0}
@@ -0,0 +1,110 @@
+# tests/backend/test_llm_telemetry.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from google.genai import types
+
+from server.dependencies import get_gemini_service
+from server.main import app
+from server.services.ai_response_cache import AIResponseCache, get_ai_response_cache
+from server.services.ai_service import DEFAULT_MODEL, AIService
+from server.services.gemini_service import GeminiService
+from server.services.llm_providers import StubProvider
+from server.services.llm_telemetry import LLMCallRecord, LLMTelemetry, get_llm_telemetry
+
+
+class UsageModels:
+    '''Fake client.aio.models whose last chunk carries the usage metadata, like Gemini.'''
+    def __init__(self, chunks, fail=False):
+        self.chunks = chunks
+        self.fail = fail
+
+    async def generate_content_stream(self, model, contents, config):
+        async def response():
+            for index, text in enumerate(self.chunks):
+                await asyncio.sleep(0.01)
+                usage = None
+                if index == len(self.chunks) - 1:
+                    usage = types.GenerateContentResponseUsageMetadata(
+                        prompt_token_count=120, candidates_token_count=30, thoughts_token_count=7,
+                    )
+                yield SimpleNamespace(text=text, usage_metadata=usage)
+            if self.fail:
+                raise RuntimeError("quota exceeded")
+        return response()
+
+
+def make_ai(chunks, fail=False, cache=None):
+    gemini = GeminiService(client=SimpleNamespace(aio=SimpleNamespace(models=UsageModels(chunks, fail))))
+    telemetry = LLMTelemetry(samples=10)
+    return AIService(gemini=gemini, cache=cache, telemetry=telemetry), telemetry
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.asyncio
+async def test_model_call_records_latency_and_usage_tokens():
+    ai, telemetry = make_ai(["\\item ", "$x^2$"])
+
+    await collect(await ai.fix_latex(user_input="\\item x^2", model="flash"))
+
+    stats = telemetry.snapshot()["fix_latex"]["flash"]
+    assert stats["requests"] == 1 and stats["outcomes"]["completed"] == 1
+    assert stats["tokens"] == {"input": 120, "output": 30, "thinking": 7, "cached": 0}
+    assert stats["chunks"] == 2
+    assert stats["ttfc_seconds"]["p50"] >= 0.01
+    assert stats["duration_seconds"]["p50"] >= stats["ttfc_seconds"]["p50"]
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_count_no_tokens_and_no_latency_samples():
+    ai, telemetry = make_ai(["fixed"], cache=AIResponseCache(max_entries=10))
+
+    for _ in range(3):
+        await collect(await ai.fix_grammar(user_input="text", model="flash"))
+
+    stats = telemetry.snapshot()["fix_grammar"]["flash"]
+    assert stats["sources"] == {"model": 1, "coalesced": 0, "cache": 2, "hedge": 0}
+    assert stats["tokens"]["input"] == 120
+    assert stats["ttfc_seconds"]["samples"] == 1
+
+
+def test_coalesced_streams_do_not_drag_the_hedge_percentile_down():
+    telemetry = LLMTelemetry(samples=10)
+    for source, ttfc in (("model", 2.0), ("hedge", 2.0), ("coalesced", 0.01), ("coalesced", 0.01), ("coalesced", 0.01)):
+        telemetry.record(LLMCallRecord(action="fix_latex", model="flash", source=source, ttfc_seconds=ttfc))
+
+    assert telemetry.ttfc_percentile("fix_latex", "flash", 0.5) == 2.0
+    stats = telemetry.snapshot()["fix_latex"]["flash"]
+    assert stats["sources"]["coalesced"] == 3
+    assert stats["ttfc_seconds"]["samples"] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_and_abandoned_calls_are_recorded():
+    ai, telemetry = make_ai(["a", "b"], fail=True)
+
+    with pytest.raises(RuntimeError):
+        await collect(await ai.translate(user_input="x", model="flash"))
+    stream = await ai.translate(user_input="y", model="flash")
+    await stream.__anext__()
+    await stream.aclose()
+
+    outcomes = telemetry.snapshot()["translate"]["flash"]["outcomes"]
+    assert outcomes == {"completed": 0, "error": 1, "cancelled": 1}
+
+
+def test_metrics_endpoint_reports_stub_calls(client):
+    app.dependency_overrides[get_gemini_service] = lambda: GeminiService(provider=StubProvider(ttft_seconds=0, tokens_per_second=0))
+    app.dependency_overrides[get_ai_response_cache] = lambda: AIResponseCache(max_entries=0)
+    before = get_llm_telemetry().snapshot().get("fix_latex", {}).get(DEFAULT_MODEL, {"requests": 0})["requests"]
+
+    client.post("/llm/fix-latex", json={"code": "\\item $x^2$"})
+    stats = client.get("/llm/metrics").json()["actions"]["fix_latex"][DEFAULT_MODEL]
+
+    assert stats["requests"] == before + 1
+    assert stats["tokens"]["output"] > 0 # Estimated by the stub
@@ -0,0 +1,105 @@
+# tests/backend/test_pdf_prebuild.py
+
+import threading
+import time
+
+from server.services import pdf_service
+from server.services.latex_log_parser import LatexDiagnostic, LatexLogSummary
+from server.services.pdf_cache import get_pdf_cache
+from server.services.pdf_prebuild_service import PDFPrebuildScheduler
+
+
+BROKEN_DOCUMENT = "\\documentclass{article}\n\\begin{document}\n\\foo\n\\end{document}\n"
+
+
+class FakeSession:
+    def close(self):
+        pass
+
+
+def make_scheduler(enabled=True):
+    scheduler = PDFPrebuildScheduler(session_factory=None, enabled=enabled, debounce_seconds=0.05)
+    built = []
+    done = threading.Event()
+    def fake_build(problemset_id):
+        built.append(problemset_id)
+        done.set()
+    scheduler.build = fake_build
+    return scheduler, built, done
+
+
+def test_rapid_edits_coalesce_into_one_build():
+    scheduler, built, done = make_scheduler()
+    for _ in range(5):
+        scheduler.schedule(7)
+
+    assert done.wait(timeout=2)
+    time.sleep(0.1)
+    assert built == [7]
+
+
+def test_disabled_scheduler_does_nothing():
+    scheduler, built, done = make_scheduler(enabled=False)
+    scheduler.schedule(7)
+
+    assert not done.wait(timeout=0.2)
+    assert built == []
+
+
+def test_deleting_a_problem_schedules_its_problemsets(client, test_db):
+    from server.dependencies import get_pdf_prebuild_scheduler
+    from server.main import app
+    from server.models.problem import Problem
+    from server.models.problemset import Problemset
+    from server.models.problemset_problems import ProblemsetProblems
+
+    problem = Problem(latex_text="Dokazati $1 < 2$.", category="A")
+    problemset = Problemset(title="Nejednakosti", type="predavanje", part_of="ljetni kamp")
+    test_db.add_all([problem, problemset])
+    test_db.commit()
+    problem_id, problemset_id = problem.id, problemset.id
+    test_db.add(ProblemsetProblems(id_problem=problem_id, id_problemset=problemset_id, position=1))
+    test_db.commit()
+    scheduler, _, _ = make_scheduler()
+    scheduled = []
+    scheduler.schedule = scheduled.append
+    app.dependency_overrides[get_pdf_prebuild_scheduler] = lambda: scheduler
+
+    response = client.delete(f"/problems/{problem_id}")
+
+    assert response.status_code == 204
+    assert scheduled == [problemset_id]
+
+
+def test_requested_build_respects_disabled_prebuilds():
+    scheduler, built, done = make_scheduler(enabled=False)
+
+    assert scheduler.build_soon(7) is False
+    assert not done.wait(timeout=0.2)
+    assert built == []
+
+
+def test_latex_that_fails_is_not_rebuilt_until_the_failure_expires(monkeypatch):
+    now = [0.0]
+    scheduler = PDFPrebuildScheduler(session_factory=lambda: FakeSession(), enabled=True, clock=lambda: now[0])
+    compiles = []
+    def failing_compile(latex_content, niceness=0):
+        compiles.append(latex_content)
+        error = LatexDiagnostic(severity="error", message="Undefined control sequence.", line=3)
+        raise pdf_service.PDFGenerationError("pdflatex failed", diagnostics=LatexLogSummary(errors=[error]))
+    monkeypatch.setattr(pdf_service, "get_problemset_latex", lambda db, problemset_id: BROKEN_DOCUMENT)
+    monkeypatch.setattr(pdf_service, "compile_latex_to_cached_pdf", failing_compile)
+    latex_key = get_pdf_cache().key_for(BROKEN_DOCUMENT)
+
+    scheduler.build(7)
+    scheduler.build(7)
+
+    assert len(compiles) == 1
+    assert scheduler.known_failure(latex_key) == "Undefined control sequence. (line 3)"
+    assert scheduler.build_soon(7, latex_key) is False
+
+    now[0] += scheduler.failure_ttl_seconds + 1
+    assert scheduler.known_failure(latex_key) is None
+    scheduler.build(7)
+    assert len(compiles) == 2
+
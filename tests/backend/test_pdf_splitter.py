@@ -0,0 +1,123 @@
+# tests/backend/test_pdf_splitter.py
+
+import asyncio
+import io
+import json
+import shutil
+
+import pytest
+from PIL import Image
+
+from server.models.problemset_problems import ProblemsetProblems
+from server.services.lecture_import_service import import_lecture_pdf, lecture_pdf_events, same_problem
+from server.services.pdf_splitter import PageRange, PDFSplitter, plan_page_ranges
+
+LONG_PROBLEM = "Neka su $a, b, c$ pozitivni realni brojevi takvi da je $a + b + c = 3$. Dokazati da vrijedi $a^2 + b^2 + c^2 \\geq 3$."
+
+
+def page(first_line):
+    return f"{first_line}\nostatak stranice\n"
+
+
+def test_cuts_land_before_pages_that_open_a_problem():
+    texts = [page("nastavak teksta")] * 20
+    texts[8] = page("Zadatak 7. Dokazati ...") # page 9
+
+    ranges = plan_page_ranges(20, 8, texts)
+
+    assert ranges[0] == PageRange(1, 8, 20)
+    assert ranges[1].first == 9
+    assert ranges[-1].last == 20
+
+
+def test_without_page_text_ranges_share_a_page_and_stay_balanced():
+    ranges = plan_page_ranges(17, 8)
+
+    assert [(r.first, r.last) for r in ranges] == [(1, 7), (7, 13), (13, 17)]
+    assert plan_page_ranges(5, 8) == [PageRange(1, 5, 5)]
+
+
+def test_same_problem_matches_copies_cut_at_a_boundary():
+    assert same_problem({"latex_text": LONG_PROBLEM}, {"latex_text": "  " + LONG_PROBLEM.replace(" ", "\n", 3)})
+    assert same_problem({"latex_text": LONG_PROBLEM[:60]}, {"latex_text": LONG_PROBLEM})
+    assert not same_problem({"latex_text": "Naci sve $n$."}, {"latex_text": "Naci sve $x$ takve da $x^2 = 2$."})
+
+
+class FakeSplitter:
+    def __init__(self, parts):
+        self.parts = parts
+
+    def split(self, pdf_bytes):
+        return [(PageRange(i * 4 + 1, i * 4 + 4, len(self.parts) * 4), f"part{i}".encode()) for i in range(len(self.parts))]
+
+
+class PartsAI:
+    '''One JSON answer per page range; tracks how many ranges are extracted at once.'''
+    def __init__(self, parts, delay=0.05):
+        self.parts = parts
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+
+    async def process_lecture_pdf(self, pdf_bytes, part=None):
+        text = json.dumps(self.parts[int(pdf_bytes.decode()[4:])])
+        async def stream():
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            await asyncio.sleep(self.delay)
+            self.running -= 1
+            for start in range(0, len(text), 32):
+                yield text[start:start + 32]
+        return stream()
+
+
+def problems(*texts):
+    return [{"latex_text": text, "category": "A"} for text in texts]
+
+
+PARTS = [
+    {"lecture_name": "Nejednakosti", "group_name": "srednja", "problems_latex": problems("P1 $x$", "P2 $y$", LONG_PROBLEM[:70])},
+    {"lecture_name": "", "group_name": "", "problems_latex": problems(LONG_PROBLEM, "P4 $z$", "P5 $w$")},
+    {"lecture_name": "Nejednakosti II", "group_name": "srednja", "problems_latex": problems("P5 $w$", "P6 $v$")},
+]
+
+
+@pytest.mark.asyncio
+async def test_ranges_run_concurrently_and_merge_in_order_without_duplicates():
+    ai = PartsAI(PARTS)
+
+    events = [event async for event in lecture_pdf_events(ai, b"pdf", FakeSplitter(PARTS))]
+
+    fields = {event.key: event.value for event in events if len(event.path) == 1}
+    texts = [event.value["latex_text"] for event in events if len(event.path) == 2]
+    assert fields == {"lecture_name": "Nejednakosti", "group_name": "srednja"}
+    assert texts == ["P1 $x$", "P2 $y$", LONG_PROBLEM, "P4 $z$", "P5 $w$", "P6 $v$"]
+    assert [event.index for event in events if len(event.path) == 2] == list(range(6))
+    assert ai.max_running == 3
+
+
+@pytest.mark.asyncio
+async def test_import_saves_merged_problems_in_page_order(test_db):
+    events = [event async for event in import_lecture_pdf(PartsAI(PARTS, delay=0), test_db, b"pdf", FakeSplitter(PARTS))]
+
+    assert events[-1]["event"] == "done" and events[-1]["problems"] == 6
+    positions = test_db.query(ProblemsetProblems).filter_by(id_problemset=events[-1]["problemset_id"]).count()
+    assert positions == 6
+
+
+def lecture_pdf(pages):
+    images = [Image.new("L", (200, 280), 255) for _ in range(pages)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, "PDF", save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+
+@pytest.mark.skipif(shutil.which("qpdf") is None, reason="qpdf is not installed")
+def test_qpdf_splits_long_pdf_into_page_ranges():
+    splitter = PDFSplitter(pages_per_chunk=8, min_pages=12)
+
+    parts = splitter.split(lecture_pdf(20))
+
+    assert [r.spec for r, _ in parts] == ["1-8", "8-15", "15-20"] # Blank pages, so every cut shares a page
+    assert all(data.startswith(b"%PDF") for _, data in parts)
+    assert splitter.split(lecture_pdf(5))[0][0] is None
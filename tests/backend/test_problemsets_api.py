@@ -2,6 +2,7 @@
 
 import pytest 
 from fastapi import status 
+from types import SimpleNamespace
 
 # Test Data
 VALID_PROBLEMSET_DATA_1 = {
@@ -674,4 +675,157 @@ def test_get_lecture_data_not_found_wrong_type(client, test_db):
 
 def test_get_lecture_data_invalid_id_format(client):
      response = client.get("/problemsets/invalid-id/lecture-data")
-     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
\ No newline at end of file
+     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+# --- PDF Download Tests (pdflatex replaced by a fake that writes a fixed file) ---
+MINIMAL_DOCUMENT = "\\documentclass{article}\n\\begin{document}\nZadatak\n\\end{document}\n"
+FAKE_PDF_BYTES = b"%PDF-1.4\n" + b"0123456789" * 100 + b"\n%%EOF\n"
+
+@pytest.fixture
+def fake_pdf_pipeline(tmp_path, monkeypatch):
+    from server.services import pdf_cache, pdf_service
+
+    compiled = []
+    def fake_run(latex_content, work_dir, **kwargs):
+        compiled.append(latex_content)
+        pdf_path = work_dir / "problemset_output.pdf"
+        pdf_path.write_bytes(FAKE_PDF_BYTES)
+        return pdf_path
+
+    monkeypatch.setattr(pdf_service, "run_pdflatex_passes", fake_run)
+    monkeypatch.setattr(pdf_cache, "_cached_pdf_cache", pdf_cache.PDFCache(str(tmp_path)))
+    return compiled
+
+def test_download_pdf_served_from_cache(client, fake_pdf_pipeline):
+    ps = create_problemset(client)
+    first = client.get(f"/problemsets/{ps['id']}/pdf")
+    second = client.get(f"/problemsets/{ps['id']}/pdf")
+
+    assert first.status_code == status.HTTP_200_OK
+    assert first.content == FAKE_PDF_BYTES
+    assert first.headers["content-length"] == str(len(FAKE_PDF_BYTES))
+    assert first.headers["etag"] == second.headers["etag"]
+    assert len(fake_pdf_pipeline) == 1 # Second request hit the cache
+
+def test_download_pdf_range_request(client, fake_pdf_pipeline):
+    ps = create_problemset(client)
+    response = client.get(f"/problemsets/{ps['id']}/pdf", headers={"Range": "bytes=0-8"})
+
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.content == FAKE_PDF_BYTES[:9]
+
+def test_download_pdf_conditional_get(client, fake_pdf_pipeline):
+    ps = create_problemset(client)
+    etag = client.get(f"/problemsets/{ps['id']}/pdf").headers["etag"]
+
+    response = client.get(f"/problemsets/{ps['id']}/pdf", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    client.put(f"/problemsets/{ps['id']}/draft", json={"raw_latex": MINIMAL_DOCUMENT})
+    response = client.get(f"/problemsets/{ps['id']}/pdf", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+
+def test_compile_latex_rejects_invalid_input_before_pdflatex(client):
+    response = client.post("/problemsets/compile-latex", json={"latex_code": "\\begin{document}\n{\n"})
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    detail = response.json()["detail"]
+    assert detail["errors"]
+    assert all("line" in error for error in detail["errors"])
+
+def test_booklet_recompiles_only_changed_chapter(client, fake_pdf_pipeline):
+    first = create_problemset(client)
+    second = create_problemset(client, VALID_PROBLEMSET_DATA_2)
+    payload = {"problemset_ids": [first["id"], second["id"]], "title": "Ljetni kamp"}
+
+    response = client.post("/problemsets/booklet", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == FAKE_PDF_BYTES
+    assert len(fake_pdf_pipeline) == 3 # Two chapters plus the merge document
+    merge_document = fake_pdf_pipeline[-1]
+    assert merge_document.count("\\includepdf") == 2
+    assert "\\tableofcontents" in merge_document
+
+    client.put(f"/problemsets/{second['id']}/draft", json={"raw_latex": MINIMAL_DOCUMENT})
+    response = client.post("/problemsets/booklet", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(fake_pdf_pipeline) == 5 # Only the changed chapter and the merge
+
+def test_booklet_unknown_problemset(client, fake_pdf_pipeline):
+    response = client.post("/problemsets/booklet", json={"problemset_ids": [9999]})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.fixture
+def fake_thumbnails(tmp_path, monkeypatch):
+    from PIL import Image
+    from server.dependencies import get_thumbnail_service
+    from server.main import app
+    from server.services.thumbnail_service import ThumbnailService
+
+    rendered = []
+    def fake_rasterize(self, pdf_path, work_dir):
+        rendered.append(pdf_path)
+        image_path = work_dir / "page.png"
+        Image.new("RGB", (self.width, int(self.width * 1.41)), "white").save(image_path)
+        return image_path
+
+    monkeypatch.setattr(ThumbnailService, "_rasterize_first_page", fake_rasterize)
+    service = ThumbnailService(str(tmp_path), width=64)
+    app.dependency_overrides[get_thumbnail_service] = lambda: service
+    yield rendered
+    app.dependency_overrides.pop(get_thumbnail_service, None)
+
+def test_thumbnail_rendered_once_and_revalidated(client, fake_pdf_pipeline, fake_thumbnails):
+    from server.dependencies import get_pdf_prebuild_scheduler
+    from server.main import app
+
+    queued = []
+    prebuild = SimpleNamespace(
+        known_failure=lambda latex_key: None,
+        build_soon=lambda problemset_id, latex_key: queued.append(problemset_id) or True,
+    )
+    app.dependency_overrides[get_pdf_prebuild_scheduler] = lambda: prebuild
+    ps = create_problemset(client)
+
+    # Nothing compiled yet: no compile on the request path, a background build instead
+    missing = client.get(f"/problemsets/{ps['id']}/thumbnail")
+    versions = client.get("/problemsets/thumbnails/versions", params={"ids": [ps["id"]]}).json()
+    assert missing.status_code == status.HTTP_404_NOT_FOUND
+    assert missing.headers["retry-after"] == "10"
+    assert versions == {str(ps["id"]): None}
+    assert queued == [ps["id"], ps["id"]] and fake_pdf_pipeline == []
+
+    client.get(f"/problemsets/{ps['id']}/pdf") # What the background build does
+    version = client.get("/problemsets/thumbnails/versions", params={"ids": [ps["id"]]}).json()[str(ps["id"])]
+    first = client.get(f"/problemsets/{ps['id']}/thumbnail")
+
+    assert first.status_code == status.HTTP_200_OK
+    assert first.headers["etag"] == f'"{version}"'
+    assert first.headers["content-type"] in ("image/webp", "image/png")
+    etag = first.headers["etag"]
+
+    not_modified = client.get(f"/problemsets/{ps['id']}/thumbnail", headers={"If-None-Match": etag})
+    assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+
+    versioned = client.get(f"/problemsets/{ps['id']}/thumbnail", params={"v": etag.strip('"')})
+    assert "immutable" in versioned.headers["cache-control"]
+    assert len(fake_thumbnails) == 1
+
+def test_thumbnail_of_failing_latex_reports_the_error(client, fake_pdf_pipeline, fake_thumbnails):
+    from server.dependencies import get_pdf_prebuild_scheduler
+    from server.main import app
+
+    queued = []
+    prebuild = SimpleNamespace(
+        known_failure=lambda latex_key: "Undefined control sequence. (line 3)",
+        build_soon=lambda problemset_id, latex_key: queued.append(problemset_id) or True,
+    )
+    app.dependency_overrides[get_pdf_prebuild_scheduler] = lambda: prebuild
+    ps = create_problemset(client)
+
+    response = client.get(f"/problemsets/{ps['id']}/thumbnail")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert "Undefined control sequence" in response.json()["detail"]
+    assert "retry-after" not in response.headers
+    assert queued == []
@@ -0,0 +1,105 @@
+# tests/backend/test_prompt_cache.py
+
+import asyncio
+
+import pytest
+
+from server.services.gemini_service import GeminiService
+from server.services.llm_providers import StubProvider
+from server.services.llm_telemetry import LLMCallRecord
+from server.services.prompt_cache import PromptPrefixManager
+
+SYSTEM_PROMPT = "You fix LaTeX. " * 20
+SHOTS = [("Fix $x^2", "Fixed $x^2$"), ("Fix \\frac{1}{2", "Fixed \\frac{1}{2}")]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingStub(StubProvider):
+    '''Keeps what every request actually sent.'''
+    def __init__(self, clock):
+        super().__init__(ttft_seconds=0, tokens_per_second=0)
+        self.clock = clock
+        self.sent = []
+        self.refreshed = 0
+
+    def generate(self, model, contents, config, record=None):
+        self.sent.append((contents, config))
+        return super().generate(model, contents, config, record)
+
+    async def refresh_prompt_cache(self, name, ttl_seconds):
+        self.refreshed += 1
+        await super().refresh_prompt_cache(name, ttl_seconds)
+
+
+def service(min_tokens=10):
+    clock = Clock()
+    provider = RecordingStub(clock)
+    manager = PromptPrefixManager(provider, ttl_seconds=600, refresh_margin_seconds=60, min_tokens=min_tokens, clock=clock)
+    return GeminiService(provider=provider, coalesce=False, prompt_cache=manager), provider, manager, clock
+
+
+async def ask(gemini, text, record=None):
+    chunks = gemini.stream("gemini-2.5-flash", SYSTEM_PROMPT, user_input_text=text, shots=SHOTS, record=record)
+    return "".join([chunk async for chunk in chunks])
+
+
+@pytest.mark.asyncio
+async def test_prefix_is_cached_once_and_requests_send_only_the_user_turn():
+    gemini, provider, manager, _ = service()
+    record = LLMCallRecord(action="fix_latex", model="gemini-2.5-flash")
+
+    answers = [await ask(gemini, "Fix $a"), await ask(gemini, "Fix $b", record)]
+
+    assert answers == ["Fix $a", "Fix $b"]
+    assert manager.creates == 1 and len(provider.caches) == 1
+    assert manager.prefix("gemini-2.5-flash", SYSTEM_PROMPT, SHOTS) is manager.prefix("gemini-2.5-flash", SYSTEM_PROMPT, SHOTS)
+    contents, config = provider.sent[-1]
+    assert len(contents) == 1 and config.system_instruction is None
+    assert config.cached_content == next(iter(provider.caches))
+    assert record.cached_tokens > 0
+
+
+@pytest.mark.asyncio
+async def test_cache_used_near_expiry_is_extended_in_the_background():
+    gemini, provider, manager, clock = service()
+    await ask(gemini, "Fix $a")
+
+    clock.now = 560 # Within the 60 s margin of the 600 s TTL
+    await ask(gemini, "Fix $b")
+    await asyncio.sleep(0)
+
+    assert provider.refreshed == 1 and manager.refreshes == 1
+    clock.now = 1000 # Past the original expiry, not the extended one
+    await ask(gemini, "Fix $c")
+    assert manager.creates == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_cache_falls_back_inline_and_is_recreated():
+    gemini, provider, manager, _ = service()
+    await ask(gemini, "Fix $a")
+    provider.caches.clear() # Gone on the provider side before our expiry
+
+    assert await ask(gemini, "Fix $b") == "Fix $b"
+    contents, config = provider.sent[-1]
+    assert len(contents) == 1 + 2 * len(SHOTS) and config.system_instruction is not None
+
+    await ask(gemini, "Fix $c")
+    assert manager.creates == 2 and provider.sent[-1][1].cached_content is not None
+
+
+@pytest.mark.asyncio
+async def test_small_prefixes_stay_inline():
+    gemini, provider, manager, _ = service(min_tokens=1024)
+
+    await ask(gemini, "Fix $a")
+
+    assert manager.creates == 0 and not provider.caches
+    assert provider.sent[-1][1].cached_content is None
@@ -0,0 +1,125 @@
+# tests/backend/test_stream_guard.py
+
+import asyncio
+
+import pytest
+
+from server.dependencies import get_gemini_service
+from server.main import app
+from server.services.ai_response_cache import AIResponseCache, get_ai_response_cache
+from server.services.gemini_service import GeminiService
+from server.services.llm_providers import StubProvider
+from server.services.stream_guard import StreamGuard, get_stream_guard
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+        self.checks = 0
+
+    async def is_disconnected(self) -> bool:
+        self.checks += 1
+        return self.disconnected
+
+
+class Upstream:
+    '''Slow upstream that records whether it was closed.'''
+    def __init__(self, chunks=10, delay=0.05):
+        self.chunks = chunks
+        self.delay = delay
+        self.sent = 0
+        self.closed = False
+
+    async def stream(self):
+        try:
+            for i in range(self.chunks):
+                await asyncio.sleep(self.delay)
+                self.sent += 1
+                yield f"c{i}"
+        finally:
+            self.closed = True
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+@pytest.mark.asyncio
+async def test_complete_stream_passes_through():
+    guard = StreamGuard(deadline_seconds=5, poll_interval_seconds=0.01)
+    upstream = Upstream(chunks=3, delay=0.02)
+
+    assert await collect(guard.guard(FakeRequest(), upstream.stream(), "test")) == ["c0", "c1", "c2"]
+    assert guard.stats() == {"active": 0, "completed": 1, "disconnected": 0, "deadline": 0, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_disconnect_closes_upstream_while_waiting_for_a_chunk():
+    guard = StreamGuard(deadline_seconds=5, poll_interval_seconds=0.01)
+    upstream = Upstream(chunks=10, delay=0.2)
+    request = FakeRequest()
+    received = []
+
+    async for chunk in guard.guard(request, upstream.stream(), "test"):
+        received.append(chunk)
+        request.disconnected = True # The next chunk is 0.2s away, the poll notices first
+
+    assert received == ["c0"]
+    assert upstream.closed and upstream.sent == 1
+    assert guard.counts["disconnected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_deadline_ends_stream_with_deadline_chunk():
+    guard = StreamGuard(deadline_seconds=0.15, poll_interval_seconds=0.05)
+    upstream = Upstream(chunks=10, delay=0.1)
+
+    chunks = await collect(guard.guard(FakeRequest(), upstream.stream(), "test", deadline_chunk="late\n"))
+
+    assert chunks == ["c0", "late\n"]
+    assert upstream.closed
+    assert guard.counts["deadline"] == 1
+
+
+@pytest.mark.asyncio
+async def test_consumer_leaving_counts_as_disconnect():
+    guard = StreamGuard(deadline_seconds=5, poll_interval_seconds=1)
+    upstream = Upstream(chunks=10, delay=0.01)
+
+    stream = guard.guard(FakeRequest(), upstream.stream(), "test")
+    assert await stream.__anext__() == "c0"
+    await stream.aclose() # What Starlette does when a send to the client fails
+
+    assert upstream.closed
+    assert guard.stats()["disconnected"] == 1 and guard.active == 0
+
+
+@pytest.mark.asyncio
+async def test_disconnect_of_one_subscriber_keeps_coalesced_stream_alive():
+    provider = StubProvider(ttft_seconds=0.05, tokens_per_second=200, tokens_per_chunk=1)
+    service = GeminiService(provider=provider)
+    guard = StreamGuard(deadline_seconds=5, poll_interval_seconds=0.01)
+    request = dict(model="m", system_prompt="s", user_input_text="abcdefghijklmnopqrstuvwx")
+    leaving, staying = FakeRequest(), FakeRequest()
+
+    async def leave_early():
+        async for _ in guard.guard(leaving, service.stream(**request), "test"):
+            leaving.disconnected = True
+
+    _, text = await asyncio.gather(leave_early(), collect(guard.guard(staying, service.stream(**request), "test")))
+
+    assert "".join(text) == "abcdefghijklmnopqrstuvwx"
+    assert provider.calls == 1
+    assert guard.counts["disconnected"] == 1 and guard.counts["completed"] == 1
+
+
+def test_llm_usage_reports_stream_outcomes(client):
+    guard = StreamGuard(deadline_seconds=5, poll_interval_seconds=0.01)
+    app.dependency_overrides[get_gemini_service] = lambda: GeminiService(provider=StubProvider(ttft_seconds=0, tokens_per_second=0))
+    app.dependency_overrides[get_ai_response_cache] = lambda: AIResponseCache(max_entries=0)
+    app.dependency_overrides[get_stream_guard] = lambda: guard
+
+    assert client.post("/llm/fix-latex", json={"code": "$x$"}).text == "$x$"
+    streams = client.get("/llm/usage").json()["streams"]
+
+    assert streams["completed"] == 1 and streams["active"] == 0
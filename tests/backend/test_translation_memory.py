@@ -0,0 +1,128 @@
+# tests/backend/test_translation_memory.py
+
+import pytest
+
+from server.dependencies import get_gemini_service
+from server.main import app
+from server.models.problem import Problem
+from server.models.translation_memory import TranslationMemoryEntry
+from server.services.ai_response_cache import AIResponseCache, get_ai_response_cache
+from server.services.gemini_service import GeminiService
+from server.services.llm_providers import StubProvider
+from server.services.translation_service import BatchTranslator, segment_latex
+
+PROBLEMS = [
+    "Let $n$ be a positive integer. Prove that $n^2 + n$ is even.",
+    "Let $p$ be a positive integer. Find all $x$ such that $x^p = 1$.",
+]
+
+
+class FakeAI:
+    '''Segment translation tags the sentence; whole-problem translation is the fallback.'''
+    def __init__(self, drop_markers=False, drop_braces=False):
+        self.segments = []
+        self.wholes = []
+        self.drop_markers = drop_markers
+        self.drop_braces = drop_braces
+
+    async def translate_segment(self, user_input):
+        self.segments.append(user_input)
+        output = "BS " + (user_input.replace("⟦0⟧", "") if self.drop_markers else user_input)
+        if self.drop_braces:
+            output = output.replace("}", "")
+        async def stream():
+            yield output
+        return stream()
+
+    async def translate(self, user_input):
+        self.wholes.append(user_input)
+        async def stream():
+            yield "BS " + user_input
+        return stream()
+
+
+def test_segments_mask_formulas_and_render_back():
+    text = "\\begin{enumerate}\n\\item Let $n$ be odd. Prove that $$n^2 \\equiv 1 \\pmod 8.$$\n\\end{enumerate}"
+
+    segments = segment_latex(text)
+
+    assert "".join(segment.render(segment.source) for segment in segments) == text
+    assert [s.source for s in segments if s.translatable] == ["Let ⟦0⟧ be odd.", "Prove that ⟦0⟧"]
+    # Same sentence, different formula: same key
+    assert segment_latex("Let $m$ be odd.")[0].key == segments[2].key
+
+
+def test_sentences_are_not_split_inside_groups():
+    text = "Find $x$ (e.g. $x=1.5$) such that $x > 1$. \\emph{Note. This is hard.}"
+
+    segments = segment_latex(text)
+
+    assert "".join(segment.render(segment.source) for segment in segments) == text
+    assert [s.source for s in segments if s.translatable] == [
+        "Find ⟦0⟧ (e.g. ⟦1⟧) such that ⟦2⟧.",
+        "\\emph{Note. This is hard.}",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_recurring_sentences_are_translated_once_and_reused(test_db):
+    ai = FakeAI()
+    translator = BatchTranslator(max_concurrency=2)
+
+    first = await translator.translate(ai, test_db, PROBLEMS)
+    second = await translator.translate(ai, test_db, ["LET $k$ be a positive integer! Prove that $k^3 - k$ is even."])
+
+    # "Let ⟦0⟧ be a positive integer." is shared by both problems, so three sentences reach the model
+    assert len(ai.segments) == 3
+    assert first[0].translated_text == "BS Let $n$ be a positive integer. BS Prove that $n^2 + n$ is even."
+    assert (first[1].reused, first[1].translated) == (1, 1)
+    # Near-exact match (case and punctuation differ); the new final punctuation is kept
+    assert second[0].translated_text == "BS Let $k$ be a positive integer! BS Prove that $k^3 - k$ is even."
+    assert second[0].reused == 2 and len(ai.segments) == 3
+    assert test_db.query(TranslationMemoryEntry).count() == 3
+
+
+@pytest.mark.asyncio
+async def test_lost_formula_markers_fall_back_to_whole_problem(test_db):
+    ai = FakeAI(drop_markers=True)
+
+    [result] = await BatchTranslator().translate(ai, test_db, [PROBLEMS[0]])
+
+    assert result.status == "fallback"
+    assert result.translated_text == "BS " + PROBLEMS[0]
+    assert test_db.query(TranslationMemoryEntry).count() == 0
+
+
+def test_batch_endpoint_stores_versions_and_reuses_memory(client, test_db):
+    problems = [Problem(latex_text=text, category="N") for text in PROBLEMS]
+    test_db.add_all(problems)
+    test_db.commit()
+    ids = [problem.id for problem in problems]
+    provider = StubProvider(ttft_seconds=0, tokens_per_second=0) # Echoes, so markers survive
+    app.dependency_overrides[get_gemini_service] = lambda: GeminiService(provider=provider)
+    app.dependency_overrides[get_ai_response_cache] = lambda: AIResponseCache(max_entries=0)
+
+    first = client.post("/translate/batch", json={"problem_ids": ids, "texts": ["Prove that $1 < 2$."]})
+    second = client.post("/translate/batch", json={"problem_ids": ids, "save": False})
+
+    assert first.status_code == 200
+    # Four different sentences; "Let ⟦0⟧ be a positive integer." appears twice
+    assert first.json()["translated"] == 4 and first.json()["reused"] == 1
+    assert second.json()["translated"] == 0 and second.json()["reused"] == 4
+    assert provider.calls == 4
+    test_db.expire_all()
+    assert test_db.get(Problem, ids[0]).latex_versions == [PROBLEMS[0]]
+    assert client.post("/translate/batch", json={"problem_ids": [9999]}).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_lost_braces_fall_back_to_whole_problem(test_db):
+    ai = FakeAI(drop_braces=True)
+    text = "Let $n$ be \\textbf{odd}. Prove that $n^2$ is odd."
+
+    [result] = await BatchTranslator().translate(ai, test_db, [text])
+
+    assert result.status == "fallback"
+    assert result.translated_text == "BS " + text
+    # Only the sentence without braces is remembered
+    assert [entry.source_text for entry in test_db.query(TranslationMemoryEntry)] == ["Prove that ⟦0⟧ is odd."]